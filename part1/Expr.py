@@ -2,6 +2,8 @@ from abc import ABC
 from typing import Any, Callable, Optional
 from util import Token
 
+# what the inline caches hold before their first use, since None is a value
+EMPTY: Any = object()
 class Expr(ABC):
     def accept(self, visitor):
         return visitor(self)
@@ -37,6 +39,13 @@ class Unary(Expr):
 class Variable(Expr):
     def __init__(self, name: Token):
         self.name = name
+        # set by resolver.Resolver; a depth of None means a global
+        self.depth: Optional[int] = None
+        self.slot: Optional[int] = None
+        # set by interpreter.Interpreter: a global's value, good while the
+        # globals are at this version
+        self.cache_version = -1
+        self.cache_value: Any = None
     
     def accept(self, visitor):
         return visitor.visit_variable(self)
@@ -45,6 +54,9 @@ class Assign(Expr):
     def __init__(self, name: Token, value: Expr):
         self.name = name
         self.value = value
+        # set by resolver.Resolver; a depth of None means a global
+        self.depth: Optional[int] = None
+        self.slot: Optional[int] = None
     
     def accept(self, visitor):
         return visitor.visit_assign(self)
@@ -62,6 +74,10 @@ class Call(Expr):
         self.callee = callee
         self.paren = paren
         self.arguments = arguments
+        # set by interpreter.Interpreter: the callee last called from here,
+        # known to be callable, and its arity
+        self.callee_cache: Any = EMPTY
+        self.arity_cache = 0
     
     def accept(self, visitor):
         return visitor.visit_call(self)
@@ -24,12 +24,17 @@ class Var(Stmt):
 	def __init__(self,  name: Token, initializer: Expr | None): 
 		self. name: Token=  name
 		self. initializer =  initializer
+		# set by resolver.Resolver
+		self.slot: int | None = None
 	def accept(self, visitor):
 		return visitor.visit_var(self)
 
 class Block(Stmt):
 	def __init__(self, statements: List[Stmt] ): 
 		self.statements = statements
+		# set by resolver.Resolver
+		self.slot_count = 0
+		self.captured = False
 	def accept(self, visitor):
 		return visitor.visit_block(self)
 
@@ -46,6 +51,9 @@ class While(Stmt):
 	def __init__(self, condition: Expr | None, loop_body: Stmt):
 		self.condition = condition
 		self.loop_body = loop_body
+		# set by resolver.Resolver
+		self.slot_count = 0
+		self.captured = False
 
 	def accept(self, visitor):
 		return visitor.visit_while(self)
@@ -56,6 +64,9 @@ class For(Stmt):
 		self.condition = condition
 		self.update = update
 		self.body = loop_body
+		# set by resolver.Resolver
+		self.slot_count = 0
+		self.captured = False
 
 	def accept(self, visitor):
 		return visitor.visit_for(self)
@@ -63,6 +74,9 @@ class For(Stmt):
 class Break(Stmt):
 	def __init__(self, token: Token):
 		self.token = token
+		# set by resolver.Resolver
+		self.inside_loop = False
+		self.escapes = False
 
 	def accept(self, visitor):
 		return visitor.visit_break(self)
@@ -71,6 +85,10 @@ class Return(Stmt):
 	def __init__(self, token: Token, return_expr: Expr):
 		self.token = token
 		self.return_expr = return_expr
+		# set by resolver.Resolver
+		self.inside_function = False
+		# a call whose result is returned as is, from outside any loop
+		self.tail_call = False
 	def accept(self, visitor):
 		return visitor.visit_return(self)
 
@@ -79,6 +97,12 @@ class FunctionStatement(Expr):
 		self.name = name
 		self.parameters = parameters
 		self.body = body
+		# set by resolver.Resolver
+		self.slot: int | None = None
+		self.slot_count = len(parameters)
+		self.captured = False
+		# set by purity.Purity
+		self.pure = False
 
 	def accept(self, visitor):
 		return visitor.visit_function_statement(self)
@@ -0,0 +1,208 @@
+"""
+Static analysis shared by the backends that compile a resolved program for a
+different execution model (transpiler, bytecode_compiler). Finds the
+declaration behind every local reference, which locals are captured by
+closures, which locals each scope declares, and which breaks have to unwind
+through a function call to reach their loop.
+"""
+
+from typing import Dict, Iterable, List, Optional, Set
+from Expr import Assign, Binary, Call, Expr, Grouping, Literal, Logical, Unary, Variable
+from Stmt import Block, Break, Expression, For, FunctionStatement, If, Print, Return, Stmt, Var, While
+from util import Token
+
+
+class Decl:
+    """A local variable declaration."""
+    __slots__ = ("name", "py_name", "function", "in_loop", "captured")
+
+    def __init__(self, name: Token, py_name: str, function: Optional[FunctionStatement], in_loop: bool):
+        self.name = name
+        self.py_name = py_name
+        # the function whose frame holds the variable; None for main()
+        self.function = function
+        self.in_loop = in_loop
+        self.captured = False
+
+    @property
+    def boxed(self) -> bool:
+        # for the transpiler: each run of the scope needs a new variable, but
+        # a Python local is shared by every closure its frame creates
+        return self.captured and self.in_loop
+
+
+class Frame:
+    __slots__ = ("function", "loop_depth", "free", "assigned", "globals")
+
+    def __init__(self, function: Optional[FunctionStatement]):
+        self.function = function
+        self.loop_depth = 0
+        # outer locals used here or in nested functions, in first use order
+        self.free: Dict[Decl, None] = {}
+        # outer locals assigned directly in this function
+        self.assigned: Dict[Decl, None] = {}
+        # globals declared or assigned directly in this function
+        self.globals: Dict[str, None] = {}
+
+
+class Analyzer:
+    """
+    Mirrors the resolver's scopes to find the declaration behind every local
+    reference, which locals are captured by closures, and what each function
+    reads and writes outside of its own frame.
+    """
+    def __init__(self):
+        self.scopes: List[List[Decl]] = []
+        # the Block/While/For/FunctionStatement that opened each scope
+        self.scope_nodes: List[Stmt] = []
+        self.frames = [Frame(None)]
+        self.count = 0
+        # > 0 while visiting code that may not run every time its scope does
+        self.conditional = 0
+        # keyed by id() of the declaring Token, referencing Expr and FunctionStatement
+        self.decls: Dict[int, Decl] = {}
+        self.references: Dict[int, Decl] = {}
+        self.function_frames: Dict[int, Frame] = {}
+        # the locals each scope declares, in order, by id() of the node opening it
+        self.scope_decls: Dict[int, List[Decl]] = {}
+        # locals that may be read before their declaration runs, by id() of
+        # the node opening their scope; they start out as nil
+        self.resets: Dict[int, List[Decl]] = {}
+        # Break nodes that must unwind through a function call
+        self.nonlocal_breaks: Set[int] = set()
+
+    def analyze(self, statements: Iterable[Stmt]):
+        for statement in statements:
+            self.visit(statement)
+
+    def visit(self, node: Optional[Expr | Stmt]):
+        if node is not None:
+            node.accept(self)
+
+    def declare(self, name: Token):
+        frame = self.frames[-1]
+        if not self.scopes:
+            frame.globals[name.lexeme + "_g"] = None
+            return
+        self.count += 1
+        decl = Decl(name, f"{name.lexeme}_{self.count}", frame.function, frame.loop_depth > 0)
+        self.decls[id(name)] = decl
+        self.scopes[-1].append(decl)
+        if self.conditional:
+            self.resets.setdefault(id(self.scope_nodes[-1]), []).append(decl)
+
+    def reference(self, expr: Variable | Assign, assigns: bool):
+        frame = self.frames[-1]
+        if expr.depth is None:
+            if assigns:
+                frame.globals[expr.name.lexeme + "_g"] = None
+            return
+        decl = self.scopes[-1 - expr.depth][expr.slot]
+        self.references[id(expr)] = decl
+        if decl.function is frame.function:
+            return
+        decl.captured = True
+        if assigns:
+            frame.assigned[decl] = None
+        for outer in reversed(self.frames):
+            if outer.function is decl.function:
+                break
+            outer.free[decl] = None
+
+    def scoped(self, node: Stmt, *children: Optional[Expr | Stmt], parameters: Iterable[Token] = ()):
+        self.scopes.append(self.scope_decls.setdefault(id(node), []))
+        self.scope_nodes.append(node)
+        conditional, self.conditional = self.conditional, 0
+        for parameter in parameters:
+            self.declare(parameter)
+        for child in children:
+            self.visit(child)
+        self.conditional = conditional
+        self.scope_nodes.pop()
+        self.scopes.pop()
+
+    def visit_block(self, stmt: Block):
+        self.scoped(stmt, *stmt.statements)
+
+    def visit_var(self, stmt: Var):
+        self.visit(stmt.initializer)
+        self.declare(stmt.name)
+
+    def visit_function_statement(self, stmt: FunctionStatement):
+        # a function in expression position, which may be short-circuited
+        self.conditional += 1
+        self.function(stmt)
+        self.conditional -= 1
+
+    def function(self, stmt: FunctionStatement):
+        if stmt.name is not None:
+            self.declare(stmt.name)
+        frame = Frame(stmt)
+        self.function_frames[id(stmt)] = frame
+        self.frames.append(frame)
+        self.scoped(stmt, stmt.body, parameters=stmt.parameters)
+        self.frames.pop()
+
+    def visit_expression(self, stmt: Expression):
+        if isinstance(stmt.expression, FunctionStatement):
+            self.function(stmt.expression)
+        else:
+            self.visit(stmt.expression)
+
+    def visit_print(self, stmt: Print):
+        self.visit(stmt.expression)
+
+    def visit_if(self, stmt: If):
+        self.visit(stmt.condition)
+        self.conditional += 1
+        self.visit(stmt.then_branch)
+        self.visit(stmt.else_branch)
+        self.conditional -= 1
+
+    def visit_while(self, stmt: While):
+        self.visit(stmt.condition)
+        self.frames[-1].loop_depth += 1
+        self.scoped(stmt, stmt.loop_body)
+        self.frames[-1].loop_depth -= 1
+
+    def visit_for(self, stmt: For):
+        # the for scope is entered again on every run of an enclosing loop
+        self.frames[-1].loop_depth += 1
+        self.scoped(stmt, stmt.initialization, stmt.condition, stmt.update, stmt.body)
+        self.frames[-1].loop_depth -= 1
+
+    def visit_break(self, stmt: Break):
+        if self.frames[-1].loop_depth == 0 and any(frame.loop_depth for frame in self.frames):
+            self.nonlocal_breaks.add(id(stmt))
+
+    def visit_return(self, stmt: Return):
+        self.visit(stmt.return_expr)
+
+    def visit_variable(self, expr: Variable):
+        self.reference(expr, False)
+
+    def visit_assign(self, expr: Assign):
+        self.visit(expr.value)
+        self.reference(expr, True)
+
+    def visit_binary(self, expr: Binary):
+        self.visit(expr.left)
+        self.visit(expr.right)
+
+    def visit_logical(self, expr: Logical):
+        self.visit(expr.left)
+        self.visit(expr.right)
+
+    def visit_grouping(self, expr: Grouping):
+        self.visit(expr.expression)
+
+    def visit_literal(self, expr: Literal):
+        pass
+
+    def visit_unary(self, expr: Unary):
+        self.visit(expr.right)
+
+    def visit_call(self, expr: Call):
+        self.visit(expr.callee)
+        for argument in expr.arguments:
+            self.visit(argument)
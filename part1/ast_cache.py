@@ -0,0 +1,392 @@
+"""
+On-disk cache of parsed programs, the Lox equivalent of a .pyc file.
+
+A cache entry is named after its script, as a .pyc file is in __pycache__,
+so that editing the script replaces the entry rather than adding one. It
+starts with a hash of the interpreter version and the source text, checked
+when it is loaded, and holds the parsed Stmt list in a compact binary form: a
+string table, the number literals and the tokens in the order the nodes use
+them, and one flat array of ints describing the nodes in prefix order. All
+tables are `array` columns of the narrowest type that fits, compressed with
+zlib behind an uncompressed header.
+"""
+
+import hashlib
+import os
+import struct
+import sys
+import zlib
+from array import array
+from pathlib import Path
+from typing import Any, List, Optional
+from Expr import Assign, Binary, Call, Expr, Grouping, Literal, Logical, Unary, Variable
+from Stmt import Block, Break, Expression, For, FunctionStatement, If, Print, Return, Stmt, Var, While
+from token_buffer import TOKEN_TYPES
+from util import INTERPRETER_VERSION, Token, TokenType
+
+MAGIC = b"LOXA"
+FORMAT_VERSION = 1
+SUFFIX = ".loxast"
+HEADER = struct.Struct("<4sH32s5I4s")
+
+# node codes; 0 encodes a missing optional node
+BINARY, GROUPING, LITERAL, UNARY, VARIABLE, ASSIGN, LOGICAL, CALL = range(1, 9)
+EXPRESSION, PRINT, VAR, BLOCK, IF, WHILE, FOR, BREAK, RETURN, FUNCTION = range(9, 19)
+# literal value tags
+NIL, TRUE, FALSE, NUMBER, STRING = range(5)
+
+
+class CacheError(Exception):
+    pass
+
+
+def source_digest(source: str) -> bytes:
+    key = f"{INTERPRETER_VERSION}:{FORMAT_VERSION}:{sys.byteorder}:".encode()
+    return hashlib.sha256(key + source.encode("utf-8")).digest()
+
+
+def cache_path(cache: Path) -> Path:
+    """The entry file for `cache`, a script's name in a cache directory."""
+    return cache.with_name(cache.name + SUFFIX)
+
+
+class AstEncoder:
+    def __init__(self):
+        self.strings: List[str] = []
+        self.string_index: dict[str, int] = {}
+        self.floats = array("d")
+        self.token_types = array("B")
+        self.token_lexemes = array("I")
+        self.token_lines = array("I")
+        self.ints = array("I")
+
+    def encode(self, statements: List[Stmt], digest: bytes) -> bytes:
+        self.write_list(statements)
+        lengths = narrow(array("I", (len(s) for s in self.strings)))
+        blob = "".join(self.strings).encode("utf-8")
+        lexemes, lines, ints = narrow(self.token_lexemes), narrow(self.token_lines), narrow(self.ints)
+        typecodes = lengths.typecode + lexemes.typecode + lines.typecode + ints.typecode
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, digest, len(self.strings), len(blob),
+                             len(self.floats), len(self.token_types), len(ints), typecodes.encode())
+        payload = b"".join((lengths.tobytes(), blob, self.floats.tobytes(), self.token_types.tobytes(),
+                            lexemes.tobytes(), lines.tobytes(), ints.tobytes()))
+        return header + zlib.compress(payload, 1)
+
+    def string(self, s: str) -> int:
+        index = self.string_index.get(s)
+        if index is None:
+            index = self.string_index[s] = len(self.strings)
+            self.strings.append(s)
+        return index
+
+    def token(self, token: Token):
+        self.token_types.append(token.type.value)
+        self.token_lexemes.append(self.string(token.lexeme))
+        self.token_lines.append(token.line)
+
+    def write(self, node: Optional[Expr | Stmt]):
+        if node is None:
+            self.ints.append(0)
+        else:
+            node.accept(self)
+
+    def write_list(self, nodes: List[Any]):
+        self.ints.append(len(nodes))
+        for node in nodes:
+            self.write(node)
+
+    def visit_binary(self, expr: Binary):
+        self.ints.append(BINARY)
+        self.write(expr.left)
+        self.token(expr.operator)
+        self.write(expr.right)
+
+    def visit_grouping(self, expr: Grouping):
+        self.ints.append(GROUPING)
+        self.write(expr.expression)
+
+    def visit_literal(self, expr: Literal):
+        value = expr.value
+        if value is None:
+            self.ints.extend((LITERAL, NIL))
+        elif value is True:
+            self.ints.extend((LITERAL, TRUE))
+        elif value is False:
+            self.ints.extend((LITERAL, FALSE))
+        elif isinstance(value, float):
+            self.ints.extend((LITERAL, NUMBER))
+            self.floats.append(value)
+        elif isinstance(value, str):
+            self.ints.extend((LITERAL, STRING, self.string(value)))
+        else:
+            raise CacheError(f"Cannot cache literal {value!r}")
+
+    def visit_unary(self, expr: Unary):
+        self.ints.append(UNARY)
+        self.token(expr.operator)
+        self.write(expr.right)
+
+    def visit_variable(self, expr: Variable):
+        self.ints.append(VARIABLE)
+        self.token(expr.name)
+
+    def visit_assign(self, expr: Assign):
+        self.ints.append(ASSIGN)
+        self.token(expr.name)
+        self.write(expr.value)
+
+    def visit_logical(self, expr: Logical):
+        self.ints.append(LOGICAL)
+        self.write(expr.left)
+        self.token(expr.operator)
+        self.write(expr.right)
+
+    def visit_call(self, expr: Call):
+        self.ints.append(CALL)
+        self.write(expr.callee)
+        self.token(expr.paren)
+        self.write_list(expr.arguments)
+
+    def visit_expression(self, stmt: Expression):
+        self.ints.append(EXPRESSION)
+        self.write(stmt.expression)
+
+    def visit_print(self, stmt: Print):
+        self.ints.append(PRINT)
+        self.write(stmt.expression)
+
+    def visit_var(self, stmt: Var):
+        self.ints.append(VAR)
+        self.token(stmt.name)
+        self.write(stmt.initializer)
+
+    def visit_block(self, stmt: Block):
+        self.ints.append(BLOCK)
+        self.write_list(stmt.statements)
+
+    def visit_if(self, stmt: If):
+        self.ints.append(IF)
+        self.write(stmt.condition)
+        self.write(stmt.then_branch)
+        self.write(stmt.else_branch)
+
+    def visit_while(self, stmt: While):
+        self.ints.append(WHILE)
+        self.write(stmt.condition)
+        self.write(stmt.loop_body)
+
+    def visit_for(self, stmt: For):
+        self.ints.append(FOR)
+        self.write(stmt.initialization)
+        self.write(stmt.condition)
+        self.write(stmt.update)
+        self.write(stmt.body)
+
+    def visit_break(self, stmt: Break):
+        self.ints.append(BREAK)
+        self.token(stmt.token)
+
+    def visit_return(self, stmt: Return):
+        self.ints.append(RETURN)
+        self.token(stmt.token)
+        self.write(stmt.return_expr)
+
+    def visit_function_statement(self, stmt: FunctionStatement):
+        self.ints.append(FUNCTION)
+        if stmt.name is None:
+            self.ints.append(0)
+        else:
+            self.ints.append(1)
+            self.token(stmt.name)
+        self.ints.append(len(stmt.parameters))
+        for parameter in stmt.parameters:
+            self.token(parameter)
+        self.write(stmt.body)
+
+
+class AstDecoder:
+    def __init__(self, data: bytes, digest: bytes):
+        if len(data) < HEADER.size:
+            raise CacheError("Truncated cache entry")
+        (magic, version, stored_digest, n_strings, blob_size,
+         n_floats, n_tokens, n_ints, typecodes) = HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION or stored_digest != digest:
+            raise CacheError("Stale cache entry")
+
+        payload = memoryview(zlib.decompress(data[HEADER.size:]))
+        self.offset = 0
+        lengths = self.column(payload, chr(typecodes[0]), n_strings)
+        text = bytes(payload[self.offset : self.offset + blob_size]).decode("utf-8")
+        self.offset += blob_size
+        floats = self.column(payload, "d", n_floats)
+        token_types = self.column(payload, "B", n_tokens)
+        token_lexemes = self.column(payload, chr(typecodes[1]), n_tokens)
+        token_lines = self.column(payload, chr(typecodes[2]), n_tokens)
+        ints = self.column(payload, chr(typecodes[3]), n_ints)
+        if self.offset != len(payload):
+            raise CacheError("Corrupt cache entry")
+
+        self.strings = strings = []
+        position = 0
+        for length in lengths:
+            strings.append(text[position : position + length])
+            position += length
+
+        tokens = []
+        for code, lexeme_index, line in zip(token_types, token_lexemes, token_lines):
+            ttype = TOKEN_TYPES[code]
+            lexeme = strings[lexeme_index]
+            if ttype is TokenType.NUMBER:
+                literal = float(lexeme)
+            elif ttype is TokenType.STRING:
+                literal = lexeme[1:-1]
+            else:
+                literal = None
+            tokens.append(Token(ttype, lexeme, literal, line))
+
+        self.next = iter(ints.tolist()).__next__
+        self.token = iter(tokens).__next__
+        self.number = iter(floats.tolist()).__next__
+        self.decoders = [
+            lambda: None,
+            self.binary, self.grouping, self.literal, self.unary, self.variable,
+            self.assign, self.logical, self.call, self.expression, self.print,
+            self.var, self.block, self.if_, self.while_, self.for_, self.break_,
+            self.return_, self.function,
+        ]
+
+    def column(self, payload: memoryview, typecode: str, count: int) -> array:
+        values = array(typecode)
+        size = values.itemsize * count
+        values.frombytes(payload[self.offset : self.offset + size])
+        if len(values) != count:
+            raise CacheError("Truncated cache entry")
+        self.offset += size
+        return values
+
+    def decode(self) -> List[Stmt]:
+        return self.node_list()
+
+    def node(self) -> Any:
+        return self.decoders[self.next()]()
+
+    def node_list(self) -> List[Any]:
+        return [self.node() for _ in range(self.next())]
+
+    def binary(self):
+        left = self.node()
+        operator = self.token()
+        return Binary(left, operator, self.node())
+
+    def grouping(self):
+        return Grouping(self.node())
+
+    def literal(self):
+        tag = self.next()
+        if tag == NUMBER:
+            return Literal(self.number())
+        if tag == STRING:
+            return Literal(self.strings[self.next()])
+        return Literal(None if tag == NIL else tag == TRUE)
+
+    def unary(self):
+        operator = self.token()
+        return Unary(operator, self.node())
+
+    def variable(self):
+        return Variable(self.token())
+
+    def assign(self):
+        name = self.token()
+        return Assign(name, self.node())
+
+    def logical(self):
+        left = self.node()
+        operator = self.token()
+        return Logical(left, operator, self.node())
+
+    def call(self):
+        callee = self.node()
+        paren = self.token()
+        return Call(callee, paren, self.node_list())
+
+    def expression(self):
+        return Expression(self.node())
+
+    def print(self):
+        return Print(self.node())
+
+    def var(self):
+        name = self.token()
+        return Var(name, self.node())
+
+    def block(self):
+        return Block(self.node_list())
+
+    def if_(self):
+        condition = self.node()
+        then_branch = self.node()
+        return If(condition, then_branch, self.node())
+
+    def while_(self):
+        condition = self.node()
+        return While(condition, self.node())
+
+    def for_(self):
+        initialization = self.node()
+        condition = self.node()
+        update = self.node()
+        return For(initialization, condition, update, self.node())
+
+    def break_(self):
+        return Break(self.token())
+
+    def return_(self):
+        token = self.token()
+        return Return(token, self.node())
+
+    def function(self):
+        name = self.token() if self.next() else None
+        parameters = [self.token() for _ in range(self.next())]
+        return FunctionStatement(name, parameters, self.node())
+
+
+def narrow(values: array) -> array:
+    """Store unsigned ints in the smallest array type that holds them all."""
+    largest = max(values, default=0)
+    for typecode in "BHI":
+        if largest < 1 << (8 * array(typecode).itemsize):
+            return values if typecode == values.typecode else array(typecode, values)
+    return values
+
+
+def dumps(statements: List[Stmt], source: str) -> bytes:
+    return AstEncoder().encode(statements, source_digest(source))
+
+
+def loads(data: bytes, source: str) -> List[Stmt]:
+    return AstDecoder(data, source_digest(source)).decode()
+
+
+def load(cache: Path, source: str) -> Optional[List[Stmt]]:
+    """Return the cached statements for `source`, or None if there is no valid entry."""
+    try:
+        data = cache_path(cache).read_bytes()
+    except OSError:
+        return None
+    try:
+        return loads(data, source)
+    except (CacheError, IndexError, StopIteration, UnicodeDecodeError, ValueError, TypeError, zlib.error):
+        return None
+
+
+def store(cache: Path, source: str, statements: List[Stmt]):
+    path = cache_path(cache)
+    try:
+        data = dumps(statements, source)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_bytes(data)
+        os.replace(temporary, path)
+    except (CacheError, OSError):
+        pass
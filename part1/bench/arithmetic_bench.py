@@ -0,0 +1,80 @@
+"""
+Measure binary and unary operators on the tree backend, which rewrites
+them into variants for the operand types they see: number arithmetic and
+comparisons, string concatenation, and an expression that alternates
+between numbers and strings and so ends up generic. Each loop runs inside a
+function so that its variables are locals.
+
+Run from part1/:  python -m bench.arithmetic_bench [--loops N] [--repeat N]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+from lox import Lox
+
+PROGRAMS = {
+    "numbers": """
+fun run() {{
+    var x = 0;
+    for (var i = 0; i < {loops}; i = i + 1) {{
+        x = (x + i * 2 - 1) / 3;
+        if (-x > i or !(x <= i)) x = 0;
+    }}
+    return x;
+}}
+print run();
+""",
+    "strings": """
+fun run() {{
+    var s = "";
+    for (var i = 0; i < {loops}; i = i + 1) {{
+        s = "ab" + "cd";
+        s = s + s;
+        if (s == "abcd") s = "";
+    }}
+    return s;
+}}
+print run();
+""",
+    "mixed": """
+fun run() {{
+    var a = 1;
+    var b = 2;
+    for (var i = 0; i < {loops}; i = i + 1) {{
+        var c = a + b;
+        if (a == 1) {{ a = "1"; b = "2"; }} else {{ a = 1; b = 2; }}
+    }}
+    return a;
+}}
+print run();
+""",
+}
+
+
+def loops_per_second(source: str, loops: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            Lox.run(source)
+            best = min(best, time.perf_counter() - start)
+    return loops / best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--loops", type=int, default=50_000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    options = arg_parser.parse_args()
+
+    Lox.backend = "tree"
+    for name, program in PROGRAMS.items():
+        rate = loops_per_second(program.format(loops=options.loops), options.loops, options.repeat)
+        print(f"{name:10} {rate:12,.0f} loops/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Cold vs warm startup with the parsed-AST cache (lox.py --ast-cache).
+
+Run from part1/:  python -m bench.ast_cache_bench [--kilobytes N] [--repeat N]
+"""
+
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import ast_cache
+from lox import Lox
+from bench.scanner_bench import generate_source
+
+LOX = Path(__file__).resolve().parent.parent / "lox.py"
+
+
+def run_script(script: Path) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, str(LOX), "--ast-cache", str(script)],
+                   stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--kilobytes", type=int, default=256)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    options = arg_parser.parse_args()
+
+    source = generate_source(options.kilobytes)
+    with tempfile.TemporaryDirectory() as directory:
+        script = Path(directory) / "generated.lox"
+        script.write_text(source)
+        cache_dir = script.parent / "__loxcache__"
+        cache = cache_dir / script.stem
+
+        start = time.perf_counter()
+        statements = list(Lox.parse(source))
+        parse_seconds = time.perf_counter() - start
+        ast_cache.store(cache, source, statements)
+        start = time.perf_counter()
+        ast_cache.load(cache, source)
+        load_seconds = time.perf_counter() - start
+        size = ast_cache.cache_path(cache).stat().st_size
+        print(f"source {len(source):,} bytes, cache entry {size:,} bytes")
+        print(f"front end: parse {parse_seconds * 1000:.1f} ms, cache load {load_seconds * 1000:.1f} ms")
+
+        cold = []
+        for _ in range(options.repeat):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            cold.append(run_script(script))
+        warm = [run_script(script) for _ in range(options.repeat)]
+        print(f"cold startup: {min(cold) * 1000:.1f} ms (best of {options.repeat})")
+        print(f"warm startup: {min(warm) * 1000:.1f} ms (best of {options.repeat})")
+
+
+if __name__ == "__main__":
+    main()
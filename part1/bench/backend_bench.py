@@ -0,0 +1,64 @@
+"""
+Time the execution backends in lox.BACKENDS on a recursive fib and on nested
+loops. Each run parses, resolves and executes the program in-process with
+the output discarded.
+
+Run from part1/:  python -m bench.backend_bench [--repeat N] [--backend NAME ...]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+from lox import BACKENDS, Lox
+
+PROGRAMS = {
+    "fib": """
+fun fib(n) {
+    if (n < 2) return n;
+    return fib(n - 1) + fib(n - 2);
+}
+print fib(22);
+""",
+    "loops": """
+var total = 0;
+for (var i = 0; i < 300; i = i + 1) {
+    for (var j = 0; j < 300; j = j + 1) {
+        if (i * j > i + j) total = total + 1;
+        else total = total - 1;
+    }
+}
+print total;
+""",
+}
+
+
+def time_backend(backend: str, source: str, repeat: int) -> float:
+    best = float("inf")
+    Lox.backend = backend
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            Lox.run(source)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--backend", action="append", choices=BACKENDS)
+    options = arg_parser.parse_args()
+    backends = options.backend or list(BACKENDS)
+
+    for name, source in PROGRAMS.items():
+        baseline = None
+        for backend in backends:
+            seconds = time_backend(backend, source, options.repeat)
+            baseline = baseline or seconds
+            print(f"{name:6} {backend:10} {seconds:7.3f}s  {baseline / seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
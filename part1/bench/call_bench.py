@@ -0,0 +1,54 @@
+"""
+Measure Lox function calls per second on each backend: a loop calling a
+small function of zero, one and three arguments, so the per-call overhead
+dominates the time.
+
+Run from part1/:  python -m bench.call_bench [--calls N] [--repeat N] [--backend NAME ...]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+from lox import BACKENDS, Lox
+
+PROGRAM = """
+fun zero() {{ return 1; }}
+fun one(a) {{ return a; }}
+fun three(a, b, c) {{ var d = a; return d; }}
+for (var i = 0; i < {loops}; i = i + 1) {{
+    zero();
+    one(i);
+    three(i, 2, 3);
+}}
+"""
+CALLS_PER_LOOP = 3
+
+
+def calls_per_second(backend: str, calls: int, repeat: int) -> float:
+    source = PROGRAM.format(loops=calls // CALLS_PER_LOOP)
+    best = float("inf")
+    Lox.backend = backend
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            Lox.run(source)
+            best = min(best, time.perf_counter() - start)
+    return calls / best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--calls", type=int, default=150_000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--backend", action="append", choices=BACKENDS)
+    options = arg_parser.parse_args()
+
+    for backend in options.backend or list(BACKENDS):
+        rate = calls_per_second(backend, options.calls, options.repeat)
+        print(f"{backend:10} {rate:12,.0f} calls/s")
+
+
+if __name__ == "__main__":
+    main()
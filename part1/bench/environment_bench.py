@@ -0,0 +1,69 @@
+"""
+Compare the dict backed environment.Environment with the slot backed
+environment.SlotEnvironment: bytes allocated per scope with its variables
+defined, time to create a scope (as visit_block does) and time to read a
+variable a few scopes up.
+
+Run from part1/:  python -m bench.environment_bench [--variables N]
+"""
+
+import argparse
+import timeit
+import tracemalloc
+
+from environment import Environment, SlotEnvironment
+from util import Token, TokenType
+
+
+def allocated(make_scope, count: int = 1000) -> float:
+    tracemalloc.start()
+    scopes = [make_scope() for _ in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del scopes
+    return size / count
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--variables", type=int, default=3, choices=range(1, 256), metavar="N")
+    arg_parser.add_argument("--depth", type=int, default=4)
+    arg_parser.add_argument("--number", type=int, default=200_000)
+    options = arg_parser.parse_args()
+    names = [f"v{i}" for i in range(options.variables)]
+    globals = Environment()
+
+    def dict_scope():
+        scope = Environment(globals)
+        for name in names:
+            scope.define(name, 1.0)
+        return scope
+
+    def slot_scope():
+        scope = SlotEnvironment(len(names), globals)
+        slots = scope.slots
+        for slot in range(len(names)):
+            slots[slot] = 1.0
+        return scope
+
+    dict_chain, slot_chain = dict_scope(), slot_scope()
+    for _ in range(options.depth):
+        dict_chain, slot_chain = Environment(dict_chain), SlotEnvironment(0, slot_chain)
+    token = Token(TokenType.IDENTIFIER, names[-1], None, 1)
+    slot, depth = len(names) - 1, options.depth
+
+    print(f"{options.variables} variables per scope, lookups {options.depth} scopes up")
+    size = len(names)
+    for label, make_scope, create_scope, lookup in (
+        ("Environment", dict_scope, lambda: Environment(globals), lambda: dict_chain.get(token)),
+        ("SlotEnvironment", slot_scope, lambda: SlotEnvironment(size, globals),
+         lambda: slot_chain.get_at(depth, slot)),
+    ):
+        create = timeit.timeit(create_scope, number=options.number) / options.number
+        get = timeit.timeit(lookup, number=options.number) / options.number
+        print(f"{label:16} {allocated(make_scope):6.0f} bytes/scope  "
+              f"create {create * 1e9:6.0f} ns  lookup {get * 1e9:6.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Time a full re-scan and re-parse against incremental.IncrementalParser.edit
+for single-keystroke edits in the middle of a large generated script.
+
+Run from part1/:  python -m bench.incremental_bench [--kilobytes N]
+"""
+
+import argparse
+import time
+
+from fast_scanner import FastScanner
+from incremental import IncrementalParser
+from parser import CompactParser
+from bench.scanner_bench import generate_source
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--kilobytes", type=int, default=512)
+    arg_parser.add_argument("--edits", type=int, default=50)
+    options = arg_parser.parse_args()
+
+    source = generate_source(options.kilobytes)
+    ignore = lambda line, message: None
+    print(f"source: {len(source):,} bytes")
+
+    start = time.perf_counter()
+    CompactParser(FastScanner(source, ignore).scan_compact()).parse()
+    full_seconds = time.perf_counter() - start
+    print(f"full parse:        {full_seconds * 1000:9.2f} ms")
+
+    document = IncrementalParser(source, ignore)
+    document.statements
+    statement = source.index("var total_", len(source) // 2)
+    for label, position, text in (("same line", statement + len("var total"), "x"),
+                                  ("new line", statement, "\n")):
+        start = time.perf_counter()
+        for _ in range(options.edits):
+            document.edit(position, position, text)
+            document.edit(position, position + len(text), "")
+        seconds = (time.perf_counter() - start) / (2 * options.edits)
+        print(f"edit ({label:9}): {seconds * 1000:9.2f} ms  "
+              f"({document.reparsed} declarations re-parsed, {full_seconds / seconds:,.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Measure the inline caches of the tree backend on two loops: one inside a
+function that reads global constants and calls a global function and a
+native, where the caches hit, and one at the top level that assigns a
+global every iteration, which changes the globals' version and makes every
+global read miss. Prints iterations per second and the hit rates.
+
+Run from part1/:  python -m bench.inline_cache_bench [--loops N] [--repeat N]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+from interpreter import Interpreter
+from lox import Lox
+
+STABLE = """
+var step = 2;
+fun add(a, b) {{ return a + b; }}
+fun work() {{
+    var total = 0;
+    for (var i = 0; i < {loops}; i = i + 1) {{
+        total = add(total, step);
+        clock();
+    }}
+    return total;
+}}
+print work();
+"""
+
+CHANGING = """
+var total = 0;
+var step = 2;
+fun add(a, b) {{ return a + b; }}
+for (var i = 0; i < {loops}; i = i + 1) {{
+    total = add(total, step);
+    clock();
+}}
+print total;
+"""
+
+
+def run(source: str, repeat: int) -> tuple[float, Interpreter]:
+    """Best time of `repeat` runs, and the interpreter of the last one."""
+    interpreters = []
+    init = Interpreter.__init__
+    Interpreter.__init__ = lambda self: interpreters.append(self) or init(self)
+    best = float("inf")
+    try:
+        for _ in range(repeat):
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                Lox.run(source)
+                best = min(best, time.perf_counter() - start)
+    finally:
+        Interpreter.__init__ = init
+    return best, interpreters[-1]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--loops", type=int, default=100_000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    options = arg_parser.parse_args()
+
+    # remembering add() would hide what the calls cost
+    Lox.backend, Lox.memoize = "tree", False
+    for name, program in (("stable", STABLE), ("changing", CHANGING)):
+        best, interpreter = run(program.format(loops=options.loops), options.repeat)
+        print(f"{name:10} {options.loops / best:12,.0f} iterations/s")
+        for line in interpreter.cache_report():
+            print(f"    {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Count the environments that loops allocate, on the tree backend. tracemalloc
+only sees memory that is still alive, and a loop's short-lived environments
+are freed as soon as the next one replaces them, so this counts them as they
+are created and reports tracemalloc's peak alongside.
+
+Run from part1/:  python -m bench.loop_alloc_bench [--repeat N]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+import tracemalloc
+
+from environment import SlotEnvironment
+from lox import Lox
+
+PROGRAMS = {
+    "while": """
+var i = 0;
+var total = 0;
+while (i < 100000) { var half = i / 2; total = total + half; i = i + 1; }
+print total;
+""",
+    "for": """
+var total = 0;
+for (var i = 0; i < 300; i = i + 1) {
+    for (var j = 0; j < 300; j = j + 1) { var product = i * j; total = total + product; }
+}
+print total;
+""",
+    "closures": """
+var last;
+var i = 0;
+while (i < 50000) { var j = i; fun get() { return j; } last = get; i = i + 1; }
+print last();
+""",
+}
+
+
+@contextlib.contextmanager
+def counting_environments():
+    counter = [0]
+    init, with_slots = SlotEnvironment.__init__, SlotEnvironment.with_slots
+    def counting_init(self, *args):
+        counter[0] += 1
+        init(self, *args)
+    def counting_with_slots(*args):
+        counter[0] += 1
+        return with_slots(*args)
+    SlotEnvironment.__init__, SlotEnvironment.with_slots = counting_init, counting_with_slots
+    try:
+        yield counter
+    finally:
+        SlotEnvironment.__init__, SlotEnvironment.with_slots = init, with_slots
+
+
+def measure(source: str, repeat: int):
+    Lox.backend = "tree"
+    with contextlib.redirect_stdout(io.StringIO()), counting_environments() as counter:
+        tracemalloc.start()
+        Lox.run(source)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    best = float("inf")
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            Lox.run(source)
+            best = min(best, time.perf_counter() - start)
+    return counter[0], peak, best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    options = arg_parser.parse_args()
+
+    for name, source in PROGRAMS.items():
+        environments, peak, seconds = measure(source, options.repeat)
+        print(f"{name:9} {environments:9,} environments  peak {peak / 1024:8.1f} KiB  {seconds:7.3f}s")
+
+
+if __name__ == "__main__":
+    main()
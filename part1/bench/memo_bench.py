@@ -0,0 +1,73 @@
+"""
+Measure what remembering the results of pure functions does on the tree
+backend: naive recursive fibonacci, where most calls repeat earlier ones,
+and a loop of calls that never repeat, where remembering only costs time
+until the function is given up on. Prints the time with and without
+memoization and the hits and misses of each function.
+
+Run from part1/:  python -m bench.memo_bench [--fib N] [--calls N] [--repeat N]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+from interpreter import Interpreter
+from lox import Lox
+
+FIBONACCI = """
+fun fib(n) {{ if (n < 2) return n; return fib(n - 1) + fib(n - 2); }}
+print fib({n});
+"""
+
+DISTINCT = """
+fun square(x) {{ return x * x; }}
+var sum = 0;
+for (var i = 0; i < {n}; i = i + 1) sum = sum + square(i);
+print sum;
+"""
+
+
+def best_time(source: str, memoize: bool, repeat: int) -> float:
+    best = float("inf")
+    Lox.backend, Lox.memoize = "tree", memoize
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            Lox.run(source)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(source: str):
+    """Print the hit and miss counters of one memoized run."""
+    interpreters = []
+    init = Interpreter.__init__
+    Interpreter.__init__ = lambda self: interpreters.append(self) or init(self)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            Lox.run(source)
+    finally:
+        Interpreter.__init__ = init
+    for line in interpreters[0].memo.report():
+        print(f"    {line}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--fib", type=int, default=20)
+    arg_parser.add_argument("--calls", type=int, default=100_000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    options = arg_parser.parse_args()
+
+    for name, source in (("fib", FIBONACCI.format(n=options.fib)), ("distinct", DISTINCT.format(n=options.calls))):
+        plain = best_time(source, False, options.repeat)
+        memoized = best_time(source, True, options.repeat)
+        print(f"{name:10} {plain * 1000:10.1f} ms plain {memoized * 1000:10.1f} ms memoized "
+              f"({plain / memoized:.2f}x)")
+        report(source)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Time a loop full of constant expressions and a disabled debug branch on each
+backend, without the optimizer and at every -O level.
+
+Run from part1/:  python -m bench.optimizer_bench [--repeat N] [--backend NAME ...]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+from lox import BACKENDS, Lox
+
+PROGRAM = """
+var seconds = 0;
+for (var day = 0; day < 20000; day = day + 1) {
+    seconds = seconds + day * (60 * 60 * 24) - (2 * 3600 + -(-30));
+    if (false and seconds > 0) print "day " + day;
+    if (!true) print "unreachable";
+}
+print seconds;
+"""
+
+
+def time_level(backend: str, level: int, repeat: int) -> float:
+    best = float("inf")
+    Lox.backend, Lox.optimize = backend, level
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            Lox.run(PROGRAM)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--backend", action="append", choices=BACKENDS)
+    options = arg_parser.parse_args()
+
+    for backend in options.backend or list(BACKENDS):
+        baseline = None
+        for level in range(3):
+            seconds = time_level(backend, level, options.repeat)
+            baseline = baseline or seconds
+            print(f"{backend:10} -O{level} {seconds:7.3f}s  {baseline / seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare parse throughput of the recursive descent parser.Parser and the
+table driven pratt_parser.PrattParser on expression heavy generated code.
+Tokens are scanned once up front, so only parsing is timed.
+
+Run from part1/:  python -m bench.parser_bench [--kilobytes N] [--repeat N]
+"""
+
+import argparse
+import time
+
+from fast_scanner import FastScanner
+from parser import CompactParser, Parser
+from pratt_parser import CompactPrattParser, PrattParser
+
+SNIPPET = """
+var v_{i} = ({i} + 2) * 3 - -4 / (5 + {i}.25) >= 6 and !(7 < {i}) or nil == false;
+v_{i} = f(v_{i}, {i} * 2 - 1, g({i})(3)) + "s" + (a <= b != (c > d));
+print a * b + c * d - e / f + (g - h) * (i + j) == k or l and m != n;
+"""
+
+
+def generate_source(kilobytes: int) -> str:
+    chunks = []
+    size = 0
+    i = 0
+    while size < kilobytes * 1024:
+        chunk = SNIPPET.format(i=i)
+        chunks.append(chunk)
+        size += len(chunk)
+        i += 1
+    return "".join(chunks)
+
+
+def time_parser(make_parser, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        parser = make_parser()
+        start = time.perf_counter()
+        parser.parse()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--kilobytes", type=int, default=512)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    options = arg_parser.parse_args()
+
+    source = generate_source(options.kilobytes)
+    ignore = lambda line, message: None
+    tokens = FastScanner(source, ignore).scan_tokens()
+    buffer = FastScanner(source, ignore).scan_compact()
+    print(f"source: {len(source) / 1024:.0f} KB, {len(tokens):,} tokens")
+
+    for label, recursive, pratt in (
+        ("tokens", lambda: Parser(tokens), lambda: PrattParser(tokens)),
+        ("compact", lambda: CompactParser(buffer), lambda: CompactPrattParser(buffer)),
+    ):
+        recursive_seconds = time_parser(recursive, options.repeat)
+        pratt_seconds = time_parser(pratt, options.repeat)
+        print(f"{label:8} recursive {recursive_seconds:7.3f}s  {len(tokens) / recursive_seconds:12,.0f} tokens/sec")
+        print(f"{label:8} pratt     {pratt_seconds:7.3f}s  {len(tokens) / pratt_seconds:12,.0f} tokens/sec  "
+              f"({recursive_seconds / pratt_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
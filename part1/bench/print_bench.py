@@ -0,0 +1,63 @@
+"""
+Measure a Lox loop that prints a million lines on the tree backend, with
+stdout pointed at a block buffered file, at a line buffered one (as it is
+for a terminal, with a write syscall per line for print()), and with the
+interpreter's output kept in an in-memory buffer.
+
+Run from part1/:  python -m bench.print_bench [--lines N] [--repeat N]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+
+from interpreter import Interpreter
+from lox import Lox
+from output import OutputSink
+from parser import Parser
+from resolver import Resolver
+from scanner import Scanner
+
+PROGRAM = """
+for (var i = 0; i < {lines}; i = i + 1) print i;
+"""
+
+
+def lox_to_devnull(source: str, buffering: int) -> float:
+    with open(os.devnull, "w", buffering=buffering) as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        Lox.run(source)
+        return time.perf_counter() - start
+
+
+def interpreter_to_memory(source: str) -> float:
+    statements = Parser(Scanner(source, Lox.error).scan_tokens()).parse()
+    interpreter = Interpreter(OutputSink(io.BytesIO()))
+    Resolver(Lox.error, interpreter.globals.values).resolve(statements)
+    start = time.perf_counter()
+    interpreter.interpret(statements)
+    return time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--lines", type=int, default=1_000_000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    options = arg_parser.parse_args()
+
+    Lox.backend = "tree"
+    source = PROGRAM.format(lines=options.lines)
+    targets = {
+        "file": lambda: lox_to_devnull(source, -1),
+        "line buffered": lambda: lox_to_devnull(source, 1),
+        "memory": lambda: interpreter_to_memory(source),
+    }
+    for name, run in targets.items():
+        best = min(run() for _ in range(options.repeat))
+        print(f"{name:14} {best * 1000:10,.0f} ms {options.lines / best:12,.0f} lines/s")
+
+
+if __name__ == "__main__":
+    main()
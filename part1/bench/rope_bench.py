@@ -0,0 +1,56 @@
+"""
+Measure building a long string with `s = s + piece` in a Lox loop on the
+tree backend, where concatenation makes ropes, and printing it, which
+flattens the rope once. The default builds 10 MB out of 100 character
+pieces.
+
+Run from part1/:  python -m bench.rope_bench [--megabytes N] [--piece N] [--repeat N]
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+from lox import Lox
+
+PROGRAM = """
+fun build() {{
+    var piece = "{piece}";
+    var s = "";
+    for (var i = 0; i < {pieces}; i = i + 1) s = s + piece;
+    return s;
+}}
+print build();
+"""
+
+
+def build_seconds(megabytes: float, piece: int, repeat: int) -> float:
+    pieces = int(megabytes * 1_000_000) // piece
+    source = PROGRAM.format(piece="x" * piece, pieces=pieces)
+    best = float("inf")
+    for _ in range(repeat):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            start = time.perf_counter()
+            Lox.run(source)
+            best = min(best, time.perf_counter() - start)
+        assert len(output.getvalue()) == pieces * piece + 1
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--megabytes", type=float, default=10)
+    arg_parser.add_argument("--piece", type=int, default=100)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    options = arg_parser.parse_args()
+
+    Lox.backend = "tree"
+    seconds = build_seconds(options.megabytes, options.piece, options.repeat)
+    print(f"{options.megabytes:g} MB in {options.piece} character pieces: {seconds * 1000:,.0f} ms "
+          f"({options.megabytes / seconds:,.1f} MB/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Run the benchmark suite in bench.suite, timing scanning, parsing and
+execution (resolving included) of each program separately, and compare two
+runs to catch regressions.
+
+    python -m bench.runner run [--scale N] [--repeat N] [--output PATH] [NAME ...]
+    python -m bench.runner compare OLD NEW [--threshold FRACTION]
+    python -m bench.runner list
+
+`run` prints the median and spread of every phase and can write them, with
+the times of each repeat and the configuration, to a JSON file. `compare`
+reads two such files and lists the phases whose median changed by more than
+the threshold and by more than their spread. It exits with status 1 if any
+of them got slower.
+
+Run from part1/.
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+from lox import BACKENDS, PARSERS, SCANNERS, Lox
+from purity import Purity
+from resolver import Resolver
+from bench.suite import SUITE
+
+PHASES = ("scan", "parse", "execute")
+# phases faster than this are too noisy to count as regressions
+MIN_SECONDS = 0.001
+
+
+def summarize(runs: List[float]) -> Dict[str, Any]:
+    return {
+        "median": statistics.median(runs),
+        "mean": statistics.mean(runs),
+        "min": min(runs),
+        "max": max(runs),
+        "stdev": statistics.stdev(runs) if len(runs) > 1 else 0.0,
+        "runs": runs,
+    }
+
+
+def time_phases(source: str, config: Dict[str, Any]) -> Dict[str, float]:
+    """Scan, parse and execute `source` once, returning the seconds each took."""
+    # errors, runtime ones included, end the benchmark
+    def error(line, message):
+        raise ValueError(f"[line {line}] {message}")
+
+    times = {}
+    gc.collect()
+    start = time.perf_counter()
+    tokens = SCANNERS[config["scanner"]](source, error).scan_tokens()
+    times["scan"] = time.perf_counter() - start
+
+    gc.collect()
+    start = time.perf_counter()
+    statements = PARSERS[config["parser"]][0](tokens).parse()
+    times["parse"] = time.perf_counter() - start
+
+    gc.collect()
+    backend = BACKENDS[config["backend"]]()
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        Resolver(error, backend.globals.values).resolve(statements)
+        if config["memoize"] and config["backend"] == "tree":
+            Purity().analyze(statements)
+        backend.interpret(statements)
+        times["execute"] = time.perf_counter() - start
+    return times
+
+
+def run_suite(names: List[str], config: Dict[str, Any], repeat: int, warmup: int) -> Dict[str, Any]:
+    results = {}
+    for name in names:
+        source = SUITE[name].source(config["scale"])
+        for _ in range(warmup):
+            time_phases(source, config)
+        runs: Dict[str, List[float]] = {phase: [] for phase in PHASES}
+        for _ in range(repeat):
+            for phase, seconds in time_phases(source, config).items():
+                runs[phase].append(seconds)
+        results[name] = {"bytes": len(source), **{phase: summarize(runs[phase]) for phase in PHASES}}
+    return results
+
+
+def print_results(results: Dict[str, Any]):
+    print(f"{'benchmark':12} {'phase':8} {'median ms':>12} {'stdev ms':>10} {'min ms':>10}")
+    for name, result in results.items():
+        for phase in PHASES:
+            stats = result[phase]
+            print(f"{name:12} {phase:8} {stats['median'] * 1000:12.2f} "
+                  f"{stats['stdev'] * 1000:10.2f} {stats['min'] * 1000:10.2f}")
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> List[str]:
+    """The phases in both results whose median changed significantly, as lines to print, regressions marked."""
+    changes = []
+    for name, result in new["results"].items():
+        if name not in old["results"]:
+            continue
+        for phase in PHASES:
+            before, after = old["results"][name][phase], result[phase]
+            ratio = after["median"] / before["median"] if before["median"] else 1.0
+            noise = before["stdev"] + after["stdev"]
+            if abs(after["median"] - before["median"]) <= noise or abs(ratio - 1) <= threshold:
+                continue
+            slower = ratio > 1 and after["median"] >= MIN_SECONDS
+            label = "REGRESSION" if slower else "faster" if ratio < 1 else "slower"
+            changes.append(f"{name:12} {phase:8} {before['median'] * 1000:10.2f} ms -> "
+                           f"{after['median'] * 1000:10.2f} ms {ratio:6.2f}x  {label}")
+    return changes
+
+
+def main(*args: str) -> int:
+    arg_parser = argparse.ArgumentParser(prog="python -m bench.runner")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="time the suite")
+    run.add_argument("names", nargs="*", metavar="NAME", help=f"benchmarks to run, of {', '.join(SUITE)}")
+    run.add_argument("--scale", type=int, default=1, help="make every program this many times larger")
+    run.add_argument("--repeat", type=int, default=5)
+    run.add_argument("--warmup", type=int, default=1, help="untimed runs before the timed ones")
+    run.add_argument("--scanner", choices=SCANNERS, default=Lox.scanner)
+    run.add_argument("--parser", choices=PARSERS, default=Lox.parser)
+    run.add_argument("--backend", choices=BACKENDS, default=Lox.backend)
+    run.add_argument("--no-memoize", dest="memoize", action="store_false", default=Lox.memoize)
+    run.add_argument("--output", metavar="PATH", help="write the results to PATH as JSON")
+    commands.add_parser("list", help="list the benchmarks")
+    comparison = commands.add_parser("compare", help="compare two result files")
+    comparison.add_argument("old")
+    comparison.add_argument("new")
+    comparison.add_argument("--threshold", type=float, default=0.1,
+                            help="the fraction a median must change by to be reported")
+    options = arg_parser.parse_args(args)
+
+    if options.command == "list":
+        for name, benchmark in SUITE.items():
+            print(f"{name:12} {benchmark.description}")
+        return 0
+    if options.command == "compare":
+        with open(options.old) as f:
+            old = json.load(f)
+        with open(options.new) as f:
+            new = json.load(f)
+        if old["config"] != new["config"]:
+            print(f"configurations differ: {old['config']} and {new['config']}")
+        changes = compare(old, new, options.threshold)
+        for line in changes:
+            print(line)
+        if not changes:
+            print("no significant changes")
+        return 1 if any(line.endswith("REGRESSION") for line in changes) else 0
+
+    unknown = [name for name in options.names if name not in SUITE]
+    if unknown:
+        arg_parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    config = {
+        "scale": options.scale,
+        "scanner": options.scanner,
+        "parser": options.parser,
+        "backend": options.backend,
+        "memoize": options.memoize,
+    }
+    results = run_suite(options.names or list(SUITE), config, options.repeat, options.warmup)
+    print_results(results)
+    if options.output is not None:
+        document = {
+            "config": config,
+            "repeat": options.repeat,
+            "python": platform.python_version(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results,
+        }
+        with open(options.output, "w") as f:
+            json.dump(document, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
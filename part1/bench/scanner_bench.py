@@ -0,0 +1,72 @@
+"""
+Compare tokens/sec of scanner.Scanner and fast_scanner.FastScanner on a
+large generated Lox source.
+
+Run from part1/:  python -m bench.scanner_bench [--kilobytes N] [--repeat N]
+"""
+
+import argparse
+import time
+
+from scanner import Scanner
+from fast_scanner import FastScanner
+
+SNIPPET = """
+// block {i}
+fun compute_{i}(a, b) {{
+    var total_{i} = a * {i}.5 + b / 3;
+    if (total_{i} >= 100 and a != b) {{
+        print "large value " + total_{i};
+    }} else {{
+        total_{i} = total_{i} - 1;
+    }}
+    for (var k = 0; k < 10; k = k + 1) {{
+        while (!(k <= 2)) {{ break; }}
+    }}
+    return total_{i};
+}}
+print compute_{i}({i}, nil == false or {i});
+"""
+
+
+def generate_source(kilobytes: int) -> str:
+    chunks = []
+    size = 0
+    i = 0
+    while size < kilobytes * 1024:
+        chunk = SNIPPET.format(i=i)
+        chunks.append(chunk)
+        size += len(chunk)
+        i += 1
+    return "".join(chunks)
+
+
+def time_scanner(scanner_class, source: str, repeat: int):
+    best = float("inf")
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = len(scanner_class(source, lambda line, message: None).scan_tokens())
+        best = min(best, time.perf_counter() - start)
+    return count, best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--kilobytes", type=int, default=2048)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    options = arg_parser.parse_args()
+
+    source = generate_source(options.kilobytes)
+    print(f"source: {len(source) / 1024 / 1024:.2f} MB")
+    results = {}
+    for scanner_class in (Scanner, FastScanner):
+        count, seconds = time_scanner(scanner_class, source, options.repeat)
+        results[scanner_class.__name__] = seconds
+        print(f"{scanner_class.__name__:12} {count:9d} tokens  {seconds:7.3f}s  "
+              f"{count / seconds:12,.0f} tokens/sec")
+    print(f"speedup: {results['Scanner'] / results['FastScanner']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
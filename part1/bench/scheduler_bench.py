@@ -0,0 +1,65 @@
+"""
+Run 1,000 Lox scripts at once on scheduler.Scheduler: a few long loops
+queued first, some scripts that sleep, and many short ones. Reports the
+throughput and the latency of each kind (time from the start until the
+script finished) for several time slices; an infinite slice runs each
+script until it ends or sleeps.
+
+Run from part1/:  python -m bench.scheduler_bench [--scripts N] [--slice SECONDS ...]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import math
+import statistics
+import time
+
+from scheduler import Scheduler
+
+KINDS = {
+    "long": "var t = 0; for (var i = 0; i < 20000; i = i + 1) t = t + i; print t;",
+    "sleepy": "for (var i = 0; i < 3; i = i + 1) { sleep(0.02); print i; }",
+    "short": "var t = 0; for (var i = 0; i < 100; i = i + 1) t = t + i; print t;",
+}
+# out of every 100 scripts
+MIX = {"long": 2, "sleepy": 8, "short": 90}
+
+
+async def run(scheduler: Scheduler, kinds: list) -> dict:
+    start = time.perf_counter()
+    latencies = {kind: [] for kind in KINDS}
+    async def timed(kind: str):
+        await scheduler.run(KINDS[kind])
+        latencies[kind].append(time.perf_counter() - start)
+    await asyncio.gather(*(timed(kind) for kind in kinds))
+    latencies["all"] = [time.perf_counter() - start]
+    return latencies
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--scripts", type=int, default=1000)
+    arg_parser.add_argument("--slice", type=float, action="append")
+    options = arg_parser.parse_args()
+
+    # the long scripts go first, where they hold up everything without slicing
+    kinds = [kind for kind, share in MIX.items() for _ in range(options.scripts * share // 100)]
+    for time_slice in options.slice or [math.inf, 0.01, 0.002]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            latencies = asyncio.run(run(Scheduler(time_slice), kinds))
+        total = latencies.pop("all")[0]
+        print(f"slice {time_slice:6}  {len(kinds) / total:7.0f} scripts/s  total {total:6.2f}s")
+        for kind, values in latencies.items():
+            print(f"    {kind:7} p50 {statistics.median(values) * 1000:8.1f}ms  "
+                  f"p99 {percentile(values, 0.99) * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
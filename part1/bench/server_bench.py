@@ -0,0 +1,71 @@
+"""
+Measure what a warm server saves per script: running a short script and a
+parse heavy one N times as `python lox.py SCRIPT`, each a new process, and
+as requests to a server.py started once. The server parses each script
+on its first request, which is not timed, and keeps it.
+
+Run from part1/:  python -m bench.server_bench [--runs N] [--workers N]
+"""
+
+import argparse
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import server
+from bench.suite import generated
+
+SHORT = """
+fun greet(name) { return "hello " + name; }
+print greet("lox");
+"""
+
+
+def wait_for(path: str, process: subprocess.Popen):
+    while not os.path.exists(path):
+        if process.poll() is not None:
+            raise SystemExit("the server didn't start")
+        time.sleep(0.01)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--runs", type=int, default=20)
+    arg_parser.add_argument("--workers", type=int, default=0)
+    options = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        scripts = {"short": SHORT, "generated": generated(1)}
+        paths = {}
+        for name, source in scripts.items():
+            paths[name] = os.path.join(directory, f"{name}.lox")
+            with open(paths[name], "w") as f:
+                f.write(source)
+        socket_path = os.path.join(directory, "lox.sock")
+        process = subprocess.Popen([sys.executable, "server.py", "serve", socket_path,
+                                    "--workers", str(options.workers)])
+        try:
+            wait_for(socket_path, process)
+            for name, path in paths.items():
+                start = time.perf_counter()
+                for _ in range(options.runs):
+                    subprocess.run([sys.executable, "lox.py", path], stdout=subprocess.DEVNULL, check=True)
+                cold = (time.perf_counter() - start) / options.runs
+                # the first request parses the script, the timed ones find it cached
+                assert server.request(socket_path, {"path": path}, io.StringIO()) == 0
+                start = time.perf_counter()
+                for _ in range(options.runs):
+                    assert server.request(socket_path, {"path": path}, io.StringIO()) == 0
+                warm = (time.perf_counter() - start) / options.runs
+                print(f"{name:10} {cold * 1000:10.1f} ms a process {warm * 1000:10.1f} ms a request "
+                      f"({cold / warm:.1f}x)")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
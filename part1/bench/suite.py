@@ -0,0 +1,129 @@
+"""
+The Lox programs timed by bench.runner. Each benchmark makes its source
+for a scale, so that the same suite can run quickly in the tests and for
+long enough to time on the command line. At scale 1 each program runs
+for a fraction of a second on the tree backend.
+"""
+
+from typing import Callable, Dict, NamedTuple
+
+
+class Benchmark(NamedTuple):
+    description: str
+    source: Callable[[int], str]
+
+
+def fib(scale: int) -> str:
+    # each step up in n costs about 1.6 times as much
+    n = 20 + scale.bit_length()
+    # counting the calls makes fib impure, so that they are not memoized
+    return f"""
+var calls = 0;
+fun fib(n) {{
+    calls = calls + 1;
+    if (n < 2) return n;
+    return fib(n - 1) + fib(n - 2);
+}}
+print fib({n});
+print calls;
+"""
+
+
+def loops(scale: int) -> str:
+    return f"""
+var total = 0;
+for (var i = 0; i < {150 * scale}; i = i + 1) {{
+    for (var j = 0; j < 150; j = j + 1) {{
+        if (i * j > i + j) total = total + 1;
+        else total = total - 1;
+    }}
+}}
+print total;
+"""
+
+
+def closures(scale: int) -> str:
+    return f"""
+fun makeCounter(step) {{
+    var count = 0;
+    fun counter() {{
+        count = count + step;
+        return count;
+    }}
+    return counter;
+}}
+var total = 0;
+for (var i = 0; i < {2000 * scale}; i = i + 1) {{
+    var counter = makeCounter(i);
+    for (var j = 0; j < 5; j = j + 1) total = total + counter();
+}}
+print total;
+"""
+
+
+def strings(scale: int) -> str:
+    return f"""
+var text = "";
+var line = "";
+for (var i = 0; i < {20000 * scale}; i = i + 1) {{
+    line = line + "x";
+    text = text + "ab";
+    if (line == "xxxxxxxxxx") {{
+        text = text + line;
+        line = "";
+    }}
+}}
+print text == text + "";
+"""
+
+
+NESTING_DEPTH = 40
+
+
+def nesting(scale: int) -> str:
+    # every block declares a variable, and the innermost one reads all of
+    # them, through as many environments as the block is deep
+    opening = "".join(f"{{ var v{depth} = {depth};\n" for depth in range(NESTING_DEPTH))
+    total = " + ".join(f"v{depth}" for depth in range(NESTING_DEPTH))
+    closing = "}" * NESTING_DEPTH
+    return f"""
+var total = 0;
+for (var i = 0; i < {2000 * scale}; i = i + 1) {{
+{opening}total = total + {total};
+{closing}
+}}
+print total;
+"""
+
+
+GENERATED = """
+// chunk {i}
+fun compute_{i}(a, b) {{
+    var total = a * {i}.5 + b / 3;
+    if (total >= 100 and a != b) {{
+        total = total - (a + b) * 2;
+    }} else {{
+        total = -total;
+    }}
+    for (var k = 0; k < 2; k = k + 1) {{
+        while (!(k <= 2)) {{ break; }}
+    }}
+    return total;
+}}
+var value_{i} = compute_{i}({i}, {i} + 1) == nil or "chunk {i}" != "";
+"""
+
+
+def generated(scale: int) -> str:
+    # about 400 bytes a chunk, so that scanning and parsing dominate
+    return "".join(GENERATED.format(i=i) for i in range(1000 * scale)) + "print value_0;\n"
+
+
+SUITE: Dict[str, Benchmark] = {
+    "fib": Benchmark("recursive fibonacci", fib),
+    "loops": Benchmark("nested for loops of arithmetic", loops),
+    "closures": Benchmark("counters made by a function and called through their closures", closures),
+    "strings": Benchmark("a string built one piece at a time", strings),
+    "nesting": Benchmark(f"{NESTING_DEPTH} nested blocks run in a loop", nesting),
+    "generated": Benchmark("400 KB of generated declarations, for the scanner and parser", generated),
+}
@@ -0,0 +1,56 @@
+"""
+Report memory per token for a list of util.Token objects versus a compact
+token_buffer.TokenBuffer, and the time to parse from each.
+
+Run from part1/:  python -m bench.token_memory_bench [--kilobytes N]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from fast_scanner import FastScanner
+from parser import CompactParser, Parser
+from bench.scanner_bench import generate_source
+
+
+def measure(build):
+    start = time.perf_counter()
+    build()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, seconds
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--kilobytes", type=int, default=1024)
+    options = arg_parser.parse_args()
+
+    source = generate_source(options.kilobytes)
+    ignore = lambda line, message: None
+    print(f"source: {len(source):,} bytes")
+
+    tokens, token_bytes, token_seconds = measure(lambda: FastScanner(source, ignore).scan_tokens())
+    count = len(tokens)
+    del tokens
+    buffer, buffer_bytes, buffer_seconds = measure(lambda: FastScanner(source, ignore).scan_compact())
+    assert len(buffer) == count
+
+    print(f"Token objects  {token_bytes / count:7.1f} bytes/token  scan {token_seconds:.3f}s")
+    print(f"TokenBuffer    {buffer_bytes / count:7.1f} bytes/token  scan {buffer_seconds:.3f}s")
+    print(f"reduction: {token_bytes / buffer_bytes:.1f}x")
+
+    start = time.perf_counter()
+    Parser(FastScanner(source, ignore).scan_tokens()).parse()
+    print(f"Parser         parse {time.perf_counter() - start:.3f}s (including scan)")
+    start = time.perf_counter()
+    CompactParser(FastScanner(source, ignore).scan_compact()).parse()
+    print(f"CompactParser  parse {time.perf_counter() - start:.3f}s (including scan)")
+
+
+if __name__ == "__main__":
+    main()
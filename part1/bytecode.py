@@ -0,0 +1,258 @@
+"""
+Bytecode chunks for the stack VM, following clox's chunk.c. A Function holds
+its code as an `array('B')`, a constant pool and a run-length encoded line
+table. Operands are one byte for local slots, argument counts and captures,
+and two bytes, big endian, for constant indexes and jump offsets.
+
+A compiled script serializes to a `.loxc` file, the bytecode counterpart of
+the AST cache: a header with the source digest, followed by the functions in
+prefix order, zlib compressed.
+"""
+
+import os
+import struct
+import zlib
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Any, List, Optional
+from ast_cache import CacheError, source_digest
+
+(
+    CONSTANT, NIL, TRUE, FALSE, POP,
+    GET_LOCAL, SET_LOCAL, STORE_LOCAL,
+    GET_CELL, SET_CELL, STORE_CELL, MAKE_CELL, BOX_LOCAL,
+    GET_UPVALUE, SET_UPVALUE,
+    GET_GLOBAL, SET_GLOBAL, DEFINE_GLOBAL,
+    EQUAL, NOT_EQUAL, GREATER, GREATER_EQUAL, LESS, LESS_EQUAL,
+    ADD, SUBTRACT, MULTIPLY, DIVIDE, NOT, NEGATE,
+    PRINT, JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE, POP_JUMP_IF_FALSE, LOOP,
+    CALL, CLOSURE, RETURN,
+    LOOP_SETUP, LOOP_POP, BREAK_OUT, ERROR,
+) = range(43)
+
+OPCODE_NAMES = [
+    "CONSTANT", "NIL", "TRUE", "FALSE", "POP",
+    "GET_LOCAL", "SET_LOCAL", "STORE_LOCAL",
+    "GET_CELL", "SET_CELL", "STORE_CELL", "MAKE_CELL", "BOX_LOCAL",
+    "GET_UPVALUE", "SET_UPVALUE",
+    "GET_GLOBAL", "SET_GLOBAL", "DEFINE_GLOBAL",
+    "EQUAL", "NOT_EQUAL", "GREATER", "GREATER_EQUAL", "LESS", "LESS_EQUAL",
+    "ADD", "SUBTRACT", "MULTIPLY", "DIVIDE", "NOT", "NEGATE",
+    "PRINT", "JUMP", "JUMP_IF_FALSE", "JUMP_IF_TRUE", "POP_JUMP_IF_FALSE", "LOOP",
+    "CALL", "CLOSURE", "RETURN",
+    "LOOP_SETUP", "LOOP_POP", "BREAK_OUT", "ERROR",
+]
+
+# opcodes by operand layout; CLOSURE is followed by two bytes per capture
+BYTE_OPERAND = {GET_LOCAL, SET_LOCAL, STORE_LOCAL, GET_CELL, SET_CELL, STORE_CELL, MAKE_CELL, BOX_LOCAL,
+                GET_UPVALUE, SET_UPVALUE, CALL}
+SHORT_OPERAND = {CONSTANT, GET_GLOBAL, SET_GLOBAL, DEFINE_GLOBAL, JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE,
+                 POP_JUMP_IF_FALSE, LOOP, CLOSURE, LOOP_SETUP, ERROR}
+
+
+class Function:
+    """A compiled Lox function, or the top-level script when `name` is None."""
+    def __init__(self, name: Optional[str], arity: int):
+        self.name = name
+        self.arity = arity
+        self.code = array("B")
+        # the code as a list of ints, set by vm.VM before running since
+        # indexing a list is about twice as fast as indexing an array
+        self.ops: Optional[List[int]] = None
+        self.constants: List[Any] = []
+        # line_numbers[i] applies from code offset line_offsets[i] on
+        self.line_offsets = array("I")
+        self.line_numbers = array("I")
+        # slots in a call's locals list, parameters first
+        self.local_count = arity
+        # how many cells a closure over this function captures
+        self.capture_count = 0
+        self.anonymous = False
+
+    def write(self, byte: int, line: int):
+        if not self.line_numbers or self.line_numbers[-1] != line:
+            self.line_offsets.append(len(self.code))
+            self.line_numbers.append(line)
+        self.code.append(byte)
+
+    def line_at(self, offset: int) -> int:
+        return self.line_numbers[bisect_right(self.line_offsets, offset) - 1]
+
+    @property
+    def padding(self) -> List[None]:
+        # appended to the arguments to make a call's locals list
+        return [None] * (self.local_count - self.arity)
+
+    def __repr__(self):
+        if self.name is None:
+            return "<script>"
+        return "<anonymous lox callable>" if self.anonymous else f"<lox callable {self.name}>"
+
+
+def disassemble(function: Function) -> str:
+    lines = [f"== {function!r} =="]
+    code, offset = function.code, 0
+    while offset < len(code):
+        op = code[offset]
+        name = OPCODE_NAMES[op]
+        text = f"{offset:04} {function.line_at(offset):4} {name:17}"
+        offset += 1
+        if op in BYTE_OPERAND:
+            text += f" {code[offset]}"
+            offset += 1
+        elif op in SHORT_OPERAND:
+            operand = code[offset] << 8 | code[offset + 1]
+            offset += 2
+            if op in (JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE, POP_JUMP_IF_FALSE, LOOP_SETUP):
+                text += f" -> {offset + operand}"
+            elif op == LOOP:
+                text += f" -> {offset - operand}"
+            else:
+                text += f" {operand} {function.constants[operand]!r}"
+            if op == CLOSURE:
+                for _ in range(function.constants[operand].capture_count):
+                    kind = "local" if code[offset] else "upvalue"
+                    text += f" ({kind} {code[offset + 1]})"
+                    offset += 2
+        lines.append(text)
+    for constant in function.constants:
+        if isinstance(constant, Function):
+            lines.append(disassemble(constant))
+    return "\n".join(lines)
+
+
+# .loxc files
+
+MAGIC = b"LOXC"
+FORMAT_VERSION = 1
+SUFFIX = ".loxc"
+HEADER = struct.Struct("<4sH32s")
+FUNCTION_HEADER = struct.Struct("<?HBHBIIH")
+# constant tags
+NIL_TAG, TRUE_TAG, FALSE_TAG, NUMBER_TAG, STRING_TAG, FUNCTION_TAG = range(6)
+
+
+def dumps(function: Function, source: str) -> bytes:
+    parts: List[bytes] = []
+    write_function(function, parts)
+    return HEADER.pack(MAGIC, FORMAT_VERSION, source_digest(source)) + zlib.compress(b"".join(parts), 1)
+
+
+def write_string(s: str, parts: List[bytes]):
+    data = s.encode("utf-8")
+    parts.append(struct.pack("<I", len(data)))
+    parts.append(data)
+
+
+def write_function(function: Function, parts: List[bytes]):
+    parts.append(FUNCTION_HEADER.pack(function.name is not None, function.arity, function.anonymous,
+                                      function.local_count, function.capture_count, len(function.code),
+                                      len(function.line_offsets), len(function.constants)))
+    if function.name is not None:
+        write_string(function.name, parts)
+    parts.append(function.code.tobytes())
+    parts.append(function.line_offsets.tobytes())
+    parts.append(function.line_numbers.tobytes())
+    for constant in function.constants:
+        if constant is None:
+            parts.append(bytes((NIL_TAG,)))
+        elif constant is True or constant is False:
+            parts.append(bytes((TRUE_TAG if constant else FALSE_TAG,)))
+        elif isinstance(constant, float):
+            parts.append(struct.pack("<Bd", NUMBER_TAG, constant))
+        elif isinstance(constant, str):
+            parts.append(bytes((STRING_TAG,)))
+            write_string(constant, parts)
+        else:
+            parts.append(bytes((FUNCTION_TAG,)))
+            write_function(constant, parts)
+
+
+class ChunkReader:
+    def __init__(self, payload: bytes):
+        self.payload = payload
+        self.offset = 0
+
+    def take(self, size: int) -> bytes:
+        data = self.payload[self.offset : self.offset + size]
+        if len(data) != size:
+            raise CacheError("Truncated chunk file")
+        self.offset += size
+        return data
+
+    def unpack(self, layout: struct.Struct) -> tuple:
+        return layout.unpack(self.take(layout.size))
+
+    def string(self) -> str:
+        (size,) = struct.unpack("<I", self.take(4))
+        return self.take(size).decode("utf-8")
+
+    def array(self, typecode: str, count: int) -> array:
+        values = array(typecode)
+        values.frombytes(self.take(values.itemsize * count))
+        return values
+
+    def function(self) -> Function:
+        (named, arity, anonymous, local_count, capture_count,
+         code_size, line_count, constant_count) = self.unpack(FUNCTION_HEADER)
+        function = Function(self.string() if named else None, arity)
+        function.anonymous = anonymous
+        function.local_count = local_count
+        function.capture_count = capture_count
+        function.code = self.array("B", code_size)
+        function.line_offsets = self.array("I", line_count)
+        function.line_numbers = self.array("I", line_count)
+        for _ in range(constant_count):
+            tag = self.take(1)[0]
+            if tag == NUMBER_TAG:
+                (value,) = struct.unpack("<d", self.take(8))
+            elif tag == STRING_TAG:
+                value = self.string()
+            elif tag == FUNCTION_TAG:
+                value = self.function()
+            elif tag <= FALSE_TAG:
+                value = None if tag == NIL_TAG else tag == TRUE_TAG
+            else:
+                raise CacheError("Corrupt chunk file")
+            function.constants.append(value)
+        return function
+
+
+def loads(data: bytes, source: str) -> Function:
+    if len(data) < HEADER.size:
+        raise CacheError("Truncated chunk file")
+    magic, version, digest = HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION or digest != source_digest(source):
+        raise CacheError("Stale chunk file")
+    try:
+        reader = ChunkReader(zlib.decompress(data[HEADER.size:]))
+    except zlib.error as e:
+        raise CacheError("Corrupt chunk file") from e
+    function = reader.function()
+    if reader.offset != len(reader.payload):
+        raise CacheError("Corrupt chunk file")
+    return function
+
+
+def cache_path(cache: Path) -> Path:
+    return cache.with_name(cache.name + SUFFIX)
+
+
+def load(cache: Path, source: str) -> Optional[Function]:
+    """Return the compiled script for `source`, or None if there is no valid entry."""
+    try:
+        return loads(cache_path(cache).read_bytes(), source)
+    except (OSError, CacheError, UnicodeDecodeError):
+        return None
+
+
+def store(cache: Path, source: str, function: Function):
+    path = cache_path(cache)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_bytes(dumps(function, source))
+        os.replace(temporary, path)
+    except OSError:
+        pass
@@ -0,0 +1,356 @@
+"""
+Compiles a resolved program into bytecode.Function code for vm.VM, in the
+style of clox's single pass compiler but working from the Stmt/Expr trees.
+
+Every local gets a slot in its function's locals list; slots are reused once
+a scope ends. Locals that a closure captures live in a cell (a one element
+list) made when their scope is entered, so a scope that runs again, like a
+loop body, gives its closures fresh variables as the tree-walker does. A
+closure keeps the cells it captures instead of clox's upvalue objects.
+"""
+
+from typing import Dict, Iterable, List, Optional
+from Expr import Assign, Binary, Call, Expr, Grouping, Literal, Logical, Unary, Variable
+from Stmt import Block, Break, Expression, For, FunctionStatement, If, Print, Return, Stmt, Var, While
+from analyzer import Analyzer, Decl, Frame
+from bytecode import (
+    ADD, BOX_LOCAL, BREAK_OUT, CALL, CLOSURE, CONSTANT, DEFINE_GLOBAL, DIVIDE, EQUAL, ERROR, FALSE,
+    GET_CELL, GET_GLOBAL, GET_LOCAL, GET_UPVALUE, GREATER, GREATER_EQUAL, JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE,
+    LESS, LESS_EQUAL, LOOP, LOOP_POP, LOOP_SETUP, MAKE_CELL, MULTIPLY, NEGATE, NIL, NOT, NOT_EQUAL, POP,
+    POP_JUMP_IF_FALSE, PRINT, RETURN, SET_CELL, SET_GLOBAL, SET_LOCAL, SET_UPVALUE, STORE_CELL, STORE_LOCAL,
+    SUBTRACT, TRUE, Function,
+)
+from parser import ParserException
+from util import Token, TokenType
+
+MAX_LOCALS = 256
+MAX_CONSTANTS = 1 << 16
+MAX_JUMP = (1 << 16) - 1
+
+BINARY_OPCODES = {
+    TokenType.PLUS:          ADD,
+    TokenType.MINUS:         SUBTRACT,
+    TokenType.STAR:          MULTIPLY,
+    TokenType.SLASH:         DIVIDE,
+    TokenType.EQUAL_EQUAL:   EQUAL,
+    TokenType.BANG_EQUAL:    NOT_EQUAL,
+    TokenType.GREATER:       GREATER,
+    TokenType.GREATER_EQUAL: GREATER_EQUAL,
+    TokenType.LESS:          LESS,
+    TokenType.LESS_EQUAL:    LESS_EQUAL,
+}
+
+
+class CompileError(ParserException):
+    """A program the bytecode format has no room for, reported like a parse error."""
+
+
+class FunctionState:
+    __slots__ = ("function", "frame", "enclosing", "slots", "next_slot", "upvalues", "loops", "constants")
+
+    def __init__(self, function: Function, frame: Frame, enclosing: Optional["FunctionState"]):
+        self.function = function
+        self.frame = frame
+        self.enclosing = enclosing
+        self.slots: Dict[Decl, int] = {}
+        self.next_slot = 0
+        # index of each outer local in the closure's cells
+        self.upvalues = {decl: index for index, decl in enumerate(frame.free)}
+        # for each enclosing loop, the jumps its breaks need patched
+        self.loops: List[List[int]] = []
+        self.constants: Dict[tuple, int] = {}
+
+
+class BytecodeCompiler:
+    def __init__(self):
+        self.analyzer = Analyzer()
+        self.state: Optional[FunctionState] = None
+        # the token instructions are attributed to in the line table
+        self.token = Token(TokenType.EOF, "", None, 1)
+        self.wrap_breaks = False
+
+    def compile(self, statements: Iterable[Stmt]) -> Function:
+        statements = list(statements)
+        self.analyzer.analyze(statements)
+        # loops need a runtime handler only if a break may come from a call
+        self.wrap_breaks = bool(self.analyzer.nonlocal_breaks)
+        self.state = FunctionState(Function(None, 0), self.analyzer.frames[0], None)
+        for statement in statements:
+            self.statement(statement)
+        self.emit(NIL, RETURN)
+        return self.state.function
+
+    # emitting
+
+    def emit(self, *data: int):
+        function, line = self.state.function, self.token.line
+        for byte in data:
+            function.write(byte, line)
+
+    def emit_short(self, op: int, operand: int):
+        self.emit(op, operand >> 8, operand & 0xFF)
+
+    def make_constant(self, value) -> int:
+        state = self.state
+        key = (value.__class__, value)
+        index = state.constants.get(key)
+        if index is None:
+            constants = state.function.constants
+            index = len(constants)
+            if index == MAX_CONSTANTS:
+                raise CompileError(self.token, "Too many constants in one chunk.")
+            constants.append(value)
+            state.constants[key] = index
+        return index
+
+    def emit_jump(self, op: int) -> int:
+        self.emit(op, 0xFF, 0xFF)
+        return len(self.state.function.code) - 2
+
+    def patch_jump(self, offset: int):
+        code = self.state.function.code
+        distance = len(code) - offset - 2
+        if distance > MAX_JUMP:
+            raise CompileError(self.token, "Too much code to jump over.")
+        code[offset], code[offset + 1] = distance >> 8, distance & 0xFF
+
+    def emit_loop(self, start: int):
+        distance = len(self.state.function.code) - start + 3
+        if distance > MAX_JUMP:
+            raise CompileError(self.token, "Loop body too large.")
+        self.emit_short(LOOP, distance)
+
+    # scopes and variables
+
+    def begin_scope(self, node: Stmt, parameters: int = 0) -> int:
+        """Give the scope's locals their slots and cells; returns what end_scope needs."""
+        state = self.state
+        saved = state.next_slot
+        for index, decl in enumerate(self.analyzer.scope_decls.get(id(node), ())):
+            slot = state.slots[decl] = state.next_slot
+            state.next_slot += 1
+            if state.next_slot > MAX_LOCALS:
+                raise CompileError(decl.name, "Too many local variables in function.")
+            if decl.captured:
+                self.emit(BOX_LOCAL if index < parameters else MAKE_CELL, slot)
+        for decl in self.analyzer.resets.get(id(node), ()):
+            if not decl.captured:
+                self.emit(NIL, STORE_LOCAL, state.slots[decl])
+        state.function.local_count = max(state.function.local_count, state.next_slot)
+        return saved
+
+    def end_scope(self, saved: int):
+        self.state.next_slot = saved
+
+    def access(self, decl: Optional[Decl], name: Token, local: int, cell: int, upvalue: int, global_: int):
+        """Emit the opcode of the four that fits where `name` lives."""
+        state = self.state
+        if decl is None:
+            self.emit_short(global_, self.make_constant(name.lexeme))
+        elif decl.function is state.frame.function:
+            self.emit(cell if decl.captured else local, state.slots[decl])
+        else:
+            self.emit(upvalue, state.upvalues[decl])
+
+    def define(self, name: Token):
+        """Pop the value on top of the stack into the variable `name` declares."""
+        self.access(self.analyzer.decls.get(id(name)), name, STORE_LOCAL, STORE_CELL, SET_UPVALUE, DEFINE_GLOBAL)
+
+    # statements
+
+    def statement(self, stmt: Optional[Stmt]):
+        if stmt is not None:
+            stmt.accept(self)
+
+    def visit_expression(self, stmt: Expression):
+        if isinstance(stmt.expression, FunctionStatement):
+            self.function(stmt.expression)
+            if stmt.expression.name is None:
+                self.emit(POP)
+            else:
+                self.define(stmt.expression.name)
+            return
+        self.discard(stmt.expression)
+
+    def discard(self, expr: Expr):
+        """Emit `expr` for its side effects only."""
+        decl = self.analyzer.references.get(id(expr)) if isinstance(expr, Assign) else None
+        if decl is not None and decl.function is self.state.frame.function:
+            # an assignment to a local needs no copy of the value left behind
+            self.expression(expr.value)
+            self.token = expr.name
+            self.emit(STORE_CELL if decl.captured else STORE_LOCAL, self.state.slots[decl])
+            return
+        self.expression(expr)
+        self.emit(POP)
+
+    def visit_print(self, stmt: Print):
+        self.expression(stmt.expression)
+        self.emit(PRINT)
+
+    def visit_var(self, stmt: Var):
+        if stmt.initializer is None:
+            self.emit(NIL)
+        else:
+            self.expression(stmt.initializer)
+        self.token = stmt.name
+        self.define(stmt.name)
+
+    def visit_block(self, stmt: Block):
+        saved = self.begin_scope(stmt)
+        for statement in stmt.statements:
+            self.statement(statement)
+        self.end_scope(saved)
+
+    def visit_if(self, stmt: If):
+        self.expression(stmt.condition)
+        else_jump = self.emit_jump(POP_JUMP_IF_FALSE)
+        self.statement(stmt.then_branch)
+        if stmt.else_branch is None:
+            self.patch_jump(else_jump)
+            return
+        end_jump = self.emit_jump(JUMP)
+        self.patch_jump(else_jump)
+        self.statement(stmt.else_branch)
+        self.patch_jump(end_jump)
+
+    def loop_body(self, body: Stmt, scope: Optional[Stmt] = None) -> List[int]:
+        """Emit a loop body; returns the jumps that leave the loop."""
+        exits = []
+        if self.wrap_breaks:
+            # a break in a function called from the body unwinds to here
+            exits.append(self.emit_jump(LOOP_SETUP))
+        self.state.loops.append(exits)
+        saved = None if scope is None else self.begin_scope(scope)
+        self.statement(body)
+        if saved is not None:
+            self.end_scope(saved)
+        if self.wrap_breaks:
+            self.emit(LOOP_POP)
+        return self.state.loops.pop()
+
+    def visit_while(self, stmt: While):
+        start = len(self.state.function.code)
+        self.expression(stmt.condition)
+        exits = [self.emit_jump(POP_JUMP_IF_FALSE)]
+        exits += self.loop_body(stmt.loop_body, stmt)
+        self.emit_loop(start)
+        for exit in exits:
+            self.patch_jump(exit)
+
+    def visit_for(self, stmt: For):
+        saved = self.begin_scope(stmt)
+        self.statement(stmt.initialization)
+        start = len(self.state.function.code)
+        exits = []
+        if stmt.condition is not None:
+            self.expression(stmt.condition)
+            exits.append(self.emit_jump(POP_JUMP_IF_FALSE))
+        exits += self.loop_body(stmt.body)
+        if stmt.update is not None:
+            self.discard(stmt.update)
+        self.emit_loop(start)
+        for exit in exits:
+            self.patch_jump(exit)
+        self.end_scope(saved)
+
+    def visit_break(self, stmt: Break):
+        self.token = stmt.token
+        if id(stmt) in self.analyzer.nonlocal_breaks:
+            self.emit(BREAK_OUT)
+        elif self.state.loops:
+            if self.wrap_breaks:
+                self.emit(LOOP_POP)
+            self.state.loops[-1].append(self.emit_jump(JUMP))
+        else:
+            self.emit_short(ERROR, self.make_constant("Break not inside loop."))
+
+    def visit_return(self, stmt: Return):
+        self.token = stmt.token
+        if self.state.frame.function is None:
+            self.emit_short(ERROR, self.make_constant("Return not inside function."))
+            return
+        self.expression(stmt.return_expr)
+        self.emit(RETURN)
+
+    def function(self, stmt: FunctionStatement):
+        """Emit code that pushes a closure over `stmt`."""
+        frame = self.analyzer.function_frames[id(stmt)]
+        function = Function("" if stmt.name is None else stmt.name.lexeme, len(stmt.parameters))
+        function.anonymous = stmt.name is None
+        function.capture_count = len(frame.free)
+        enclosing = self.state
+        self.state = FunctionState(function, frame, enclosing)
+        self.begin_scope(stmt, parameters=len(stmt.parameters))
+        self.statement(stmt.body)
+        self.emit(NIL, RETURN)
+        self.state = enclosing
+
+        if stmt.name is not None:
+            self.token = stmt.name
+        self.emit_short(CLOSURE, self.make_constant(function))
+        for decl in frame.free:
+            if decl.function is enclosing.frame.function:
+                self.emit(1, enclosing.slots[decl])
+            else:
+                self.emit(0, enclosing.upvalues[decl])
+
+    # expressions
+
+    def expression(self, expr: Expr):
+        expr.accept(self)
+
+    def visit_function_statement(self, expr: FunctionStatement):
+        # a function in expression position binds its name, if any, and gives nil
+        self.function(expr)
+        if expr.name is not None:
+            self.define(expr.name)
+            self.emit(NIL)
+
+    def visit_literal(self, expr: Literal):
+        value = expr.value
+        if value is None:
+            self.emit(NIL)
+        elif value is True:
+            self.emit(TRUE)
+        elif value is False:
+            self.emit(FALSE)
+        else:
+            self.emit_short(CONSTANT, self.make_constant(value))
+
+    def visit_grouping(self, expr: Grouping):
+        self.expression(expr.expression)
+
+    def visit_variable(self, expr: Variable):
+        self.token = expr.name
+        self.access(self.analyzer.references.get(id(expr)), expr.name, GET_LOCAL, GET_CELL, GET_UPVALUE, GET_GLOBAL)
+
+    def visit_assign(self, expr: Assign):
+        self.expression(expr.value)
+        self.token = expr.name
+        self.access(self.analyzer.references.get(id(expr)), expr.name, SET_LOCAL, SET_CELL, SET_UPVALUE, SET_GLOBAL)
+
+    def visit_logical(self, expr: Logical):
+        self.expression(expr.left)
+        end_jump = self.emit_jump(JUMP_IF_TRUE if expr.operator.type == TokenType.OR else JUMP_IF_FALSE)
+        self.emit(POP)
+        self.expression(expr.right)
+        self.patch_jump(end_jump)
+
+    def visit_unary(self, expr: Unary):
+        self.expression(expr.right)
+        self.token = expr.operator
+        self.emit(NEGATE if expr.operator.type == TokenType.MINUS else NOT)
+
+    def visit_binary(self, expr: Binary):
+        self.expression(expr.left)
+        self.expression(expr.right)
+        self.token = expr.operator
+        self.emit(BINARY_OPCODES[expr.operator.type])
+
+    def visit_call(self, expr: Call):
+        self.expression(expr.callee)
+        for argument in expr.arguments:
+            self.expression(argument)
+        self.token = expr.paren
+        self.emit(CALL, len(expr.arguments))
@@ -0,0 +1,360 @@
+"""
+Closure compiling backend. Each resolved Stmt/Expr tree is turned once into
+nested Python closures that take the current environment and call their
+children directly, so running a program involves no visitor dispatch and no
+matching on token types. Produces the same output and runtime errors as
+interpreter.Interpreter.
+"""
+
+from operator import ge, gt, le, lt, mul, sub, truediv
+from typing import Any, Callable, List, Optional
+from Expr import Assign, Binary, Call, Expr, Grouping, Literal, Logical, Unary, Variable
+from Stmt import Block, Break, Expression, For, FunctionStatement, If, Print, Return, Stmt, Var, While
+from environment import Environment, SlotEnvironment
+from interpreter import FRAMES_MAX, Clock, LoxCallable, deep_recursion
+from runtime_error import BreakException, ReturnException, RuntimeError
+from util import Token, TokenType
+
+# a compiled node: takes the current environment, returns the node's value
+Code = Callable[[SlotEnvironment | Environment], Any]
+
+# binary operators that require two numbers
+NUMBER_OPERATORS = {
+    TokenType.MINUS:         sub,
+    TokenType.SLASH:         truediv,
+    TokenType.STAR:          mul,
+    TokenType.GREATER:       gt,
+    TokenType.GREATER_EQUAL: ge,
+    TokenType.LESS:          lt,
+    TokenType.LESS_EQUAL:    le,
+}
+
+
+def stringify(value: Any) -> str:
+    if value is None: return "nil"
+    if value.__class__ is float and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+class CompiledFunction(LoxCallable):
+    def __init__(self, stmt: FunctionStatement, body: Code, closure: SlotEnvironment | Environment):
+        self.stmt = stmt
+        self.body = body
+        self.closure = closure
+        self.parameter_count = len(stmt.parameters)
+        self.padding = [None] * (stmt.slot_count - self.parameter_count)
+
+    def arity(self):
+        return self.parameter_count
+
+    def call(self, interpreter, arguments):
+        # the caller's argument list becomes the frame's slots
+        arguments += self.padding
+        interpreter.call_depth += 1
+        try:
+            self.body(SlotEnvironment.with_slots(arguments, self.closure))
+        except ReturnException as re:
+            return re.value
+        finally:
+            interpreter.call_depth -= 1
+
+    def __repr__(self):
+        if self.stmt.name:
+            return f"<lox callable {self.stmt.name.lexeme}>"
+        else: return f"<anonymous lox callable>"
+
+
+class ClosureCompiler:
+    def __init__(self):
+        self.globals = Environment()
+        self.globals.define("clock", Clock())
+        # Lox calls running, limited to FRAMES_MAX like the Interpreter's
+        self.call_depth = 0
+
+    def interpret(self, statements: List[Stmt]):
+        try:
+            with deep_recursion():
+                for statement in statements:
+                    self.compile(statement)(self.globals)
+        except BreakException as escaped:
+            # no loop was running when the function with the break was called
+            raise RuntimeError(escaped.token, "Break not inside loop.") from None
+
+    def compile(self, node: Optional[Expr | Stmt]) -> Optional[Code]:
+        if node is None:
+            return None
+        return node.accept(self)
+
+    # statements
+
+    def visit_expression(self, stmt: Expression):
+        return self.compile(stmt.expression)
+
+    def visit_print(self, stmt: Print):
+        expression = self.compile(stmt.expression)
+        def print_(env):
+            print(stringify(expression(env)))
+        return print_
+
+    def visit_var(self, stmt: Var):
+        initializer = self.compile(stmt.initializer)
+        slot = stmt.slot
+        if slot is None:
+            values, name = self.globals.values, stmt.name.lexeme
+            if initializer is None:
+                def define_global(env):
+                    values[name] = None
+            else:
+                def define_global(env):
+                    values[name] = initializer(env)
+            return define_global
+        if initializer is None:
+            def define(env):
+                env.slots[slot] = None
+        else:
+            def define(env):
+                env.slots[slot] = initializer(env)
+        return define
+
+    def visit_block(self, stmt: Block):
+        statements = [self.compile(s) for s in stmt.statements if s is not None]
+        slot_count = stmt.slot_count
+        def block(env):
+            inner = SlotEnvironment(slot_count, env)
+            for statement in statements:
+                statement(inner)
+        return block
+
+    def visit_if(self, stmt: If):
+        condition = self.compile(stmt.condition)
+        then_branch = self.compile(stmt.then_branch) or (lambda env: None)
+        else_branch = self.compile(stmt.else_branch)
+        if else_branch is None:
+            def if_(env):
+                value = condition(env)
+                if value is not None and value is not False:
+                    then_branch(env)
+        else:
+            def if_(env):
+                value = condition(env)
+                if value is not None and value is not False:
+                    then_branch(env)
+                else:
+                    else_branch(env)
+        return if_
+
+    def visit_while(self, stmt: While):
+        condition = self.compile(stmt.condition)
+        body = self.compile(stmt.loop_body)
+        slot_count = stmt.slot_count
+        def while_(env):
+            while True:
+                value = condition(env)
+                if value is None or value is False:
+                    return
+                try:
+                    body(SlotEnvironment(slot_count, env))
+                except BreakException:
+                    return
+        return while_
+
+    def visit_for(self, stmt: For):
+        initialization = self.compile(stmt.initialization)
+        condition = self.compile(stmt.condition) or (lambda env: True)
+        update = self.compile(stmt.update)
+        body = self.compile(stmt.body)
+        slot_count = stmt.slot_count
+        def for_(env):
+            inner = SlotEnvironment(slot_count, env)
+            if initialization is not None:
+                initialization(inner)
+            while True:
+                value = condition(inner)
+                if value is None or value is False:
+                    return
+                try:
+                    body(inner)
+                except BreakException:
+                    return
+                if update is not None:
+                    update(inner)
+        return for_
+
+    def visit_break(self, stmt: Break):
+        if not stmt.inside_loop:
+            return self.error(stmt.token, "Break not inside loop.")
+        token = stmt.token
+        def break_(env):
+            raise BreakException(token)
+        return break_
+
+    def visit_return(self, stmt: Return):
+        if not stmt.inside_function:
+            return self.error(stmt.token, "Return not inside function.")
+        value = self.compile(stmt.return_expr)
+        def return_(env):
+            raise ReturnException(value(env))
+        return return_
+
+    def error(self, token: Token, message: str) -> Code:
+        def error(env):
+            raise RuntimeError(token, message)
+        return error
+
+    def visit_function_statement(self, stmt: FunctionStatement):
+        body = self.compile(stmt.body) or (lambda env: None)
+        if stmt.name is None:
+            def function(env):
+                return CompiledFunction(stmt, body, env)
+            return function
+        slot = stmt.slot
+        if slot is None:
+            values, name = self.globals.values, stmt.name.lexeme
+            def define_global(env):
+                values[name] = CompiledFunction(stmt, body, env)
+            return define_global
+        def define(env):
+            env.slots[slot] = CompiledFunction(stmt, body, env)
+        return define
+
+    # expressions
+
+    def visit_literal(self, expr: Literal):
+        value = expr.value
+        return lambda env: value
+
+    def visit_grouping(self, expr: Grouping):
+        return self.compile(expr.expression)
+
+    def visit_variable(self, expr: Variable):
+        name, depth, slot = expr.name, expr.depth, expr.slot
+        if depth is None:
+            values, lexeme = self.globals.values, name.lexeme
+            def get_global(env):
+                try:
+                    return values[lexeme]
+                except KeyError:
+                    raise RuntimeError(name, f"Undefined variable {lexeme}.") from None
+            return get_global
+        if depth == 0:
+            return lambda env: env.slots[slot]
+        if depth == 1:
+            return lambda env: env.enclosing.slots[slot]
+        if depth == 2:
+            return lambda env: env.enclosing.enclosing.slots[slot]
+        return lambda env: env.get_at(depth, slot)
+
+    def visit_assign(self, expr: Assign):
+        name, depth, slot = expr.name, expr.depth, expr.slot
+        value = self.compile(expr.value)
+        if depth is None:
+            values, lexeme = self.globals.values, name.lexeme
+            def set_global(env):
+                result = value(env)
+                if lexeme not in values:
+                    raise RuntimeError(name, f"Undefined variable '{lexeme}'.")
+                values[lexeme] = result
+                return result
+            return set_global
+        if depth == 0:
+            def set_local(env):
+                result = env.slots[slot] = value(env)
+                return result
+            return set_local
+        def set_enclosing(env):
+            result = value(env)
+            env.assign_at(depth, slot, result)
+            return result
+        return set_enclosing
+
+    def visit_logical(self, expr: Logical):
+        left, right = self.compile(expr.left), self.compile(expr.right)
+        if expr.operator.type == TokenType.OR:
+            def or_(env):
+                value = left(env)
+                if value is not None and value is not False:
+                    return value
+                return right(env)
+            return or_
+        def and_(env):
+            value = left(env)
+            if value is None or value is False:
+                return value
+            return right(env)
+        return and_
+
+    def visit_unary(self, expr: Unary):
+        operator, right = expr.operator, self.compile(expr.right)
+        if operator.type == TokenType.MINUS:
+            def negate(env):
+                value = right(env)
+                if value.__class__ is not float:
+                    raise RuntimeError(operator, "Operand must be a number.")
+                return -value
+            return negate
+        def not_(env):
+            value = right(env)
+            return value is None or value is False
+        return not_
+
+    def visit_binary(self, expr: Binary):
+        operator, left, right = expr.operator, self.compile(expr.left), self.compile(expr.right)
+        match operator.type:
+            case TokenType.PLUS:
+                def plus(env):
+                    a, b = left(env), right(env)
+                    if a.__class__ is float and b.__class__ is float:
+                        return a + b
+                    if a.__class__ is str and b.__class__ is str:
+                        return a + b
+                    if a.__class__ is str or b.__class__ is str:
+                        return stringify(a) + stringify(b)
+                    raise RuntimeError(operator, "Operands must be two numbers or two strings")
+                return plus
+            case TokenType.EQUAL_EQUAL:
+                def equal(env):
+                    a, b = left(env), right(env)
+                    if a is None:
+                        return b is None
+                    return a == b
+                return equal
+            case TokenType.BANG_EQUAL:
+                def not_equal(env):
+                    a, b = left(env), right(env)
+                    if a is None:
+                        return b is not None
+                    return not a == b
+                return not_equal
+        apply = NUMBER_OPERATORS[operator.type]
+        def arithmetic(env):
+            a, b = left(env), right(env)
+            if a.__class__ is not float or b.__class__ is not float:
+                raise RuntimeError(operator, "Operand must be a number.")
+            return apply(a, b)
+        return arithmetic
+
+    def visit_call(self, expr: Call):
+        callee, paren = self.compile(expr.callee), expr.paren
+        arguments = [self.compile(argument) for argument in expr.arguments]
+        count = len(arguments)
+        def call(env):
+            function = callee(env)
+            values = [argument(env) for argument in arguments]
+            if function.__class__ is CompiledFunction:
+                if count != function.parameter_count:
+                    raise RuntimeError(paren, f"Expected {function.parameter_count} args, instead got {count}")
+                if self.call_depth == FRAMES_MAX:
+                    raise RuntimeError(paren, "Stack overflow.")
+                try:
+                    return function.call(self, values)
+                except RecursionError:
+                    # expressions nested deeper than PYTHON_FRAMES_PER_CALL allows for
+                    raise RuntimeError(paren, "Stack overflow.") from None
+            if not isinstance(function, LoxCallable):
+                raise RuntimeError(paren, "Can only call functions.")
+            if count != (arity := function.arity()):
+                raise RuntimeError(paren, f"Expected {arity} args, instead got {count}")
+            return function.call(self, values)
+        return call
+
@@ -1,17 +1,23 @@
-from typing import Any, Dict, Final, Optional, Self
+from itertools import count
+from typing import Any, Dict, Final, List, Optional, Self
 from runtime_error import RuntimeError
 from util import Token
 
+# stamps for Environment.version, drawn from one counter so that a value
+# cached against one environment can't be taken for another's
+versions = count()
+
 
 class Environment:
-    def __init__(self, enclosing: Self | None = None, inside_loop: bool=False, inside_function: bool=False):
+    def __init__(self, enclosing: Self | None = None):
         self.values: Dict[str, Any] = {}
         self.enclosing: Final[Optional[Self]] = enclosing
-        self.inside_loop = inside_loop
-        self.inside_function = inside_function
+        # changes whenever a variable is defined or assigned here
+        self.version = next(versions)
 
     def define(self, name: str, value: Any):
         self.values[name] = value
+        self.version = next(versions)
 
     def get(self, name: Token):
         if name.lexeme in self.values:
@@ -23,7 +29,42 @@ class Environment:
     def assign(self, name: Token, value: Any):
         if name.lexeme in self.values:
             self.values[name.lexeme] = value
+            self.version = next(versions)
         elif self.enclosing:
             self.enclosing.assign(name, value)
         else:
             raise RuntimeError(name, f"Undefined variable '{name.lexeme}'.")
+
+
+class SlotEnvironment:
+    """
+    A local scope. Variables live in a list sized for the declarations the
+    scope contains and are addressed by the (depth, slot) pairs computed by
+    resolver.Resolver.
+    """
+    __slots__ = ("slots", "enclosing")
+
+    def __init__(self, size: int, enclosing: "SlotEnvironment | Environment"):
+        self.slots: List[Any] = [None] * size
+        self.enclosing = enclosing
+
+    @classmethod
+    def with_slots(cls, slots: List[Any], enclosing: "SlotEnvironment | Environment") -> "SlotEnvironment":
+        """Make an environment that takes over `slots`, such as a call's argument list."""
+        environment = cls.__new__(cls)
+        environment.slots = slots
+        environment.enclosing = enclosing
+        return environment
+
+    def ancestor(self, depth: int) -> "SlotEnvironment":
+        environment = self
+        while depth:
+            environment = environment.enclosing
+            depth -= 1
+        return environment
+
+    def get_at(self, depth: int, slot: int) -> Any:
+        return self.ancestor(depth).slots[slot]
+
+    def assign_at(self, depth: int, slot: int, value: Any):
+        self.ancestor(depth).slots[slot] = value
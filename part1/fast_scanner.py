@@ -0,0 +1,158 @@
+"""
+Regex driven scanner. Produces the same tokens as scanner.Scanner, but
+consumes a whole lexeme per step using a single compiled master pattern.
+"""
+
+import re
+from typing import Callable, Iterator, List, Optional
+from util import Token, TokenType
+from scanner import RESERVED_KEYWORDS
+from token_buffer import TokenBuffer
+
+TOKEN_PATTERN = re.compile(
+    r"""
+      (?P<space>[ \r\t]+)
+    | (?P<newline>\n+)
+    | (?P<comment>//[^\n]*)
+    | (?P<identifier>[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<number>[0-9]+(?:\.[0-9]+)?)
+    | (?P<string>"[^"]*")
+    | (?P<operator>[!=<>]=?|[(){},.\-+;/*])
+    | (?P<unterminated>")
+    | (?P<error>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# group indices of TOKEN_PATTERN, compared against match.lastindex
+SPACE, NEWLINE, COMMENT, IDENTIFIER, NUMBER, STRING, OPERATOR, UNTERMINATED, ERROR = range(1, 10)
+
+OPERATORS = {
+    "(":  TokenType.LEFT_PAREN,
+    ")":  TokenType.RIGHT_PAREN,
+    "{":  TokenType.LEFT_BRACE,
+    "}":  TokenType.RIGHT_BRACE,
+    ",":  TokenType.COMMA,
+    ".":  TokenType.DOT,
+    "-":  TokenType.MINUS,
+    "+":  TokenType.PLUS,
+    ";":  TokenType.SEMICOLON,
+    "/":  TokenType.SLASH,
+    "*":  TokenType.STAR,
+    "!":  TokenType.BANG,
+    "!=": TokenType.BANG_EQUAL,
+    "=":  TokenType.EQUAL,
+    "==": TokenType.EQUAL_EQUAL,
+    ">":  TokenType.GREATER,
+    ">=": TokenType.GREATER_EQUAL,
+    "<":  TokenType.LESS,
+    "<=": TokenType.LESS_EQUAL,
+}
+
+# the same tables as plain type codes, for filling a TokenBuffer
+OPERATOR_CODES = {text: ttype.value for text, ttype in OPERATORS.items()}
+KEYWORD_CODES = {text: ttype.value for text, ttype in RESERVED_KEYWORDS.items()}
+
+
+class FastScanner:
+    def __init__(self, source: str, error_handler: Callable[[int, str], None]):
+        self.source = source
+        self.tokens = []
+        self.line = 1
+        self.error = error_handler
+
+    def scan_tokens(self) -> List[Token]:
+        self.tokens.extend(self.iter_tokens())
+        return self.tokens
+
+    def iter_tokens(self) -> Iterator[Token]:
+        source = self.source
+        line = self.line
+        keywords = RESERVED_KEYWORDS
+        operators = OPERATORS
+        identifier_type = TokenType.IDENTIFIER
+
+        for m in TOKEN_PATTERN.finditer(source):
+            kind = m.lastindex
+            if kind == SPACE or kind == COMMENT:
+                continue
+            elif kind == IDENTIFIER:
+                text = m.group()
+                yield Token(keywords.get(text, identifier_type), text, None, line)
+            elif kind == OPERATOR:
+                text = m.group()
+                yield Token(operators[text], text, None, line)
+            elif kind == NEWLINE:
+                line += m.end() - m.start()
+            elif kind == NUMBER:
+                text = m.group()
+                yield Token(TokenType.NUMBER, text, float(text), line)
+            elif kind == STRING:
+                text = m.group()
+                line += text.count("\n")
+                yield Token(TokenType.STRING, text, text[1:-1], line)
+            elif kind == UNTERMINATED:
+                line += source.count("\n", m.end())
+                self.line = line
+                self.error(line, "Unterminated string")
+                break
+            else:
+                self.line = line
+                self.error(line, f"Issue parsing character {m.group()}")
+
+        self.line = line
+        yield Token(TokenType.EOF, "", None, line + 1)
+
+    def scan_compact(self, start: int = 0, stop: Optional[int] = None) -> TokenBuffer:
+        """
+        Scan into a TokenBuffer without creating any Token objects.
+
+        Scanning begins at offset `start` on line self.line. If `stop` is given,
+        it ends right after the first token that begins at or past `stop`.
+        """
+        buffer = TokenBuffer(self.source)
+        source = self.source
+        line = self.line
+        keywords = KEYWORD_CODES
+        operators = OPERATOR_CODES
+        types, starts, ends, lines = buffer.types, buffer.starts, buffer.ends, buffer.lines
+        identifier_code = TokenType.IDENTIFIER.value
+        number_code = TokenType.NUMBER.value
+        string_code = TokenType.STRING.value
+
+        for m in TOKEN_PATTERN.finditer(source, start):
+            kind = m.lastindex
+            if kind == SPACE or kind == COMMENT:
+                continue
+            elif kind == NEWLINE:
+                line += m.end() - m.start()
+                continue
+            elif kind == IDENTIFIER:
+                code = keywords.get(m.group(), identifier_code)
+            elif kind == OPERATOR:
+                code = operators[m.group()]
+            elif kind == NUMBER:
+                code = number_code
+            elif kind == STRING:
+                line += m.group().count("\n")
+                code = string_code
+            elif kind == UNTERMINATED:
+                line += source.count("\n", m.end())
+                self.line = line
+                self.error(line, "Unterminated string")
+                break
+            else:
+                self.line = line
+                self.error(line, f"Issue parsing character {m.group()}")
+                continue
+            token_start, token_end = m.span()
+            types.append(code)
+            starts.append(token_start)
+            ends.append(token_end)
+            lines.append(line)
+            if stop is not None and token_start >= stop:
+                break
+
+        self.line = line
+        buffer.append(TokenType.EOF, len(source), len(source), line + 1)
+        return buffer
@@ -0,0 +1,165 @@
+"""
+Incremental front end for editor loops. Keeps every top-level declaration
+together with its source span, and on an edit re-lexes and re-parses only
+the declarations around the edited range. Declarations outside of it are
+reused as-is (same Stmt objects); their line numbers are only brought up to
+date when the statements are asked for.
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, List, Optional
+from Expr import Expr
+from Stmt import Stmt
+from fast_scanner import FastScanner
+from parser import CompactParser, ParserException
+from token_buffer import TokenBuffer
+from util import Token
+
+
+class Declaration:
+    __slots__ = ("stmt", "start", "end", "end_line", "pending_lines")
+
+    def __init__(self, stmt: Stmt, start: int, end: int, end_line: int):
+        self.stmt = stmt
+        # offsets of the first character and one past the last character
+        self.start = start
+        self.end = end
+        # scanner line at `end`
+        self.end_line = end_line
+        # line shift not yet applied to the tokens inside stmt
+        self.pending_lines = 0
+
+
+class RegionParser(CompactParser):
+    """CompactParser that remembers where the last syntax error happened."""
+    def __init__(self, tokens: TokenBuffer):
+        super().__init__(tokens)
+        self.error_index = -1
+
+    def synchronize(self):
+        if self.error_index < 0:
+            self.error_index = self.current
+        super().synchronize()
+
+
+class IncrementalParser:
+    def __init__(self, source: str, error_handler: Callable[[int, str], None]):
+        self.source = source
+        self.error = error_handler
+        # None until the source has been parsed successfully
+        self.declarations: Optional[List[Declaration]] = None
+        # number of declarations parsed by the last call, for inspection
+        self.reparsed = 0
+
+    @property
+    def statements(self) -> List[Stmt]:
+        if self.declarations is None:
+            self.declarations = self.parse_region(0, 1, None, self.error)
+            self.reparsed = len(self.declarations)
+        for declaration in self.declarations:
+            if declaration.pending_lines:
+                shift_lines(declaration.stmt, declaration.pending_lines)
+                declaration.pending_lines = 0
+        return [declaration.stmt for declaration in self.declarations]
+
+    def edit(self, start: int, end: int, text: str) -> List[Stmt]:
+        """
+        Replace source[start:end] with `text`. Returns the statements that were
+        parsed again; every other statement is the same object as before.
+        """
+        old_source = self.source
+        self.source = old_source[:start] + text + old_source[end:]
+        if self.declarations is None:
+            return self.statements
+
+        declarations = self.declarations
+        count = len(declarations)
+        delta = len(text) - (end - start)
+        line_delta = text.count("\n") - old_source.count("\n", start, end)
+
+        # The declaration before the edited one is re-parsed as well: the edit
+        # may change the token right after it, which it might consume (`else`).
+        first = max(0, bisect_left(declarations, start, key=lambda d: d.end) - 1)
+        last = max(first, bisect_right(declarations, end, key=lambda d: d.start) - 1)
+        if first > 0:
+            scan_start, scan_line = declarations[first - 1].end, declarations[first - 1].end_line
+        else:
+            scan_start, scan_line = 0, 1
+
+        while True:
+            errors = []
+            rest = last + 1
+            stop = declarations[rest].start + delta if rest < count else None
+            try:
+                region = self.parse_region(scan_start, scan_line, stop, lambda *args: errors.append(args))
+            except ParserException:
+                for error in errors:
+                    self.error(*error)
+                self.declarations = None
+                raise
+            if region is not None:
+                break
+            # the region did not end on a declaration boundary: grow it
+            last = min(count - 1, last + (last - first + 1))
+
+        for error in errors:
+            self.error(*error)
+        reused = declarations[rest:]
+        for declaration in reused:
+            declaration.start += delta
+            declaration.end += delta
+            if line_delta:
+                declaration.end_line += line_delta
+                declaration.pending_lines += line_delta
+        self.declarations = declarations[:first] + region + reused
+        self.reparsed = len(region)
+        return [declaration.stmt for declaration in region]
+
+    def parse_region(self, scan_start: int, scan_line: int, stop: Optional[int],
+                     error_handler: Callable[[int, str], None]) -> Optional[List[Declaration]]:
+        """
+        Parse the declarations from `scan_start` up to the declaration that
+        starts at offset `stop` (or the end of the source). Returns None when
+        the tokens do not line up with that boundary any more.
+        """
+        scanner = FastScanner(self.source, error_handler)
+        scanner.line = scan_line
+        tokens = scanner.scan_compact(scan_start, stop)
+        starts, ends, lines = tokens.starts, tokens.ends, tokens.lines
+        if stop is None:
+            boundary = len(tokens)
+        else:
+            boundary = len(tokens) - 2
+            if boundary < 0 or starts[boundary] != stop:
+                return None
+
+        parser = RegionParser(tokens)
+        region = []
+        while parser.current < boundary:
+            first = parser.current
+            try:
+                stmt = parser.declaration()
+            except ParserException:
+                if stop is not None and parser.error_index >= boundary:
+                    return None
+                raise
+            if stmt is not None:
+                last = parser.current - 1
+                region.append(Declaration(stmt, starts[first], ends[last], lines[last]))
+        if stop is not None and parser.current != boundary:
+            return None
+        return region
+
+
+def shift_lines(node: Any, line_delta: int, seen: Optional[set] = None):
+    """Move every Token under an AST node by `line_delta` lines."""
+    if seen is None:
+        seen = set()
+    for value in vars(node).values():
+        for item in value if isinstance(value, list) else (value,):
+            if isinstance(item, Token):
+                if id(item) not in seen:
+                    seen.add(id(item))
+                    item.line += line_delta
+            elif isinstance(item, (Expr, Stmt)):
+                shift_lines(item, line_delta, seen)
@@ -1,15 +1,61 @@
+import sys
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Any, List
+from enum import Enum
+from operator import add, eq, ge, gt, le, lt, mul, ne, sub, truediv
+from typing import Any, Callable, Iterator, List, Optional
 from Stmt import Block, Break, For, FunctionStatement, If, Print, Expression, Stmt, Var, While, Return
 from Expr import Assign, Binary, Call, Expr, Logical, Grouping, Literal, Unary, Variable
 from util import Token, TokenType
-from runtime_error import RuntimeError, BreakException, ReturnException
-from environment import Environment
+from runtime_error import RuntimeError, BreakException
+from environment import Environment, SlotEnvironment
+from memo import Memo, MemoTable
+from output import OutputSink
+from rope import Rope, concatenate
 
 
 from abc import abstractmethod
 from typing import Protocol, runtime_checkable
 
+class Completion(Enum):
+    """
+    Returned by a statement that ends its loop or function early, and passed
+    up by the statements around it. Statements that complete normally return
+    None.
+    """
+    BREAK = 1
+    # the value is left in Interpreter.return_value
+    RETURN = 2
+    # return the result of calling Interpreter.tail_function with
+    # Interpreter.tail_arguments, once the returning function's frame is gone
+    TAIL_CALL = 3
+
+BREAK = Completion.BREAK
+RETURN = Completion.RETURN
+TAIL_CALL = Completion.TAIL_CALL
+
+# the classes of Lox string values
+STRINGS = (str, Rope)
+
+# Lox calls that may be in progress at once; tail calls don't count
+FRAMES_MAX = 1000
+# Python frames for each of them, with room for deeply nested expressions
+PYTHON_FRAMES_PER_CALL = 40
+
+
+@contextmanager
+def deep_recursion() -> Iterator[None]:
+    """Raise the recursion limit to fit FRAMES_MAX Lox calls, putting it back afterwards."""
+    limit = sys.getrecursionlimit()
+    # each Lox call takes a few Python frames: visit_call, Func.call, the
+    # statements of its body and the expressions in them
+    sys.setrecursionlimit(max(limit, FRAMES_MAX * PYTHON_FRAMES_PER_CALL))
+    try:
+        yield
+    finally:
+        sys.setrecursionlimit(limit)
+
+
 @runtime_checkable
 class LoxCallable(Protocol):
     @abstractmethod
@@ -31,22 +77,73 @@ class Clock(LoxCallable):
         return "<native fn>"
 
 class Func(LoxCallable):
-    def __init__(self, stmt: FunctionStatement):
+    def __init__(self, stmt: FunctionStatement, closure: Environment | SlotEnvironment):
         self.stmt = stmt
+        self.closure = closure
+        self.body = stmt.body
+        self.parameter_count = len(stmt.parameters)
+        # the slots after the parameters, for the body's own declarations
+        self.padding = [None] * (stmt.slot_count - self.parameter_count)
+        # set by Interpreter if purity.Purity found the function pure
+        self.memo: Optional[MemoTable] = None
+
     def arity(self):
-        return len(self.stmt.parameters)
+        return self.parameter_count
+
     def call(self, interpreter, arguments):
-        env = interpreter.environment
+        if self.memo is not None:
+            return self.call_memoized(interpreter, arguments)
+        return self.run(interpreter, arguments)
+
+    def call_memoized(self, interpreter, arguments):
+        memo, table = interpreter.memo, self.memo
+        depth = interpreter.call_depth
+        if not table.active:
+            # still counted in the depth reached by the calls around it
+            if memo.reached <= depth:
+                memo.reached = depth + 1
+            return self.run(interpreter, arguments)
+        key = memo.key(arguments)
+        entry = table.entries.get(key)
+        if entry is not None:
+            table.entries.move_to_end(key)
+            table.hits += 1
+            value, calls, _ = entry
+            if depth + calls > FRAMES_MAX:
+                # running the call would have gone past the stack limit
+                raise RecursionError()
+            memo.reached = max(memo.reached, depth + calls)
+            return value
+        table.misses += 1
+        outer, memo.reached = memo.reached, depth + 1
         try:
-            interpreter.environment = Environment(enclosing=env, inside_function=True)
-            for param, arg in zip(self.stmt.parameters, arguments):
-                interpreter.environment.define(param.lexeme, interpreter.evaluate(arg))
+            value = self.run(interpreter, arguments)
+            calls = memo.reached - depth
+        finally:
+            memo.reached = max(outer, memo.reached)
+        memo.store(table, key, value, calls)
+        return value
 
-            interpreter.evaluate(self.stmt.body)
-        except ReturnException as re:
-            return re.value
+    def run(self, interpreter, arguments):
+        function = self
+        env = interpreter.environment
+        interpreter.call_depth += 1
+        try:
+            while True:
+                # the argument list is the caller's own and becomes the
+                # frame, with the parameters in the first slots
+                arguments += function.padding
+                interpreter.environment = SlotEnvironment.with_slots(arguments, function.closure)
+                completion = function.body.accept(interpreter)
+                if completion is not TAIL_CALL:
+                    break
+                # a trampoline: the call the body returns runs in this frame
+                function, arguments = interpreter.tail_function, interpreter.tail_arguments
         finally:
             interpreter.environment = env
+            interpreter.call_depth -= 1
+        if completion is RETURN:
+            return interpreter.return_value
 
     def __repr__(self):
         if self.stmt.name:
@@ -54,39 +151,66 @@ class Func(LoxCallable):
         else: return f"<anonymous lox callable>"
 
 class Interpreter:
-    def __init__(self):
+    def __init__(self, output: Optional[OutputSink] = None):
+        # where print statements write; see output.OutputSink
+        self.output = OutputSink() if output is None else output
         self.globals = Environment()
         self.environment = self.globals
+        self.return_value: Any = None
+        self.tail_function: Optional[Func] = None
+        self.tail_arguments: List[Any] = []
+        self.call_depth = 0
+        self.memo = Memo()
+        # uses of the inline caches on global Variables and on Calls
+        self.global_hits = self.global_misses = 0
+        self.call_hits = self.call_misses = 0
 
         self.globals.define("clock", Clock())
 
     def interpret(self, statements: List[Stmt]):
         try:
-            for statement in statements:
-                self.execute(statement)
-        except RuntimeError as e:
-            raise e
+            with deep_recursion():
+                for statement in statements:
+                    self.execute(statement)
+        except BreakException as escaped:
+            # no loop was running when the function with the break was called
+            raise RuntimeError(escaped.token, "Break not inside loop.") from None
+        finally:
+            # before an error stopping the program is reported
+            self.output.flush()
 
-    def execute(self, statement: Stmt):
-        statement.accept(self)
+    def execute(self, statement: Stmt) -> Optional[Completion]:
+        return statement.accept(self)
 
     def visit_var(self, statement: Var):
         value = None
         if statement.initializer is not None:
             value = self.evaluate(statement.initializer)
-        self.environment.define(statement.name.lexeme, value)
+        if statement.slot is None:
+            self.globals.define(statement.name.lexeme, value)
+        else:
+            self.environment.slots[statement.slot] = value
 
     def visit_for(self, stmt: For):
         previous = self.environment
         try:
-            self.environment = Environment(enclosing=previous, inside_loop=True)
+            self.environment = SlotEnvironment(stmt.slot_count, previous)
+            # every iteration shares the for scope; a Block body may share one too
+            block = self.loop_block(stmt.body, self.environment)
+            cleared = None if block is None else block.slots[:]
             if stmt.initialization is not None:
                 stmt.initialization.accept(self)
             while stmt.condition is None or (stmt.condition and self.is_truthy(self.evaluate(stmt.condition))):
                 try:
-                    self.execute(stmt.body)
+                    if block is None:
+                        completion = self.execute(stmt.body)
+                    else:
+                        block.slots[:] = cleared
+                        completion = self.execute_block(stmt.body.statements, block)
                 except BreakException:
                     break
+                if completion is not None:
+                    return None if completion is BREAK else completion
                 if stmt.update is not None:
                     self.evaluate(stmt.update)
         finally:
@@ -94,40 +218,82 @@ class Interpreter:
 
     def visit_while(self, stmt: While):
         enclosing = self.environment
-        try:
-            while stmt.condition is None or self.is_truthy(self.evaluate(stmt.condition)):
-                self.environment = Environment(enclosing=enclosing, inside_loop=True)
-                try:
-                    self.execute(stmt.loop_body)
-                except BreakException:
-                    break
-        finally:
-            self.environment = enclosing
+        scope = block = reused = None
+        if not stmt.captured:
+            # no closure can keep an iteration's scope, so one environment is
+            # cleared and reused for every iteration
+            scope = SlotEnvironment(stmt.slot_count, enclosing)
+            block = self.loop_block(stmt.loop_body, scope)
+            # only a body that is not a Block declares in the loop's own scope
+            reused = scope if block is None else block
+        cleared = None if reused is None else reused.slots[:]
+        while stmt.condition is None or self.is_truthy(self.evaluate(stmt.condition)):
+            try:
+                if reused is None:
+                    self.environment = SlotEnvironment(stmt.slot_count, enclosing)
+                    completion = self.execute(stmt.loop_body)
+                else:
+                    reused.slots[:] = cleared
+                    self.environment = scope
+                    if block is None:
+                        completion = self.execute(stmt.loop_body)
+                    else:
+                        completion = self.execute_block(stmt.loop_body.statements, block)
+            except BreakException:
+                break
+            finally:
+                # the condition is evaluated outside of the iteration's scope
+                self.environment = enclosing
+            if completion is not None:
+                return None if completion is BREAK else completion
+
+    def loop_block(self, body: Stmt, scope: SlotEnvironment) -> Optional[SlotEnvironment]:
+        """An environment to run a Block loop body in on every iteration, or None if closures may keep one."""
+        if body.__class__ is Block and not body.captured:
+            return SlotEnvironment(body.slot_count, scope)
+        return None
 
     def visit_if(self, stmt: If):
         if self.is_truthy(self.evaluate(stmt.condition)):
-            self.execute(stmt.then_branch)
+            return self.execute(stmt.then_branch)
         elif stmt.else_branch:
-            self.execute(stmt.else_branch)
+            return self.execute(stmt.else_branch)
 
     def visit_variable(self, expression: Variable):
-        return self.environment.get(expression.name)
+        if expression.depth is None:
+            if expression.cache_version == self.globals.version:
+                self.global_hits += 1
+                return expression.cache_value
+            self.global_misses += 1
+            expression.cache_value = self.globals.get(expression.name)
+            expression.cache_version = self.globals.version
+            return expression.cache_value
+        return self.environment.get_at(expression.depth, expression.slot)
 
     def visit_expression(self, stmt: Expression):
         self.evaluate(stmt.expression)
 
     def visit_block(self, stmt: Block):
-        self.execute_block(stmt.statements, Environment(self.environment))
+        return self.execute_block(stmt.statements, SlotEnvironment(stmt.slot_count, self.environment))
+
+    def make_function(self, stmt: FunctionStatement) -> Func:
+        function = Func(stmt, self.environment)
+        if stmt.pure:
+            function.memo = self.memo.table(stmt)
+        return function
 
     def visit_function_statement(self, stmt: FunctionStatement):
-        if stmt.name is not None:
-            self.environment.define(stmt.name.lexeme, Func(stmt))
+        function = self.make_function(stmt)
+        if stmt.name is None:
+            return function
+        if stmt.slot is None:
+            self.globals.define(stmt.name.lexeme, function)
         else:
-            return Func(stmt)
+            self.environment.slots[stmt.slot] = function
 
     def visit_print(self, stmt: Print):
         value = stmt.expression.accept(self)
-        print(self.stringify(value))
+        self.output.write(self.stringify(value) + "\n")
 
     def visit_literal(self, expr: Literal):
         return expr.value
@@ -137,7 +303,11 @@ class Interpreter:
 
     def visit_unary(self, expr: Unary):
         right = self.evaluate(expr.right)
+        if expr.__class__ is Unary:
+            specialize_unary(expr, right)
+        return self.unary(expr, right)
 
+    def unary(self, expr: Unary, right: Any):
         match expr.operator.type:
             case TokenType.MINUS:
                 self.check_number_operand(expr.operator, right)
@@ -150,13 +320,42 @@ class Interpreter:
 
     def visit_call(self, expr: Call):
         callee = self.evaluate(expr.callee)
-        arguments = [arg for arg in expr.arguments]
-        if not isinstance(callee, LoxCallable):
-            raise RuntimeError(expr.paren, "Can only call functions.")
-        if (nargs := len(arguments)) != (arity :=callee.arity()):
-            raise RuntimeError(expr.paren, f"Expected {arity} args, instead got {nargs}")
+        arguments = [arg.accept(self) for arg in expr.arguments]
+        if callee is expr.callee_cache:
+            self.call_hits += 1
+        else:
+            self.cache_callee(expr, callee)
+        if len(arguments) != expr.arity_cache:
+            raise RuntimeError(expr.paren, f"Expected {expr.arity_cache} args, instead got {len(arguments)}")
+        if callee.__class__ is Func:
+            if self.call_depth == FRAMES_MAX:
+                raise RuntimeError(expr.paren, "Stack overflow.")
+            try:
+                return callee.call(self, arguments)
+            except RecursionError:
+                # expressions nested deeper than PYTHON_FRAMES_PER_CALL allows for
+                raise RuntimeError(expr.paren, "Stack overflow.") from None
         return callee.call(self, arguments=arguments)
 
+    def cache_callee(self, expr: Call, callee: Any):
+        """Check that `callee` can be called and remember it and its arity at `expr`."""
+        self.call_misses += 1
+        if callee.__class__ is Func:
+            # Lox functions skip the protocol check and the arity() call
+            arity = callee.parameter_count
+        elif isinstance(callee, LoxCallable):
+            arity = callee.arity()
+        else:
+            raise RuntimeError(expr.paren, "Can only call functions.")
+        expr.callee_cache, expr.arity_cache = callee, arity
+
+    def cache_report(self) -> Iterator[str]:
+        """Lines with the hit rate of each kind of inline cache."""
+        for kind, hits, misses in (("global", self.global_hits, self.global_misses),
+                                   ("call", self.call_hits, self.call_misses)):
+            rate = hits / (hits + misses) if hits + misses else 0.0
+            yield f"{kind:10} {hits:12,} hits {misses:12,} misses {rate:8.1%}"
+
     def visit_logical(self, expr: Logical):
         left = self.evaluate(expr.left)
         if expr.operator.type == TokenType.OR:
@@ -168,13 +367,20 @@ class Interpreter:
 
     def visit_assign(self, expr: Assign):
         value = self.evaluate(expr.value)
-        self.environment.assign(expr.name, value)
+        if expr.depth is None:
+            self.globals.assign(expr.name, value)
+        else:
+            self.environment.assign_at(expr.depth, expr.slot, value)
         return value
 
     def visit_binary(self, expr: Binary):
         left = self.evaluate(expr.left)
         right = self.evaluate(expr.right)
+        if expr.__class__ is Binary:
+            specialize_binary(expr, left, right)
+        return self.binary(expr, left, right)
 
+    def binary(self, expr: Binary, left: Any, right: Any):
         match expr.operator.type:
             case TokenType.MINUS:
                 self.check_number_operand(expr.operator, left, right)
@@ -188,10 +394,15 @@ class Interpreter:
             case TokenType.PLUS:
                 if isinstance(left, float) and isinstance(right, float):
                     return float(left) + float(right)
-                elif isinstance(left, str) and isinstance(right, str):
-                    return str(left) + str(right)
-                elif isinstance(left, str) or isinstance(right, str):
-                    return self.stringify(left) + self.stringify(right)
+                elif isinstance(left, STRINGS) and isinstance(right, STRINGS):
+                    return concatenate(left, right)
+                elif isinstance(left, STRINGS) or isinstance(right, STRINGS):
+                    # only the side that isn't a string needs stringify
+                    if not isinstance(left, STRINGS):
+                        left = self.stringify(left)
+                    if not isinstance(right, STRINGS):
+                        right = self.stringify(right)
+                    return concatenate(left, right)
                 raise RuntimeError(expr.operator,
                                    "Operands must be two numbers or two strings")
             case TokenType.GREATER:
@@ -224,21 +435,34 @@ class Interpreter:
         return a == b
 
     def visit_return(self, stmt: Return):
-        env = self.environment
-        while env is not None:
-            if env.inside_function:
-                raise ReturnException(self.evaluate(stmt.return_expr))
-            env = env.enclosing
-        raise RuntimeError(stmt.token, "Return not inside function.")
-
+        if not stmt.inside_function:
+            raise RuntimeError(stmt.token, "Return not inside function.")
+        if stmt.tail_call:
+            call = stmt.return_expr
+            callee = self.evaluate(call.callee)
+            arguments = [arg.accept(self) for arg in call.arguments]
+            if callee is call.callee_cache:
+                self.call_hits += 1
+            else:
+                self.cache_callee(call, callee)
+            if len(arguments) != call.arity_cache:
+                raise RuntimeError(call.paren, f"Expected {call.arity_cache} args, instead got {len(arguments)}")
+            if callee.__class__ is Func:
+                self.tail_function, self.tail_arguments = callee, arguments
+                return TAIL_CALL
+            self.return_value = callee.call(self, arguments=arguments)
+            return RETURN
+        self.return_value = self.evaluate(stmt.return_expr)
+        return RETURN
 
     def visit_break(self, b: Break):
-        env = self.environment
-        while env is not None:
-            if env.inside_loop:
-                raise BreakException()
-            env = env.enclosing
-        raise RuntimeError(b.token, "Break not inside loop.")
+        if not b.inside_loop:
+            raise RuntimeError(b.token, "Break not inside loop.")
+        if b.escapes:
+            # a break in a function declared inside a loop ends whichever
+            # loop the call was made from
+            raise BreakException(b.token)
+        return BREAK
 
     def is_truthy(self, object: Any) -> bool:
         if object is None: return False
@@ -254,11 +478,123 @@ class Interpreter:
     def evaluate(self, expr: Expr):
         return expr.accept(self)
 
-    def execute_block(self, statements: List[Stmt], environment: Environment):
+    def execute_block(self, statements: List[Stmt], environment: SlotEnvironment) -> Optional[Completion]:
         previous = self.environment
         try:
             self.environment = environment
             for statement in statements:
-                self.execute(statement)
+                completion = statement.accept(self)
+                if completion is not None:
+                    return completion
         finally:
             self.environment = previous
+
+
+# Binary and Unary nodes rewrite themselves, by changing their class, the
+# first time the interpreter runs them: into a variant for the operand types
+# they were given, whose guard only checks that the types are still the same.
+# If they are not, the node turns into the generic variant for good. Other
+# visitors see the variants as plain Binary and Unary nodes.
+
+class SpecializedBinary(Binary):
+    pass
+
+
+class GenericBinary(Binary):
+    """A Binary that saw operands of more than one kind; visit_binary no longer specializes it."""
+
+
+def guarded_binary(name: str, operation: Callable[[Any, Any], Any], operand: type) -> type:
+    def accept(self, visitor):
+        if visitor.__class__ is not Interpreter:
+            return visitor.visit_binary(self)
+        left = self.left.accept(visitor)
+        right = self.right.accept(visitor)
+        if left.__class__ is operand and right.__class__ is operand:
+            return operation(left, right)
+        self.__class__ = GenericBinary
+        return visitor.binary(self, left, right)
+    return type(name, (SpecializedBinary,), {"accept": accept})
+
+
+def unguarded_binary(name: str, operation: Callable[[Any, Any], Any]) -> type:
+    # Lox equality is Python's, nil included, for operands of any type
+    def accept(self, visitor):
+        if visitor.__class__ is not Interpreter:
+            return visitor.visit_binary(self)
+        return operation(self.left.accept(visitor), self.right.accept(visitor))
+    return type(name, (SpecializedBinary,), {"accept": accept})
+
+
+NUMBER_BINARIES = {
+    TokenType.MINUS:         guarded_binary("NumberSubtract", sub, float),
+    TokenType.SLASH:         guarded_binary("NumberDivide", truediv, float),
+    TokenType.STAR:          guarded_binary("NumberMultiply", mul, float),
+    TokenType.PLUS:          guarded_binary("NumberAdd", add, float),
+    TokenType.GREATER:       guarded_binary("NumberGreater", gt, float),
+    TokenType.GREATER_EQUAL: guarded_binary("NumberGreaterEqual", ge, float),
+    TokenType.LESS:          guarded_binary("NumberLess", lt, float),
+    TokenType.LESS_EQUAL:    guarded_binary("NumberLessEqual", le, float),
+}
+EQUALITY_BINARIES = {
+    TokenType.EQUAL_EQUAL: unguarded_binary("Equal", eq),
+    TokenType.BANG_EQUAL:  unguarded_binary("NotEqual", ne),
+}
+
+
+class StringConcatenate(SpecializedBinary):
+    def accept(self, visitor):
+        if visitor.__class__ is not Interpreter:
+            return visitor.visit_binary(self)
+        left = self.left.accept(visitor)
+        right = self.right.accept(visitor)
+        if (left.__class__ is str or left.__class__ is Rope) and (right.__class__ is str or right.__class__ is Rope):
+            return concatenate(left, right)
+        self.__class__ = GenericBinary
+        return visitor.binary(self, left, right)
+
+
+def specialize_binary(expr: Binary, left: Any, right: Any):
+    specialized = EQUALITY_BINARIES.get(expr.operator.type)
+    if specialized is None:
+        if left.__class__ is float and right.__class__ is float:
+            specialized = NUMBER_BINARIES.get(expr.operator.type)
+        elif isinstance(left, STRINGS) and isinstance(right, STRINGS) and expr.operator.type == TokenType.PLUS:
+            specialized = StringConcatenate
+    expr.__class__ = specialized or GenericBinary
+
+
+class SpecializedUnary(Unary):
+    pass
+
+
+class GenericUnary(Unary):
+    """A Unary that saw an operand of more than one kind; visit_unary no longer specializes it."""
+
+
+class NumberNegate(SpecializedUnary):
+    def accept(self, visitor):
+        if visitor.__class__ is not Interpreter:
+            return visitor.visit_unary(self)
+        right = self.right.accept(visitor)
+        if right.__class__ is float:
+            return -right
+        self.__class__ = GenericUnary
+        return visitor.unary(self, right)
+
+
+class Not(SpecializedUnary):
+    def accept(self, visitor):
+        if visitor.__class__ is not Interpreter:
+            return visitor.visit_unary(self)
+        right = self.right.accept(visitor)
+        return right is None or right is False
+
+
+def specialize_unary(expr: Unary, right: Any):
+    if expr.operator.type == TokenType.BANG:
+        expr.__class__ = Not
+    elif right.__class__ is float:
+        expr.__class__ = NumberNegate
+    else:
+        expr.__class__ = GenericUnary
@@ -1,23 +1,120 @@
+import argparse
 import sys
+from pathlib import Path
+from typing import Iterable, Optional
+import ast_cache
+import bytecode
+import transpiler
 from scanner import Scanner
+from fast_scanner import FastScanner
 from util import Token, TokenType
-from parser import Parser, ParserException
-from interpreter import Interpreter
+from parser import CompactParser, Parser, ParserException, StreamingParser
+from pratt_parser import CompactPrattParser, PrattParser, StreamingPrattParser
+from interpreter import Interpreter, deep_recursion
+from closure_compiler import ClosureCompiler
+from transpiler import PythonBackend
+from vm import VM
+from resolver import Resolver
+from optimizer import Optimizer
+from purity import Purity
+from profiler import Profiler, ProfilingInterpreter
+from Stmt import Stmt
 from runtime_error import RuntimeError
 from tool.ast_printer import AstPrinter
 
 
+SCANNERS = {
+    "classic": Scanner,
+    "fast": FastScanner,
+}
+
+BACKENDS = {
+    "tree": Interpreter,
+    "closures": ClosureCompiler,
+    "python": PythonBackend,
+    "vm": VM,
+}
+
+# backends that compile the whole program before running it, and the module
+# that caches what they compile next to the script
+CACHES = {
+    "python": transpiler,
+    "vm": bytecode,
+}
+
+# (whole token list, token stream, compact tokens) parser classes
+PARSERS = {
+    "recursive": (Parser, StreamingParser, CompactParser),
+    "pratt": (PrattParser, StreamingPrattParser, CompactPrattParser),
+}
+
+
 class Lox:
     had_error: bool = False
     had_runtime_error: bool = False
+    scanner: str = "classic"
+    parser: str = "recursive"
+    backend: str = "tree"
+    stream: bool = False
+    compact_tokens: bool = False
+    ast_cache: bool = False
+    emit_py: bool = False
+    optimize: int = 0
+    memoize: bool = True
+    memo_stats: bool = False
+    cache_stats: bool = False
+    profile: bool = False
+    flamegraph: Optional[str] = None
 
     @classmethod
     def main(cls, *args):
-        if len(args) > 1:
-            print(f"Usage: {sys.argv[0]} [script]")
-            sys.exit(64)
-        elif len(args) == 1:
-            cls.run_file(args[0])
+        arg_parser = argparse.ArgumentParser(prog="lox")
+        arg_parser.add_argument("script", nargs="?")
+        arg_parser.add_argument("--scanner", choices=SCANNERS, default=cls.scanner)
+        arg_parser.add_argument("--parser", choices=PARSERS, default=cls.parser,
+                                help="expression parser: recursive descent or table driven Pratt")
+        arg_parser.add_argument("--backend", choices=BACKENDS, default=cls.backend,
+                                help="walk the syntax tree, compile it to Python closures first, "
+                                     "transpile it to a Python module or compile it to bytecode")
+        arg_parser.add_argument("--stream", action="store_true",
+                                help="execute top-level statements while the rest is still being scanned")
+        arg_parser.add_argument("--compact-tokens", action="store_true",
+                                help="keep tokens in array columns instead of Token objects (uses the fast scanner)")
+        arg_parser.add_argument("--ast-cache", action="store_true",
+                                help="cache parsed scripts in a __loxcache__ directory next to them")
+        arg_parser.add_argument("--emit-py", action="store_true",
+                                help="print the Python module the script transpiles to instead of running it")
+        arg_parser.add_argument("-O", dest="optimize", action="count", default=cls.optimize,
+                                help="fold constant expressions; given twice, also drop dead branches and loops")
+        arg_parser.add_argument("--no-memoize", dest="memoize", action="store_false", default=cls.memoize,
+                                help="don't remember the results of pure functions (tree backend only)")
+        arg_parser.add_argument("--memo-stats", action="store_true",
+                                help="print how often remembered results were used to stderr")
+        arg_parser.add_argument("--cache-stats", action="store_true",
+                                help="print the hit rates of the inline caches to stderr (tree backend only)")
+        arg_parser.add_argument("--profile", action="store_true",
+                                help="print the time spent in each Lox function and line to stderr (tree backend only)")
+        arg_parser.add_argument("--flamegraph", metavar="PATH",
+                                help="with --profile, also write the profiled stacks in collapsed format to PATH")
+        options = arg_parser.parse_args(args)
+        if (options.profile or options.flamegraph) and options.backend != "tree":
+            arg_parser.error("--profile needs the tree backend")
+        cls.scanner = options.scanner
+        cls.parser = options.parser
+        cls.backend = options.backend
+        cls.stream = options.stream
+        cls.compact_tokens = options.compact_tokens
+        cls.ast_cache = options.ast_cache
+        cls.emit_py = options.emit_py
+        cls.optimize = options.optimize
+        cls.memoize = options.memoize
+        cls.memo_stats = options.memo_stats
+        cls.cache_stats = options.cache_stats
+        cls.profile = options.profile or options.flamegraph is not None
+        cls.flamegraph = options.flamegraph
+
+        if options.script is not None:
+            cls.run_file(options.script)
         else:
             print("Running REPL")
             cls.run_prompt()
@@ -27,7 +124,11 @@ class Lox:
         with open(arg, "rb") as f:
             bytes = f.read()
 
-        cls.run(bytes.decode("utf-8"))
+        # compiled programs are always cached, parsed scripts only on request
+        compiled = cls.backend in CACHES or cls.emit_py
+        script = Path(arg)
+        cache = script.parent / "__loxcache__" / script.stem if cls.ast_cache or compiled else None
+        cls.run(bytes.decode("utf-8"), cache)
         if cls.had_error:
             sys.exit(65)
         if cls.had_runtime_error:
@@ -42,23 +143,117 @@ class Lox:
             cls.run(line)
 
     @classmethod
-    def run(cls, source: str):
+    def parse(cls, source: str, cache: Optional[Path] = None) -> Iterable[Stmt]:
+        # `cache` is where the script's cache entries go: its name in a
+        # __loxcache__ directory, to which each kind of entry adds a suffix
+        if cache is not None:
+            statements = ast_cache.load(cache, source)
+            if statements is None:
+                statements = list(cls.parse(source))
+                if not cls.had_error:
+                    ast_cache.store(cache, source, statements)
+            return statements
+        parser_class, streaming_parser_class, compact_parser_class = PARSERS[cls.parser]
+        if cls.compact_tokens:
+            return compact_parser_class(FastScanner(source, cls.error).scan_compact()).parse()
+        scanner = SCANNERS[cls.scanner](source, cls.error)
+        if cls.stream:
+            return streaming_parser_class(scanner.iter_tokens()).iter_parse()
+        tokens = scanner.scan_tokens()
+        parser = parser_class(tokens)
+        return parser.parse()
+
+    @classmethod
+    def run(cls, source: str, cache: Optional[Path] = None):
+        if cls.backend in CACHES or cls.emit_py:
+            cls.run_compiled(source, cache)
+            return
+        if cls.profile and cls.backend == "tree":
+            interpreter = ProfilingInterpreter(Profiler())
+        else:
+            interpreter = BACKENDS[cls.backend]()
+        if cls.stream and cls.backend == "tree":
+            # errors in later lines are reported while earlier ones run, so
+            # the output can't be held back until they end
+            interpreter.output.threshold = 0
         try:
-            scanner = Scanner(source, cls.error)
-            tokens = scanner.scan_tokens()
-            parser = Parser(tokens)
-            statements = parser.parse()
-            interpreter = Interpreter()
-            interpreter.interpret(statements)
+            # the front end recurses on nested expressions as the interpreter does
+            with deep_recursion():
+                statements = cls.parse(source, cache)
+                resolver = Resolver(cls.error, interpreter.globals.values)
+                if cls.stream:
+                    statements = resolver.iter_resolve(statements)
+                else:
+                    resolver.resolve(statements)
+                    if resolver.had_error:
+                        return
+                if cls.optimize:
+                    statements = Optimizer(cls.optimize).optimize(statements)
+                if cls.memoize and cls.backend == "tree" and not cls.stream:
+                    # which globals are ever reassigned is only known from the whole program
+                    statements = list(statements)
+                    Purity().analyze(statements)
+                interpreter.interpret(statements)
 
         except ParserException as parse_exception:
             cls.error(parse_exception.token, parse_exception.message)
         except RuntimeError as runtime_error:
             cls.runtime_error(runtime_error)
+        finally:
+            if cls.memo_stats and cls.backend == "tree":
+                for line in interpreter.memo.report():
+                    print(line, file=sys.stderr)
+            if cls.cache_stats and cls.backend == "tree":
+                for line in interpreter.cache_report():
+                    print(line, file=sys.stderr)
+            if cls.profile and cls.backend == "tree":
+                cls.report_profile(interpreter.profiler)
 
         if cls.had_error:
             return
 
+    @classmethod
+    def run_compiled(cls, source: str, cache: Optional[Path] = None):
+        name = "python" if cls.emit_py else cls.backend
+        backend, module = BACKENDS[name](), CACHES[name]
+        # programs compiled at different levels are cached separately
+        key = source if not cls.optimize else f"{source}\0-O{cls.optimize}"
+        compiled = cache
+        if cache is not None and cls.optimize:
+            compiled = cache.with_name(f"{cache.name}.opt-{cls.optimize}")
+        try:
+            with deep_recursion():
+                program = None if compiled is None else module.load(compiled, key)
+                if program is None:
+                    # the whole program is needed before any of it can run
+                    statements = list(cls.parse(source, cache if cls.ast_cache else None))
+                    resolver = Resolver(cls.error, backend.globals.values)
+                    resolver.resolve(statements)
+                    if resolver.had_error:
+                        return
+                    if cls.optimize:
+                        statements = list(Optimizer(cls.optimize).optimize(statements))
+                    program = backend.compile(statements)
+                    if compiled is not None and not cls.had_error:
+                        module.store(compiled, key, program)
+                if cls.emit_py:
+                    print(program, end="")
+                    return
+                backend.execute(program)
+
+        except ParserException as parse_exception:
+            cls.error(parse_exception.token, parse_exception.message)
+        except RuntimeError as runtime_error:
+            cls.runtime_error(runtime_error)
+
+    @classmethod
+    def report_profile(cls, profiler: Profiler):
+        for line in profiler.report():
+            print(line, file=sys.stderr)
+        if cls.flamegraph is not None:
+            with open(cls.flamegraph, "w") as out:
+                profiler.write_collapsed(out)
+
     @classmethod
     def error(cls, line: int | Token, message: str):
         if isinstance(line, int):
@@ -80,3 +275,7 @@ class Lox:
         print(s)
         cls.had_error = True
         return s
+
+
+if __name__ == "__main__":
+    Lox.main(*sys.argv[1:])
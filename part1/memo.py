@@ -0,0 +1,104 @@
+"""
+Remembered results of calls to pure Lox functions (see purity.py). Each
+pure declaration gets a MemoTable keyed by the argument values, kept in
+least recently used order and shared by every function value made from the
+declaration, since a pure function's result does not depend on its closure.
+The tables share one cap on their estimated size in bytes: past it, the
+table added to least recently gives up its least recently used result. A
+function whose results are seldom used again stops being remembered.
+"""
+
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Tuple
+from Stmt import FunctionStatement
+
+# what all the tables together may hold, estimated with sys.getsizeof
+MEMORY_CAP = 32 * 1024 * 1024
+# bytes a table spends on an entry besides its key and value
+ENTRY_OVERHEAD = 120
+# misses after which a function whose calls hit less often than this stops
+# being remembered
+GIVE_UP_AFTER = 2000
+GIVE_UP_HIT_RATE = 0.05
+
+
+class MemoTable:
+    __slots__ = ("name", "entries", "hits", "misses", "active")
+
+    def __init__(self, name: str):
+        self.name = name
+        # argument key -> (result, calls it took, estimated size)
+        self.entries: OrderedDict[Tuple, Tuple[Any, int, int]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.active = True
+
+
+class Memo:
+    def __init__(self, cap: int = MEMORY_CAP):
+        self.cap = cap
+        self.size = 0
+        self.evictions = 0
+        self.tables: Dict[FunctionStatement, MemoTable] = {}
+        # the tables with entries, least recently added to first
+        self.filled: OrderedDict[MemoTable, None] = OrderedDict()
+        # the deepest call depth reached by the calls whose results are
+        # being worked out, kept so that a remembered result still counts
+        # the calls it took towards the stack limit
+        self.reached = 0
+
+    def table(self, stmt: FunctionStatement) -> MemoTable:
+        table = self.tables.get(stmt)
+        if table is None:
+            name = stmt.name.lexeme if stmt.name is not None else "<anonymous>"
+            table = self.tables[stmt] = MemoTable(name)
+        return table
+
+    @staticmethod
+    def key(arguments: List[Any]) -> Tuple:
+        # true == 1 and false == 0 in Python, but not in Lox
+        return (*map(type, arguments), *arguments)
+
+    def store(self, table: MemoTable, key: Tuple, value: Any, calls: int):
+        if table.misses >= GIVE_UP_AFTER and table.hits < table.misses * GIVE_UP_HIT_RATE:
+            self.give_up(table)
+            return
+        size = ENTRY_OVERHEAD + sys.getsizeof(key) + sys.getsizeof(value) \
+            + sum(map(sys.getsizeof, key[len(key) // 2:]))
+        table.entries[key] = (value, calls, size)
+        self.size += size
+        self.filled[table] = None
+        self.filled.move_to_end(table)
+        while self.size > self.cap:
+            self.evict()
+
+    def give_up(self, table: MemoTable):
+        table.active = False
+        self.size -= sum(size for _, _, size in table.entries.values())
+        table.entries.clear()
+        self.filled.pop(table, None)
+
+    def evict(self):
+        table = next(iter(self.filled))
+        _, (_, _, size) = table.entries.popitem(last=False)
+        self.size -= size
+        self.evictions += 1
+        if not table.entries:
+            del self.filled[table]
+
+    @property
+    def hits(self) -> int:
+        return sum(table.hits for table in self.tables.values())
+
+    @property
+    def misses(self) -> int:
+        return sum(table.misses for table in self.tables.values())
+
+    def report(self) -> Iterator[str]:
+        """Lines with the hits and misses of each pure function, most called first."""
+        for table in sorted(self.tables.values(), key=lambda table: -(table.hits + table.misses)):
+            note = "" if table.active else " (gave up)"
+            yield f"{table.name:20} {table.hits:10,} hits {table.misses:10,} misses{note}"
+        yield f"{'total':20} {self.hits:10,} hits {self.misses:10,} misses " \
+              f"{self.evictions:,} evicted, {self.size:,} bytes kept"
@@ -0,0 +1,215 @@
+"""
+Optimization pass run between resolving and interpreting. Level 1 folds
+unary, binary, grouping and logical expressions whose operands are literals;
+level 2 also drops if branches and loops whose condition is a literal.
+
+Only operations that cannot fail are folded, so every runtime error is still
+raised when (and on the line where) it would have been. Code is only dropped
+if it declares nothing in the scope around it, which keeps the slots given
+out by the resolver valid without resolving again.
+"""
+
+from typing import Any, Iterable, Iterator, Optional
+from Expr import Assign, Binary, Call, Expr, Grouping, Literal, Logical, Unary, Variable
+from Stmt import Block, Break, Expression, For, FunctionStatement, If, Print, Return, Stmt, Var, While
+from util import TokenType
+
+
+def is_truthy(value: Any) -> bool:
+    return value is not None and value is not False
+
+
+def stringify(value: Any) -> str:
+    if value is None: return "nil"
+    if value.__class__ is float and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def declares(node: Any) -> bool:
+    """True if running `node` may declare a name in the scope it runs in."""
+    if isinstance(node, FunctionStatement):
+        return node.name is not None
+    if isinstance(node, Var):
+        return True
+    if isinstance(node, (Block, For)):
+        return False
+    if isinstance(node, While):
+        return declares(node.condition)
+    if isinstance(node, list):
+        return any(declares(child) for child in node)
+    if isinstance(node, (Expr, Stmt)):
+        return any(declares(child) for child in vars(node).values())
+    return False
+
+
+ARITHMETIC = {
+    TokenType.MINUS:         lambda a, b: a - b,
+    TokenType.STAR:          lambda a, b: a * b,
+    TokenType.GREATER:       lambda a, b: a > b,
+    TokenType.GREATER_EQUAL: lambda a, b: a >= b,
+    TokenType.LESS:          lambda a, b: a < b,
+    TokenType.LESS_EQUAL:    lambda a, b: a <= b,
+}
+
+
+class Optimizer:
+    def __init__(self, level: int = 1):
+        self.level = level
+
+    def optimize(self, statements: Iterable[Stmt]) -> Iterator[Stmt]:
+        for statement in statements:
+            statement = self.statement(statement)
+            if statement is not None:
+                yield statement
+
+    def statement(self, stmt: Optional[Stmt]) -> Optional[Stmt]:
+        """Return the statement to run instead of `stmt`, or None if nothing needs to run."""
+        return None if stmt is None else stmt.accept(self)
+
+    def body(self, stmt: Stmt) -> Stmt:
+        # loop and function bodies can't be left out
+        return self.statement(stmt) or Block([])
+
+    def expression(self, expr: Expr) -> Expr:
+        return expr.accept(self)
+
+    def constant(self, expr: Expr) -> bool:
+        return expr.__class__ is Literal
+
+    # statements
+
+    def visit_expression(self, stmt: Expression):
+        stmt.expression = self.expression(stmt.expression)
+        if self.level >= 2 and self.constant(stmt.expression):
+            return None
+        return stmt
+
+    def visit_print(self, stmt: Print):
+        stmt.expression = self.expression(stmt.expression)
+        return stmt
+
+    def visit_var(self, stmt: Var):
+        if stmt.initializer is not None:
+            stmt.initializer = self.expression(stmt.initializer)
+        return stmt
+
+    def visit_block(self, stmt: Block):
+        stmt.statements = list(self.optimize(stmt.statements))
+        return stmt
+
+    def visit_if(self, stmt: If):
+        stmt.condition = self.expression(stmt.condition)
+        stmt.then_branch = self.body(stmt.then_branch)
+        stmt.else_branch = self.statement(stmt.else_branch)
+        if self.level >= 2 and self.constant(stmt.condition):
+            taken, dropped = stmt.then_branch, stmt.else_branch
+            if not is_truthy(stmt.condition.value):
+                taken, dropped = dropped, taken
+            if not declares(dropped):
+                return taken
+        return stmt
+
+    def visit_while(self, stmt: While):
+        stmt.condition = self.expression(stmt.condition)
+        stmt.loop_body = self.body(stmt.loop_body)
+        if self.level >= 2 and self.constant(stmt.condition) and not is_truthy(stmt.condition.value):
+            return None
+        return stmt
+
+    def visit_for(self, stmt: For):
+        stmt.initialization = self.statement(stmt.initialization)
+        if stmt.condition is not None:
+            stmt.condition = self.expression(stmt.condition)
+        if stmt.update is not None:
+            stmt.update = self.expression(stmt.update)
+        stmt.body = self.body(stmt.body)
+        if self.level >= 2 and stmt.condition is not None and self.constant(stmt.condition):
+            if is_truthy(stmt.condition.value):
+                stmt.condition = None
+            elif self.pure(stmt.initialization):
+                return None
+        return stmt
+
+    def pure(self, stmt: Optional[Stmt]) -> bool:
+        """True if a for loop's initialization can be skipped along with the loop."""
+        if stmt is None:
+            return True
+        return isinstance(stmt, Var) and (stmt.initializer is None or self.constant(stmt.initializer))
+
+    def visit_break(self, stmt: Break):
+        return stmt
+
+    def visit_return(self, stmt: Return):
+        stmt.return_expr = self.expression(stmt.return_expr)
+        return stmt
+
+    # expressions
+
+    def visit_function_statement(self, expr: FunctionStatement):
+        if expr.body is not None:
+            expr.body = self.body(expr.body)
+        return expr
+
+    def visit_literal(self, expr: Literal):
+        return expr
+
+    def visit_grouping(self, expr: Grouping):
+        # only the parser cares about parentheses
+        return self.expression(expr.expression)
+
+    def visit_variable(self, expr: Variable):
+        return expr
+
+    def visit_assign(self, expr: Assign):
+        expr.value = self.expression(expr.value)
+        return expr
+
+    def visit_call(self, expr: Call):
+        expr.callee = self.expression(expr.callee)
+        expr.arguments = [self.expression(argument) for argument in expr.arguments]
+        return expr
+
+    def visit_logical(self, expr: Logical):
+        expr.left = self.expression(expr.left)
+        expr.right = self.expression(expr.right)
+        if not self.constant(expr.left):
+            return expr
+        # the operator gives its left operand if that decides the result
+        if is_truthy(expr.left.value) == (expr.operator.type == TokenType.OR):
+            return expr if declares(expr.right) else expr.left
+        return expr.right
+
+    def visit_unary(self, expr: Unary):
+        expr.right = self.expression(expr.right)
+        if not self.constant(expr.right):
+            return expr
+        value = expr.right.value
+        if expr.operator.type == TokenType.BANG:
+            return Literal(not is_truthy(value))
+        if value.__class__ is float:
+            return Literal(-value)
+        return expr
+
+    def visit_binary(self, expr: Binary):
+        expr.left = self.expression(expr.left)
+        expr.right = self.expression(expr.right)
+        if not (self.constant(expr.left) and self.constant(expr.right)):
+            return expr
+        a, b, operator = expr.left.value, expr.right.value, expr.operator.type
+        if operator == TokenType.EQUAL_EQUAL:
+            return Literal(a == b)
+        if operator == TokenType.BANG_EQUAL:
+            return Literal(a != b)
+        if operator == TokenType.PLUS:
+            if a.__class__ is b.__class__ and a.__class__ in (float, str):
+                return Literal(a + b)
+            if a.__class__ is str or b.__class__ is str:
+                return Literal(stringify(a) + stringify(b))
+            return expr
+        if a.__class__ is not float or b.__class__ is not float:
+            return expr
+        if operator == TokenType.SLASH:
+            # dividing by zero still fails when the program runs
+            return Literal(a / b) if b != 0 else expr
+        return Literal(ARITHMETIC[operator](a, b))
@@ -0,0 +1,56 @@
+"""
+Where the tree interpreter's print statements go. An OutputSink collects
+the printed lines and writes them out together once they add up to
+`threshold` characters, and whenever it is flushed. The interpreter
+flushes it when a program ends, including when a runtime error stops it,
+so the error is reported after everything printed before it.
+
+The sink writes to the binary or text stream it was given, such as an
+io.BytesIO to keep the output in memory. Without one it writes to
+whatever sys.stdout is at the time of the flush, through its binary
+buffer when it has one.
+"""
+
+import io
+import sys
+from typing import BinaryIO, List, Optional, TextIO
+
+# characters collected before they are written out
+BUFFER_SIZE = 1 << 18
+
+
+class OutputSink:
+    def __init__(self, stream: Optional[BinaryIO | TextIO] = None, threshold: int = BUFFER_SIZE):
+        self.stream = stream
+        # a threshold of 0 writes every line as soon as it is printed
+        self.threshold = threshold
+        self.parts: List[str] = []
+        self.size = 0
+
+    def write(self, text: str):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.threshold:
+            self.flush()
+
+    def flush(self):
+        if not self.parts:
+            return
+        text = "".join(self.parts)
+        self.parts.clear()
+        self.size = 0
+        stream = self.stream
+        if stream is None:
+            stream = sys.stdout
+            buffer = getattr(stream, "buffer", None)
+            if buffer is not None:
+                # anything already written as text goes first
+                stream.flush()
+                buffer.write(text.encode(stream.encoding or "utf-8"))
+                buffer.flush()
+                return
+        if isinstance(stream, io.TextIOBase):
+            stream.write(text)
+        else:
+            stream.write(text.encode("utf-8"))
+        stream.flush()
@@ -1,6 +1,8 @@
-from typing import List, Final
+from collections import deque
+from typing import Iterable, Iterator, List, Final
 from Expr import Assign, Binary, Call, Grouping, Literal, Unary, Variable, Logical
 from Stmt import Block, Break, If, FunctionStatement, Print, Expression, Var, For, While, Stmt, Return
+from token_buffer import TOKEN_TYPES, TokenBuffer
 from util import Token, TokenType
 
 MAX_ARGUMENTS = 255
@@ -17,12 +19,16 @@ class Parser:
         self.current: int = 0
 
     def parse(self):
-        statements = []
+        return list(self.iter_parse())
+
+    def iter_parse(self) -> Iterator[Stmt]:
         while not self.is_at_end():
-            declaration = self.declaration()
+            try:
+                declaration = self.declaration()
+            except RecursionError:
+                raise ParserException(self.peek(), "Expression nested too deeply.") from None
             if declaration is not None:
-                statements.append(declaration)
-        return statements
+                yield declaration
 
     def expression(self):
         return self.assignment()
@@ -141,8 +147,8 @@ class Parser:
         condition = self.expression()
         self.consume(TokenType.RIGHT_PAREN, "Expect ')' after condition of 'while'.")
         loop_body = self.statement()
-        # FIXME:
-        assert loop_body is not None
+        if loop_body is None:
+            raise ParserException(self.previous(), "Expect body after 'while'.")
         return While(condition, loop_body)
 
     def for_statement(self):
@@ -324,7 +330,8 @@ class Parser:
         # return False
 
     def peek(self):
-        return self.tokens[self.current]
+        # past the end, keep answering with the final (EOF) token
+        return self.tokens[min(self.current, len(self.tokens) - 1)]
 
     def advance(self):
         if not self.is_at_end():
@@ -337,3 +344,73 @@ class Parser:
                 self.advance()
                 return True
         return False
+
+
+class StreamingParser(Parser):
+    """
+    Parser that pulls tokens from an iterator (e.g. Scanner.iter_tokens())
+    through a small lookahead buffer instead of indexing a token list.
+    """
+    def __init__(self, tokens: Iterable[Token], lookahead: int = 1):
+        self.stream: Final = iter(tokens)
+        self.buffer: deque[Token] = deque()
+        self.lookahead = lookahead
+        self.last: Token | None = None
+        self.current: int = 0
+
+    def fill(self) -> bool:
+        while len(self.buffer) < self.lookahead:
+            token = next(self.stream, None)
+            if token is None:
+                break
+            self.buffer.append(token)
+        return len(self.buffer) > 0
+
+    def previous(self):
+        return self.last
+
+    def is_at_end(self) -> bool:
+        return not self.buffer and not self.fill()
+
+    def peek(self):
+        if not self.buffer and not self.fill():
+            return self.last
+        return self.buffer[0]
+
+    def advance(self):
+        if not self.is_at_end():
+            self.last = self.buffer.popleft()
+            self.current += 1
+        return self.last
+
+
+class CompactParser(Parser):
+    """
+    Parser over a TokenBuffer. Token types are compared straight from the type
+    column; Token objects are only materialized for tokens the AST keeps.
+    """
+    def __init__(self, tokens: TokenBuffer):
+        super().__init__(tokens)
+        self.types: Final = tokens.types
+        self.count: Final = len(tokens)
+
+    def previous(self):
+        return self.tokens.token(self.current - 1)
+
+    def check(self, ttype: TokenType):
+        return self.current < self.count and TOKEN_TYPES[self.types[self.current]] is ttype
+
+    def is_at_end(self) -> bool:
+        return self.current >= self.count
+
+    def peek(self):
+        return self.tokens.token(min(self.current, self.count - 1))
+
+    def match(self, *args: TokenType):
+        if self.current < self.count:
+            current_type = TOKEN_TYPES[self.types[self.current]]
+            for ttype in args:
+                if current_type is ttype:
+                    self.current += 1
+                    return True
+        return False
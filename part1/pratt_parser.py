@@ -0,0 +1,143 @@
+"""
+Table driven Pratt (precedence climbing) parser for expressions. Statements
+are still parsed by Parser; only expression() is replaced. It builds the same
+Expr nodes and raises the same errors as the recursive descent version.
+"""
+
+from typing import Callable, List, Optional
+from Expr import Assign, Binary, Call, Expr, Grouping, Literal, Logical, Unary, Variable
+from parser import CompactParser, Parser, ParserException, StreamingParser
+from token_buffer import TOKEN_TYPES
+from util import Token, TokenType
+
+# binding powers, lowest first
+NONE, ASSIGNMENT, OR, AND, EQUALITY, COMPARISON, TERM, FACTOR, UNARY, CALL = range(10)
+
+
+class PrattParser(Parser):
+    def expression(self):
+        if self.match(TokenType.FUN):
+            expr = self.parse_function()
+        else:
+            expr = self.parse_precedence(OR)
+
+        if self.match(TokenType.EQUAL):
+            equals = self.previous()
+            value = self.expression()
+            if isinstance(expr, Variable):
+                return Assign(expr.name, value)
+            raise ParserException(equals, "Invalid assignment target.")
+        return expr
+
+    def peek_type(self) -> TokenType:
+        return self.peek().type
+
+    def parse_precedence(self, precedence: int) -> Expr:
+        prefix = PREFIX_RULES[self.peek_type()._value_]
+        if prefix is None:
+            raise ParserException(self.peek(), "Expect expression.")
+        expr = prefix(self, self.advance())
+
+        while True:
+            code = self.peek_type()._value_
+            if INFIX_PRECEDENCE[code] < precedence:
+                return expr
+            expr = INFIX_RULES[code](self, expr, self.advance())
+
+    def literal(self, token: Token) -> Expr:
+        return Literal(token.literal)
+
+    def false(self, token: Token) -> Expr:
+        return Literal(False)
+
+    def true(self, token: Token) -> Expr:
+        return Literal(True)
+
+    def nil(self, token: Token) -> Expr:
+        return Literal(None)
+
+    def variable(self, token: Token) -> Expr:
+        return Variable(token)
+
+    def grouping(self, token: Token) -> Expr:
+        expr = self.expression()
+        self.consume(TokenType.RIGHT_PAREN, "Expect ')' after expression.")
+        return Grouping(expr)
+
+    def unary(self, operator: Token) -> Expr:
+        return Unary(operator, self.parse_precedence(UNARY))
+
+    def binary(self, left: Expr, operator: Token) -> Expr:
+        right = self.parse_precedence(INFIX_PRECEDENCE[operator.type._value_] + 1)
+        return Binary(left, operator, right)
+
+    def logical(self, left: Expr, operator: Token) -> Expr:
+        right = self.parse_precedence(INFIX_PRECEDENCE[operator.type._value_] + 1)
+        return Logical(left, operator, right)
+
+    def call(self, callee: Expr, token: Token) -> Expr:
+        arguments = self.parse_args()
+        paren = self.consume(TokenType.RIGHT_PAREN, "Expect ')' after function arguments.")
+        return Call(callee, paren, arguments)
+
+
+class StreamingPrattParser(PrattParser, StreamingParser):
+    pass
+
+
+class CompactPrattParser(PrattParser, CompactParser):
+    def peek_type(self) -> TokenType:
+        return TOKEN_TYPES[self.types[min(self.current, self.count - 1)]]
+
+
+def rule_table(rules: dict, default) -> List:
+    """Turn a TokenType keyed dict into a list indexed by TokenType value."""
+    table = [default] * (max(t.value for t in TokenType) + 1)
+    for ttype, rule in rules.items():
+        table[ttype.value] = rule
+    return table
+
+
+PREFIX_RULES: List[Optional[Callable]] = rule_table({
+    TokenType.NUMBER:     PrattParser.literal,
+    TokenType.STRING:     PrattParser.literal,
+    TokenType.FALSE:      PrattParser.false,
+    TokenType.TRUE:       PrattParser.true,
+    TokenType.NIL:        PrattParser.nil,
+    TokenType.IDENTIFIER: PrattParser.variable,
+    TokenType.LEFT_PAREN: PrattParser.grouping,
+    TokenType.BANG:       PrattParser.unary,
+    TokenType.MINUS:      PrattParser.unary,
+}, None)
+
+INFIX_PRECEDENCE: List[int] = rule_table({
+    TokenType.OR:            OR,
+    TokenType.AND:           AND,
+    TokenType.BANG_EQUAL:    EQUALITY,
+    TokenType.EQUAL_EQUAL:   EQUALITY,
+    TokenType.GREATER:       COMPARISON,
+    TokenType.GREATER_EQUAL: COMPARISON,
+    TokenType.LESS:          COMPARISON,
+    TokenType.LESS_EQUAL:    COMPARISON,
+    TokenType.MINUS:         TERM,
+    TokenType.PLUS:          TERM,
+    TokenType.SLASH:         FACTOR,
+    TokenType.STAR:          FACTOR,
+    TokenType.LEFT_PAREN:    CALL,
+}, NONE)
+
+INFIX_RULES: List[Optional[Callable]] = rule_table({
+    TokenType.OR:            PrattParser.logical,
+    TokenType.AND:           PrattParser.logical,
+    TokenType.BANG_EQUAL:    PrattParser.binary,
+    TokenType.EQUAL_EQUAL:   PrattParser.binary,
+    TokenType.GREATER:       PrattParser.binary,
+    TokenType.GREATER_EQUAL: PrattParser.binary,
+    TokenType.LESS:          PrattParser.binary,
+    TokenType.LESS_EQUAL:    PrattParser.binary,
+    TokenType.MINUS:         PrattParser.binary,
+    TokenType.PLUS:          PrattParser.binary,
+    TokenType.SLASH:         PrattParser.binary,
+    TokenType.STAR:          PrattParser.binary,
+    TokenType.LEFT_PAREN:    PrattParser.call,
+}, None)
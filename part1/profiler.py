@@ -0,0 +1,228 @@
+"""
+Profiler for Lox programs on the tree backend, used by `lox --profile`. A
+ProfilingInterpreter times every statement it executes and every call of a
+Lox function it makes, and a Profiler adds those times up per function and
+per source line:
+
+- calls: how often the function was called or the line executed,
+- inclusive time: everything done until it finished, counted once for
+  recursive functions and lines,
+- exclusive time: the part of that not spent in a nested call (for
+  functions) or a nested statement (for lines).
+
+It also keeps the exclusive time of every distinct stack of Lox functions,
+written out in the collapsed format read by flamegraph.pl and speedscope.
+
+Nothing is hooked unless a ProfilingInterpreter is used, so the plain
+Interpreter runs at full speed. A tail call runs in the frame of the call
+that made it, so its time is counted in the function that made it.
+"""
+
+from time import perf_counter_ns
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+from Expr import Expr
+from Stmt import Block, FunctionStatement, Stmt
+from interpreter import Completion, Func, Interpreter
+from output import OutputSink
+from util import Token
+
+# the outermost frame on every stack
+SCRIPT = "<script>"
+
+
+class Entry:
+    __slots__ = ("calls", "inclusive", "exclusive", "active")
+
+    def __init__(self):
+        self.calls = 0
+        self.inclusive = 0
+        self.exclusive = 0
+        # how many of its runs are in progress, for recursion
+        self.active = 0
+
+
+def first_line(node: Any) -> Optional[int]:
+    """The line of the first token found in `node`, or None if it has none."""
+    if isinstance(node, Token):
+        return node.line
+    if isinstance(node, list):
+        children = node
+    elif isinstance(node, (Expr, Stmt)):
+        children = vars(node).values()
+    else:
+        return None
+    for child in children:
+        line = first_line(child)
+        if line is not None:
+            return line
+    return None
+
+
+class Profiler:
+    def __init__(self):
+        self.functions: Dict[str, Entry] = {}
+        self.lines: Dict[int, Entry] = {}
+        # exclusive nanoseconds of each stack of function names, joined by ';'
+        self.stacks: Dict[str, int] = {}
+        # the functions and statements in progress, innermost last, each
+        # with the time spent so far in their nested calls or statements
+        self.function_stack: List[str] = []
+        self.function_children: List[int] = []
+        self.line_stack: List[int] = []
+        self.line_children: List[int] = []
+        self.statement_lines: Dict[Stmt, int] = {}
+        # the line of the last token numbered
+        self.last_line = 0
+
+    def number(self, node: Any):
+        """
+        Give each statement in `node` the line of its first token. A
+        statement of literals only, which has no token, gets the line of the
+        last token before it.
+        """
+        if isinstance(node, Token):
+            self.last_line = node.line
+            return
+        if isinstance(node, list):
+            children = node
+        elif isinstance(node, (Expr, Stmt)):
+            if isinstance(node, Stmt):
+                line = first_line(node)
+                self.statement_lines[node] = self.last_line if line is None else line
+            children = vars(node).values()
+        else:
+            return
+        for child in children:
+            self.number(child)
+
+    def line_of(self, stmt: Stmt) -> int:
+        line = self.statement_lines.get(stmt)
+        if line is None:
+            self.number(stmt)
+            line = self.statement_lines[stmt]
+        return line
+
+    def enter_function(self, name: str):
+        self.function_stack.append(name)
+        self.function_children.append(0)
+        entry = self.functions.get(name)
+        if entry is None:
+            entry = self.functions[name] = Entry()
+        entry.calls += 1
+        entry.active += 1
+
+    def exit_function(self, elapsed: int):
+        name = self.function_stack[-1]
+        children = self.function_children.pop()
+        entry = self.functions[name]
+        entry.exclusive += elapsed - children
+        entry.active -= 1
+        if not entry.active:
+            entry.inclusive += elapsed
+        stack = ";".join(self.function_stack)
+        self.stacks[stack] = self.stacks.get(stack, 0) + elapsed - children
+        self.function_stack.pop()
+        if self.function_children:
+            self.function_children[-1] += elapsed
+
+    def enter_line(self, line: int):
+        self.line_stack.append(line)
+        self.line_children.append(0)
+        entry = self.lines.get(line)
+        if entry is None:
+            entry = self.lines[line] = Entry()
+        entry.calls += 1
+        entry.active += 1
+
+    def exit_line(self, elapsed: int):
+        line = self.line_stack.pop()
+        children = self.line_children.pop()
+        entry = self.lines[line]
+        entry.exclusive += elapsed - children
+        entry.active -= 1
+        if not entry.active:
+            entry.inclusive += elapsed
+        if self.line_children:
+            self.line_children[-1] += elapsed
+
+    def report(self, limit: int = 20) -> Iterator[str]:
+        """Tables of the functions and of the `limit` lines that took the most exclusive time."""
+        yield f"{'function':24} {'calls':>10} {'inclusive ms':>14} {'exclusive ms':>14}"
+        for name, entry in sorted(self.functions.items(), key=lambda item: -item[1].exclusive):
+            yield f"{name:24} {entry.calls:10,} {entry.inclusive / 1e6:14,.2f} {entry.exclusive / 1e6:14,.2f}"
+        yield ""
+        yield f"{'line':>24} {'runs':>10} {'inclusive ms':>14} {'exclusive ms':>14}"
+        lines = sorted(self.lines.items(), key=lambda item: -item[1].exclusive)[:limit]
+        for line, entry in lines:
+            yield f"{line:24} {entry.calls:10,} {entry.inclusive / 1e6:14,.2f} {entry.exclusive / 1e6:14,.2f}"
+
+    def write_collapsed(self, out: TextIO):
+        """Write each stack and its exclusive time in microseconds, one per line."""
+        for stack, elapsed in sorted(self.stacks.items()):
+            if elapsed >= 1000:
+                out.write(f"{stack} {elapsed // 1000}\n")
+
+
+def function_name(stmt: FunctionStatement) -> str:
+    name = stmt.name.lexeme if stmt.name is not None else "<anonymous>"
+    return f"{name}:{first_line(stmt)}"
+
+
+class ProfilingInterpreter(Interpreter):
+    def __init__(self, profiler: Profiler, output: Optional[OutputSink] = None):
+        super().__init__(output)
+        self.profiler = profiler
+
+    def interpret(self, statements: Iterable[Stmt]):
+        profiler = self.profiler
+        profiler.enter_function(SCRIPT)
+        start = perf_counter_ns()
+        try:
+            super().interpret(self.numbered(statements))
+        finally:
+            profiler.exit_function(perf_counter_ns() - start)
+
+    def numbered(self, statements: Iterable[Stmt]) -> Iterator[Stmt]:
+        # statements may still be being parsed, with --stream
+        for statement in statements:
+            self.profiler.number(statement)
+            yield statement
+
+    def execute(self, statement: Stmt) -> Optional[Completion]:
+        # a block only runs the statements in it, which are timed themselves
+        if statement.__class__ is Block:
+            return statement.accept(self)
+        profiler = self.profiler
+        profiler.enter_line(profiler.line_of(statement))
+        start = perf_counter_ns()
+        try:
+            return statement.accept(self)
+        finally:
+            profiler.exit_line(perf_counter_ns() - start)
+
+    def execute_block(self, statements: List[Stmt], environment) -> Optional[Completion]:
+        previous = self.environment
+        try:
+            self.environment = environment
+            for statement in statements:
+                completion = self.execute(statement)
+                if completion is not None:
+                    return completion
+        finally:
+            self.environment = previous
+
+    def make_function(self, stmt: FunctionStatement) -> Func:
+        function = super().make_function(stmt)
+        # the instance attribute takes the place of Func.call for this function
+        call, name, profiler = function.call, function_name(stmt), self.profiler
+
+        def profiled_call(interpreter, arguments):
+            profiler.enter_function(name)
+            start = perf_counter_ns()
+            try:
+                return call(interpreter, arguments)
+            finally:
+                profiler.exit_function(perf_counter_ns() - start)
+
+        function.call = profiled_call
+        return function
@@ -0,0 +1,184 @@
+"""
+Purity analysis run on a whole resolved program before it is interpreted.
+Marks a FunctionStatement `pure` when a call to it can only return a value
+that depends on its arguments, so that interpreter.Func can remember the
+results. A pure function
+
+- prints nothing and assigns nothing outside of its own scopes,
+- reads no variable of an enclosing function, and only those globals that
+  the program declares once and never assigns,
+- calls only globals declared once, with a pure `fun`, and never reassigned
+  (natives such as clock are never pure),
+- declares no function of its own, since each call would return a new one,
+- and breaks only out of its own loops.
+
+Functions that call each other are taken to be pure until one of them is
+found not to be.
+"""
+
+from typing import Dict, Iterable, List, Optional, Set
+from Expr import Assign, Binary, Call, Expr, Grouping, Literal, Logical, Unary, Variable
+from Stmt import Block, Break, Expression, For, FunctionStatement, If, Print, Return, Stmt, Var, While
+
+
+class FunctionInfo:
+    __slots__ = ("stmt", "scopes", "loops", "pure", "calls", "reads")
+
+    def __init__(self, stmt: FunctionStatement):
+        self.stmt = stmt
+        # scopes opened inside the function, starting with its parameters
+        self.scopes = 1
+        self.loops = 0
+        self.pure = True
+        # the global names it calls, and those it reads otherwise
+        self.calls: Set[str] = set()
+        self.reads: Set[str] = set()
+
+
+class Purity:
+    def __init__(self):
+        self.functions: Dict[FunctionStatement, FunctionInfo] = {}
+        # the functions around the current node, innermost last
+        self.enclosing: List[FunctionInfo] = []
+        # the declarations of each global name
+        self.declarations: Dict[str, List[Var | FunctionStatement]] = {}
+        self.assigned: Set[str] = set()
+
+    def analyze(self, statements: Iterable[Stmt]):
+        self.nodes(statements)
+        constant = {name for name, declared in self.declarations.items()
+                    if len(declared) == 1 and name not in self.assigned}
+        for info in self.functions.values():
+            info.pure = info.pure and info.reads <= constant
+        changed = True
+        while changed:
+            changed = False
+            for info in self.functions.values():
+                if info.pure and not all(self.pure_global(name, constant) for name in info.calls):
+                    info.pure = False
+                    changed = True
+        for stmt, info in self.functions.items():
+            stmt.pure = info.pure
+
+    def pure_global(self, name: str, constant: Set[str]) -> bool:
+        if name not in constant:
+            return False
+        declaration = self.declarations[name][0]
+        return isinstance(declaration, FunctionStatement) and self.functions[declaration].pure
+
+    def node(self, node: Optional[Expr | Stmt]):
+        if node is not None:
+            node.accept(self)
+
+    def nodes(self, nodes: Iterable[Optional[Expr | Stmt]]):
+        for node in nodes:
+            self.node(node)
+
+    def impure(self):
+        if self.enclosing:
+            self.enclosing[-1].pure = False
+
+    def local(self, depth: Optional[int]) -> bool:
+        """True if a reference with this depth is to the innermost function's own variable."""
+        return depth is not None and bool(self.enclosing) and depth < self.enclosing[-1].scopes
+
+    def scoped(self, nodes: Iterable[Optional[Expr | Stmt]], loop: bool = False):
+        """Analyze `nodes` in a new scope, as the resolver does."""
+        info = self.enclosing[-1] if self.enclosing else None
+        if info is not None:
+            info.scopes += 1
+            info.loops += loop
+        self.nodes(nodes)
+        if info is not None:
+            info.scopes -= 1
+            info.loops -= loop
+
+    # statements
+
+    def visit_expression(self, stmt: Expression):
+        self.node(stmt.expression)
+
+    def visit_print(self, stmt: Print):
+        self.impure()
+        self.node(stmt.expression)
+
+    def visit_var(self, stmt: Var):
+        self.node(stmt.initializer)
+        if stmt.slot is None:
+            self.declarations.setdefault(stmt.name.lexeme, []).append(stmt)
+
+    def visit_block(self, stmt: Block):
+        self.scoped(stmt.statements)
+
+    def visit_if(self, stmt: If):
+        self.node(stmt.condition)
+        self.node(stmt.then_branch)
+        self.node(stmt.else_branch)
+
+    def visit_while(self, stmt: While):
+        self.node(stmt.condition)
+        self.scoped([stmt.loop_body], loop=True)
+
+    def visit_for(self, stmt: For):
+        self.scoped([stmt.initialization, stmt.condition, stmt.update, stmt.body], loop=True)
+
+    def visit_break(self, stmt: Break):
+        if not self.enclosing or not self.enclosing[-1].loops:
+            self.impure()
+
+    def visit_return(self, stmt: Return):
+        self.node(stmt.return_expr)
+
+    # expressions
+
+    def visit_function_statement(self, stmt: FunctionStatement):
+        self.impure()
+        if stmt.name is not None and stmt.slot is None:
+            self.declarations.setdefault(stmt.name.lexeme, []).append(stmt)
+        info = self.functions[stmt] = FunctionInfo(stmt)
+        self.enclosing.append(info)
+        self.node(stmt.body)
+        self.enclosing.pop()
+
+    def visit_variable(self, expr: Variable):
+        if not self.enclosing or self.local(expr.depth):
+            return
+        if expr.depth is None:
+            self.enclosing[-1].reads.add(expr.name.lexeme)
+        else:
+            self.impure()
+
+    def visit_assign(self, expr: Assign):
+        self.node(expr.value)
+        if expr.depth is None:
+            self.assigned.add(expr.name.lexeme)
+        if not self.local(expr.depth):
+            self.impure()
+
+    def visit_call(self, expr: Call):
+        callee = expr.callee
+        if callee.__class__ is Variable and callee.depth is None:
+            if self.enclosing:
+                self.enclosing[-1].calls.add(callee.name.lexeme)
+        else:
+            # a local or computed callee could be any function
+            self.impure()
+            self.node(callee)
+        self.nodes(expr.arguments)
+
+    def visit_binary(self, expr: Binary):
+        self.node(expr.left)
+        self.node(expr.right)
+
+    def visit_logical(self, expr: Logical):
+        self.node(expr.left)
+        self.node(expr.right)
+
+    def visit_grouping(self, expr: Grouping):
+        self.node(expr.expression)
+
+    def visit_literal(self, expr: Literal):
+        pass
+
+    def visit_unary(self, expr: Unary):
+        self.node(expr.right)
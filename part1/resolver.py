@@ -0,0 +1,224 @@
+"""
+Static resolution pass run between parsing and interpreting. Annotates every
+Variable and Assign with the number of environments between the use and the
+declaration (`depth`) and the declaration's index in that environment
+(`slot`). A depth of None means the name is a global and is looked up by name.
+Declarations get their slot, and every node that opens a scope gets the
+number of slots its environment needs (`slot_count`). Break and Return are
+marked with whether a loop or function encloses them, so that misplaced
+ones fail without searching the environments when they run. A Break whose
+loop is outside its function `escapes` it, to end whichever loop the call
+was made from; if no loop is running then, it fails when it runs. A Return
+of a call that nothing in the function runs after is marked `tail_call`. Scopes with a
+variable used by a function declared inside them are marked `captured`: an
+environment for such a scope may outlive the run of the scope that made it.
+
+The scopes opened here mirror the environments the interpreter creates: one
+per Block, one per while iteration, one for a whole for loop and one for the
+parameters of a function call.
+"""
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from Expr import Assign, Binary, Call, Expr, Grouping, Literal, Logical, Unary, Variable
+from Stmt import Block, Break, Expression, For, FunctionStatement, If, Print, Return, Stmt, Var, While
+from util import Token
+
+
+class Resolver:
+    def __init__(self, error_handler: Callable[[Token, str], None], globals: Iterable[str] = ()):
+        self.error = error_handler
+        self.had_error = False
+        # innermost scope last; each maps a name to its slot
+        self.scopes: List[Dict[str, int]] = []
+        # whether each scope has a variable used by a nested function
+        self.captured: List[bool] = []
+        # the index in self.scopes of each enclosing function's parameter scope
+        self.function_scopes: List[int] = []
+        # global names declared so far
+        self.globals = set(globals)
+        self.function_depth = 0
+        # loops around the current node, including those outside its function
+        self.loop_depth = 0
+        # the loop depth at the start of each enclosing function
+        self.function_loops: List[int] = []
+
+    def resolve(self, statements: Iterable[Stmt]):
+        for statement in statements:
+            self.resolve_statement(statement)
+
+    def iter_resolve(self, statements: Iterable[Stmt]) -> Iterator[Stmt]:
+        """Resolve statements one at a time, stopping at the first one with an error."""
+        for statement in statements:
+            self.resolve_statement(statement)
+            if self.had_error:
+                return
+            yield statement
+
+    def resolve_statement(self, statement: Stmt):
+        try:
+            self.resolve_node(statement)
+        except RecursionError:
+            # left in the middle of the statement; a top-level one starts
+            # and ends outside every scope
+            self.scopes.clear()
+            self.captured.clear()
+            self.function_scopes.clear()
+            self.function_loops.clear()
+            self.function_depth = self.loop_depth = 0
+            self.report(first_token(statement), "Expression nested too deeply.")
+
+    def resolve_node(self, node: Optional[Expr | Stmt]):
+        if node is not None:
+            node.accept(self)
+
+    def report(self, token: Token, message: str):
+        self.had_error = True
+        self.error(token, message)
+
+    def begin_scope(self):
+        self.scopes.append({})
+        self.captured.append(False)
+
+    def end_scope(self, node: Block | While | For | FunctionStatement):
+        # the environment for this scope is allocated with this many slots
+        node.slot_count = len(self.scopes.pop())
+        node.captured = self.captured.pop()
+
+    def declare(self, name: Token) -> Optional[int]:
+        """Declare `name` in the innermost scope and return its slot, or None for a global."""
+        if not self.scopes:
+            self.globals.add(name.lexeme)
+            return None
+        scope = self.scopes[-1]
+        if name.lexeme in scope:
+            self.report(name, "Already a variable with this name in this scope.")
+            return scope[name.lexeme]
+        slot = scope[name.lexeme] = len(scope)
+        return slot
+
+    def resolve_local(self, expr: Variable | Assign, message: str):
+        name = expr.name.lexeme
+        for depth, scope in enumerate(reversed(self.scopes)):
+            slot = scope.get(name)
+            if slot is not None:
+                expr.depth = depth
+                expr.slot = slot
+                index = len(self.scopes) - 1 - depth
+                if self.function_scopes and index < self.function_scopes[-1]:
+                    self.captured[index] = True
+                return
+        expr.depth = expr.slot = None
+        # code inside a function may run after the global has been defined
+        if self.function_depth == 0 and name not in self.globals:
+            self.report(expr.name, message)
+
+    def visit_block(self, stmt: Block):
+        self.begin_scope()
+        self.resolve(stmt.statements)
+        self.end_scope(stmt)
+
+    def visit_var(self, stmt: Var):
+        # the initializer is evaluated before the name is defined, so it sees
+        # any outer variable with the same name
+        self.resolve_node(stmt.initializer)
+        stmt.slot = self.declare(stmt.name)
+
+    def visit_function_statement(self, stmt: FunctionStatement):
+        if stmt.name is not None:
+            stmt.slot = self.declare(stmt.name)
+        self.function_depth += 1
+        self.function_scopes.append(len(self.scopes))
+        self.function_loops.append(self.loop_depth)
+        self.begin_scope()
+        for parameter in stmt.parameters:
+            self.declare(parameter)
+        self.resolve_node(stmt.body)
+        self.end_scope(stmt)
+        self.function_scopes.pop()
+        self.function_loops.pop()
+        self.function_depth -= 1
+
+    def visit_expression(self, stmt: Expression):
+        self.resolve_node(stmt.expression)
+
+    def visit_print(self, stmt: Print):
+        self.resolve_node(stmt.expression)
+
+    def visit_if(self, stmt: If):
+        self.resolve_node(stmt.condition)
+        self.resolve_node(stmt.then_branch)
+        self.resolve_node(stmt.else_branch)
+
+    def visit_while(self, stmt: While):
+        self.resolve_node(stmt.condition)
+        self.begin_scope()
+        self.loop_depth += 1
+        self.resolve_node(stmt.loop_body)
+        self.loop_depth -= 1
+        self.end_scope(stmt)
+
+    def visit_for(self, stmt: For):
+        # the whole for loop, not just its body, runs inside the loop's scope
+        self.begin_scope()
+        self.loop_depth += 1
+        self.resolve_node(stmt.initialization)
+        self.resolve_node(stmt.condition)
+        self.resolve_node(stmt.update)
+        self.resolve_node(stmt.body)
+        self.loop_depth -= 1
+        self.end_scope(stmt)
+
+    def visit_break(self, stmt: Break):
+        stmt.inside_loop = self.loop_depth > 0
+        stmt.escapes = stmt.inside_loop and bool(self.function_loops) \
+            and self.loop_depth == self.function_loops[-1]
+
+    def visit_return(self, stmt: Return):
+        stmt.inside_function = self.function_depth > 0
+        # a loop around the return could still catch a break from the call
+        stmt.tail_call = stmt.inside_function and isinstance(stmt.return_expr, Call) \
+            and self.loop_depth == self.function_loops[-1]
+        self.resolve_node(stmt.return_expr)
+
+    def visit_variable(self, expr: Variable):
+        self.resolve_local(expr, f"Undefined variable {expr.name.lexeme}.")
+
+    def visit_assign(self, expr: Assign):
+        self.resolve_node(expr.value)
+        self.resolve_local(expr, f"Undefined variable '{expr.name.lexeme}'.")
+
+    def visit_binary(self, expr: Binary):
+        self.resolve_node(expr.left)
+        self.resolve_node(expr.right)
+
+    def visit_logical(self, expr: Logical):
+        self.resolve_node(expr.left)
+        self.resolve_node(expr.right)
+
+    def visit_grouping(self, expr: Grouping):
+        self.resolve_node(expr.expression)
+
+    def visit_literal(self, expr: Literal):
+        pass
+
+    def visit_unary(self, expr: Unary):
+        self.resolve_node(expr.right)
+
+    def visit_call(self, expr: Call):
+        self.resolve_node(expr.callee)
+        for argument in expr.arguments:
+            self.resolve_node(argument)
+
+
+def first_token(node: Stmt) -> Optional[Token]:
+    """The first token in `node`, found without recursing, since it may be nested too deeply for that."""
+    nodes: List[Any] = [node]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, Token):
+            return node
+        if isinstance(node, list):
+            nodes.extend(reversed(node))
+        elif isinstance(node, (Expr, Stmt)):
+            nodes.extend(reversed(vars(node).values()))
+    return None
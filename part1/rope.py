@@ -0,0 +1,66 @@
+"""
+Lazy string concatenation for the tree interpreter. Joining Lox strings
+whose result is long makes a Rope holding the two parts instead of copying
+them, so building a string piece by piece takes linear time. A Rope is only
+turned into one str, once, when something needs its characters: printing,
+comparing or hashing it. It compares and hashes like that str, so Lox code
+can't tell the two apart.
+"""
+
+from typing import Any, List, Optional
+
+# results shorter than this are copied at once; a Rope costs more than that
+ROPE_MIN = 1024
+
+
+class Rope:
+    __slots__ = ("left", "right", "length", "flat")
+
+    def __init__(self, left: "str | Rope", right: "str | Rope"):
+        self.left: "str | Rope | None" = left
+        self.right: "str | Rope | None" = right
+        self.length = len(left) + len(right)
+        self.flat: Optional[str] = None
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __str__(self) -> str:
+        if self.flat is None:
+            # a rope built in a loop is as deep as the loop is long, so it
+            # is walked with a stack rather than recursively
+            pieces: List[str] = []
+            stack: List[str | Rope] = [self]
+            while stack:
+                node = stack.pop()
+                if node.__class__ is str:
+                    pieces.append(node)
+                elif node.flat is not None:
+                    pieces.append(node.flat)
+                else:
+                    stack.append(node.right)
+                    stack.append(node.left)
+            self.flat = "".join(pieces)
+            self.left = self.right = None
+        return self.flat
+
+    def __eq__(self, other: Any) -> bool:
+        if other.__class__ is Rope or other.__class__ is str:
+            return len(other) == self.length and str(other) == str(self)
+        return False
+
+    def __ne__(self, other: Any) -> bool:
+        return not self == other
+
+    def __hash__(self) -> int:
+        return hash(str(self))
+
+    def __sizeof__(self) -> int:
+        # counts the characters too, for memo.Memo's size estimates
+        return object.__sizeof__(self) + self.length
+
+
+def concatenate(left: "str | Rope", right: "str | Rope") -> "str | Rope":
+    if left.__class__ is str and right.__class__ is str and len(left) + len(right) < ROPE_MIN:
+        return left + right
+    return Rope(left, right)
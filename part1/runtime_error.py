@@ -6,8 +6,10 @@ class RuntimeError(Exception):
         self.message = message
 
 class BreakException(Exception):
-    def __init__(self):
-        pass
+    """A break out of the function it is in, to the loop the call was made from."""
+    def __init__(self, token: Token):
+        # reported if no running loop catches it
+        self.token: Final[Token] = token
 
 class ReturnException(Exception):
     def __init__(self, return_value: Any):
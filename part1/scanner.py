@@ -4,9 +4,29 @@ Scanner implementation in Python
 
 # TODO: test the implementation
 
-from typing import Any, Callable, List, Optional
+from typing import Any, Callable, Iterator, List, Optional
 from util import Token, TokenType
 
+RESERVED_KEYWORDS = {
+    "and":    TokenType.AND,
+    "class":  TokenType.CLASS,
+    "else":   TokenType.ELSE,
+    "false":  TokenType.FALSE,
+    "fun":    TokenType.FUN,
+    "if":     TokenType.IF,
+    "nil":    TokenType.NIL,
+    "or":     TokenType.OR,
+    "print":  TokenType.PRINT,
+    "return": TokenType.RETURN,
+    "super":  TokenType.SUPER,
+    "this":   TokenType.THIS,
+    "true":   TokenType.TRUE,
+    "var":    TokenType.VAR,
+    "while":  TokenType.WHILE,
+    "for":  TokenType.FOR,
+    "break":  TokenType.BREAK,
+}
+
 
 class Scanner:
     def __init__(self, source: str, error_handler: Callable[[int, str], None]):
@@ -17,29 +37,11 @@ class Scanner:
         self.line = 1
         self.error = error_handler
 
-        self.reserved_keywords_map = {
-            # Keywords,
-            "and":    TokenType.AND,
-            "class":  TokenType.CLASS,
-            "else":   TokenType.ELSE,
-            "false":  TokenType.FALSE,
-            "fun":    TokenType.FUN,
-            "if":     TokenType.IF,
-            "nil":    TokenType.NIL,
-            "or":     TokenType.OR,
-            "print":  TokenType.PRINT,
-            "return": TokenType.RETURN,
-            "super":  TokenType.SUPER,
-            "this":   TokenType.THIS,
-            "true":   TokenType.TRUE,
-            "var":    TokenType.VAR,
-            "while":  TokenType.WHILE,
-            "for":  TokenType.FOR,
-            "break":  TokenType.BREAK,
-        }
+        self.reserved_keywords_map = RESERVED_KEYWORDS
 
     def scan_tokens(self) -> List[Token]:
         while not self.is_at_end():
+            self.start = self.current
             self.scan_token()
             # if start is None:
             #     break
@@ -47,6 +49,18 @@ class Scanner:
         self.tokens.append(Token(TokenType.EOF, "", None, self.line + 1))
         return self.tokens
 
+    def iter_tokens(self) -> Iterator[Token]:
+        # tokens are handed out as soon as they are scanned, so self.tokens
+        # never holds more than the current lexeme's worth
+        while not self.is_at_end():
+            self.start = self.current
+            self.scan_token()
+            if self.tokens:
+                yield from self.tokens
+                self.tokens.clear()
+
+        yield Token(TokenType.EOF, "", None, self.line + 1)
+
     def is_at_end(self):
         return self.current >= len(self.source)
 
@@ -129,6 +143,7 @@ class Scanner:
 
         if self.is_at_end():
             self.error(self.line, "Unterminated string")
+            return
 
         # move past the closing "
         self.advance()
@@ -0,0 +1,48 @@
+"""
+Runs many Lox scripts in one asyncio event loop. Each script gets its own
+vm.VM, which stops at a loop's back-edge or a call once its time slice is
+used up and is put back at the end of the event loop's queue, so a long
+loop can't hold up the other scripts. A script that calls sleep() is parked
+with asyncio.sleep() until it is due again.
+"""
+
+import asyncio
+import time
+from typing import Iterable, List, Optional
+from bytecode import Function
+from parser import Parser, ParserException
+from resolver import Resolver
+from scanner import Scanner
+from util import Token, TokenType
+from vm import VM, Closure
+
+
+def compile_script(source: str, vm: VM) -> Function:
+    """Compile `source` for `vm`, raising ParserException at the first error."""
+    def error(where: int | Token, message: str):
+        if isinstance(where, int):
+            where = Token(TokenType.EOF, "", None, where)
+        raise ParserException(where, message)
+    statements = Parser(Scanner(source, error).scan_tokens()).parse()
+    Resolver(error, vm.globals.values).resolve(statements)
+    return vm.compile(statements)
+
+
+class Scheduler:
+    def __init__(self, time_slice: float = 0.002):
+        # seconds a script may run before the next one gets a turn
+        self.time_slice = time_slice
+
+    async def run(self, source: str):
+        """Compile and run one script, raising its ParserException or RuntimeError."""
+        vm = VM()
+        script = compile_script(source, vm)
+        vm.load(script)
+        vm.start(Closure(script, []))
+        while (wake := vm.resume(time.monotonic() + self.time_slice)) is not None:
+            # a zero delay still lets every other ready script go first
+            await asyncio.sleep(max(0.0, wake - time.monotonic()))
+
+    async def run_all(self, sources: Iterable[str]) -> List[Optional[BaseException]]:
+        """Run the scripts together; the result has the error each one ended with, or None."""
+        return await asyncio.gather(*(self.run(source) for source in sources), return_exceptions=True)
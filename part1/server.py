@@ -0,0 +1,313 @@
+"""
+A long-running Lox server, so that running a script doesn't pay for starting
+Python, importing the interpreter and, for a script run before, scanning,
+parsing and resolving it again.
+
+    python server.py serve SOCKET [--workers N] [--cache-size N] [--preload SCRIPT ...]
+    python server.py run SOCKET [SCRIPT]
+
+The server listens on a Unix domain socket. A client sends one request, a
+line of JSON naming a script by {"path": ...} or giving its {"source": ...},
+and gets back lines of JSON: {"output": ...} as the script prints, then
+{"status": ...}, the exit status `lox` would have had. Every request runs in
+a fresh tree Interpreter on a Program kept in a ProgramCache, keyed by a hash
+of the source. Running a program leaves state in its nodes: the inline
+caches of global Variables and of Calls hold the last run's values, and
+Binary and Unary nodes specialize on the operand types they saw. The caches
+are cleared after every request, so that a program doesn't keep the values
+of a finished run alive or hand them to the next; the specializations hold
+no values and are kept.
+
+With --workers the server forks that many processes to accept requests.
+The scripts given with --preload are parsed beforehand and gc.freeze() is
+called before forking, so the collector in the workers doesn't touch their
+syntax trees. The pages of a tree stay shared until a worker runs it:
+running writes to the nodes, reference counts included, so a worker ends up
+with its own copy of the parts of the programs it has run.
+"""
+
+import argparse
+import contextlib
+import gc
+import hashlib
+import io
+import json
+import os
+import signal
+import socket
+import sys
+import traceback
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, TextIO
+
+from interpreter import Interpreter, deep_recursion
+from lox import Lox
+from optimizer import Optimizer
+from parser import ParserException
+from purity import Purity
+from resolver import Resolver
+from runtime_error import RuntimeError
+from Expr import EMPTY, Call, Expr, Variable
+from Stmt import Stmt
+
+# programs kept parsed
+CACHE_SIZE = 256
+# characters a script prints before they are sent to the client
+STREAM_SIZE = 8192
+# connections waiting to be accepted
+BACKLOG = 64
+
+
+class Program:
+    """Resolved statements, and the nodes with inline caches in them, to clear after each run."""
+
+    def __init__(self, statements: List[Stmt]):
+        self.statements = statements
+        self.variables: List[Variable] = []
+        self.calls: List[Call] = []
+        # a list rather than recursion, for deeply nested expressions
+        nodes: List[Any] = list(statements)
+        while nodes:
+            node = nodes.pop()
+            if isinstance(node, list):
+                nodes.extend(node)
+            elif isinstance(node, (Expr, Stmt)):
+                if isinstance(node, Variable):
+                    if node.depth is None:
+                        self.variables.append(node)
+                elif isinstance(node, Call):
+                    self.calls.append(node)
+                nodes.extend(vars(node).values())
+
+    def clear_caches(self):
+        for variable in self.variables:
+            variable.cache_version, variable.cache_value = -1, None
+        for call in self.calls:
+            call.callee_cache, call.arity_cache = EMPTY, 0
+
+
+class ProgramCache:
+    def __init__(self, capacity: int = CACHE_SIZE):
+        self.capacity = capacity
+        # hash of the source -> its program, least recently used first
+        self.programs: OrderedDict[bytes, Program] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # every Interpreter starts with the same native functions
+        self.globals = list(Interpreter().globals.values)
+
+    def compile(self, source: str) -> Optional[Program]:
+        """The program of `source`, ready to run, or None after reporting its errors through Lox.error."""
+        key = hashlib.sha256(source.encode("utf-8")).digest()
+        program = self.programs.get(key)
+        if program is not None:
+            self.programs.move_to_end(key)
+            self.hits += 1
+            return program
+        self.misses += 1
+        # nested as deeply as Lox.run allows
+        with deep_recursion():
+            try:
+                statements = list(Lox.parse(source))
+            except ParserException as parse_exception:
+                Lox.error(parse_exception.token, parse_exception.message)
+                return None
+            if Lox.had_error:
+                return None
+            resolver = Resolver(Lox.error, self.globals)
+            resolver.resolve(statements)
+            if resolver.had_error:
+                return None
+            if Lox.optimize:
+                statements = list(Optimizer(Lox.optimize).optimize(statements))
+            if Lox.memoize:
+                Purity().analyze(statements)
+        # programs with errors aren't kept, so that they are reported every time
+        program = self.programs[key] = Program(statements)
+        if len(self.programs) > self.capacity:
+            self.programs.popitem(last=False)
+        return program
+
+
+class FrameWriter(io.TextIOBase):
+    """A text stream sending what is written to it to the client as output frames."""
+
+    def __init__(self, connection: socket.socket):
+        self.connection = connection
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if text:
+            # unbuffered: what is printed is held back by the OutputSink
+            self.connection.sendall(json.dumps({"output": text}).encode("utf-8") + b"\n")
+        return len(text)
+
+    def finish(self, status: int):
+        self.connection.sendall(json.dumps({"status": status}).encode("utf-8") + b"\n")
+
+
+class Server:
+    def __init__(self, path: str, capacity: int = CACHE_SIZE):
+        self.path = path
+        self.programs = ProgramCache(capacity)
+        self.listener: Optional[socket.socket] = None
+
+    def listen(self):
+        # a socket file left behind by a server that is gone
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen(BACKLOG)
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.path)
+
+    def serve_forever(self):
+        while True:
+            connection, _ = self.listener.accept()
+            with connection:
+                self.handle(connection)
+
+    def handle(self, connection: socket.socket):
+        """Read one request from `connection` and run it, sending back its output and status."""
+        out = FrameWriter(connection)
+        with connection.makefile("rb") as reader:
+            try:
+                status = self.run(json.loads(reader.readline()), out)
+            except OSError:
+                # the client went away
+                return
+            except Exception:
+                out.write(traceback.format_exc())
+                status = 70
+            with contextlib.suppress(OSError):
+                out.finish(status)
+
+    def run(self, request: Dict[str, Any], out: TextIO) -> int:
+        """Run the script of `request` with its output going to `out`, returning its exit status."""
+        with contextlib.redirect_stdout(out):
+            Lox.had_error = Lox.had_runtime_error = False
+            if "path" in request:
+                try:
+                    with open(request["path"], "rb") as f:
+                        source = f.read().decode("utf-8")
+                except OSError as error:
+                    print(f"Can't open {request['path']}: {error.strerror}.")
+                    return 66
+            else:
+                source = request["source"]
+            program = self.programs.compile(source)
+            if program is None:
+                return 65
+            interpreter = Interpreter()
+            interpreter.output.threshold = STREAM_SIZE
+            try:
+                interpreter.interpret(program.statements)
+            except RuntimeError as runtime_error:
+                Lox.runtime_error(runtime_error)
+                return 70
+            finally:
+                program.clear_caches()
+        return 0
+
+
+def serve(path: str, workers: int = 0, capacity: int = CACHE_SIZE, preload: List[str] = ()):
+    """Serve requests on the socket at `path` until interrupted, in `workers` forked processes or, with 0, in this one."""
+    server = Server(path, capacity)
+    for script in preload:
+        with open(script, "rb") as f:
+            if server.programs.compile(f.read().decode("utf-8")) is None:
+                sys.exit(65)
+    server.listen()
+    # stopping with the socket closed and the workers stopped too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # everything made so far, the preloaded programs above all, is left out
+    # of collections from now on; in a forked worker a collection touching
+    # them would copy the pages they are in
+    gc.freeze()
+    if not workers:
+        try:
+            server.serve_forever()
+        finally:
+            server.close()
+        return
+
+    children = []
+    try:
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    server.serve_forever()
+                finally:
+                    os._exit(0)
+            children.append(pid)
+        for pid in children:
+            os.waitpid(pid, 0)
+    finally:
+        for pid in children:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+        server.close()
+
+
+def send(connection: socket.socket, request: Dict[str, Any]):
+    connection.sendall(json.dumps(request).encode("utf-8") + b"\n")
+
+
+def receive(connection: socket.socket, out: TextIO) -> int:
+    """Write the output sent back on `connection` to `out` as it arrives, returning the exit status."""
+    with connection.makefile("rb") as reader:
+        for line in reader:
+            frame = json.loads(line)
+            if "status" in frame:
+                return frame["status"]
+            out.write(frame["output"])
+            out.flush()
+    raise ConnectionError("the server closed the connection before the script ended")
+
+
+def request(path: str, request: Dict[str, Any], out: TextIO = sys.stdout) -> int:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        send(connection, request)
+        return receive(connection, out)
+
+
+def main(*args: str):
+    arg_parser = argparse.ArgumentParser(prog="server")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    serving = commands.add_parser("serve", help="run scripts sent to the socket")
+    serving.add_argument("socket")
+    serving.add_argument("--workers", type=int, default=0,
+                         help="fork this many processes to serve requests instead of serving them in this one")
+    serving.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="the number of parsed programs kept")
+    serving.add_argument("--preload", nargs="+", default=[], metavar="SCRIPT",
+                         help="parse these scripts before forking, to share them between the workers")
+    serving.add_argument("-O", dest="optimize", action="count", default=Lox.optimize)
+    serving.add_argument("--no-memoize", dest="memoize", action="store_false", default=Lox.memoize)
+    running = commands.add_parser("run", help="run a script on a server")
+    running.add_argument("socket")
+    running.add_argument("script", nargs="?", help="the script to run; read from stdin if not given")
+    options = arg_parser.parse_args(args)
+
+    if options.command == "serve":
+        Lox.optimize = options.optimize
+        Lox.memoize = options.memoize
+        with contextlib.suppress(KeyboardInterrupt):
+            serve(options.socket, options.workers, options.cache_size, options.preload)
+    elif options.script is not None:
+        sys.exit(request(options.socket, {"path": os.path.abspath(options.script)}))
+    else:
+        sys.exit(request(options.socket, {"source": sys.stdin.read()}))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -1,8 +1,35 @@
+import asyncio
+import io
 import logging
+import socket
+import sys
 import pytest
-from lox import Lox
+import ast_cache
+import bytecode
+from lox import BACKENDS, Lox
 from scanner import Scanner
+from environment import SlotEnvironment
+from fast_scanner import FastScanner
+from incremental import IncrementalParser
+from parser import CompactParser, Parser, ParserException, StreamingParser
+from pratt_parser import CompactPrattParser, PrattParser
+from interpreter import GenericBinary, Interpreter, Not
+from memo import Memo
+from optimizer import Optimizer
+from output import OutputSink
+from profiler import Profiler, ProfilingInterpreter
+from purity import Purity
+from resolver import Resolver
+from rope import ROPE_MIN, Rope, concatenate
+from runtime_error import RuntimeError
+from Expr import EMPTY, Binary, Unary, Variable
+from Stmt import If, Print
 from util import Token, TokenType
+from scheduler import Scheduler
+from server import ProgramCache, Server, receive, send as server_send
+from vm import CHECK_INTERVAL, VM, Closure
+from bench import runner
+from bench.suite import SUITE
 
 @pytest.fixture
 def error_handler():
@@ -10,6 +37,12 @@ def error_handler():
     return f
 
 
+@pytest.fixture(params=BACKENDS)
+def backend(request, monkeypatch):
+    monkeypatch.setattr(Lox, "backend", request.param)
+    return request.param
+
+
 @pytest.fixture
 def expect_error_handler():
     def expect_error(*args):
@@ -96,7 +129,781 @@ def test_scan_simple_program(error_handler):
     for token, exp_token_type in zip(tokens, EXPECTED_TOKENS):
         assert token.type == exp_token_type
 
-def test_execute_simple_program():
+def test_scan_tokens_after_newline_and_comment(error_handler):
+    program = "var a = 1;\nprint a;\n// comment\nprint a;"
+    tokens = Scanner(program, error_handler).scan_tokens()
+    assert [t.type for t in tokens if t.line in (2, 4)] == [
+        TokenType.PRINT, TokenType.IDENTIFIER, TokenType.SEMICOLON,
+        TokenType.PRINT, TokenType.IDENTIFIER, TokenType.SEMICOLON,
+    ]
+    assert tokens[5].lexeme == "print"
+
+def test_fast_scanner_matches_scanner(error_handler):
+    program = \
+    """
+    // comment line
+    fun add(a, b) { return a + b; }
+    var s = "multi
+    line";
+    print add(1.5, 2) >= 3 and s != nil or !false;
+    while (x <= 10) { x = x - 1 / 2 * 3; if (x == 0) break; }
+    print 12.foo;
+    """
+    expected = Scanner(program, error_handler).scan_tokens()
+    actual = FastScanner(program, error_handler).scan_tokens()
+    assert [(t.type, t.lexeme, t.literal, t.line) for t in actual] == \
+        [(t.type, t.lexeme, t.literal, t.line) for t in expected]
+
+def test_fast_scanner_reports_errors():
+    errors = []
+    handler = lambda line, message: errors.append((line, message))
+    FastScanner("print ~3;\nprint \"oops", handler).scan_tokens()
+    assert errors == [(1, "Issue parsing character ~"), (2, "Unterminated string")]
+
+def test_iter_tokens_matches_scan_tokens(error_handler):
+    program = "var a = 1;\n// comment\nprint a + 2;"
+    expected = Scanner(program, error_handler).scan_tokens()
+    scanner = Scanner(program, error_handler)
+    for token, exp in zip(scanner.iter_tokens(), expected):
+        assert len(scanner.tokens) <= 1
+        assert (token.type, token.lexeme, token.line) == (exp.type, exp.lexeme, exp.line)
+
+def test_streaming_parser_matches_parser(error_handler):
+    program = "var a = 1; { print a; } fun f(x) { return x; } print f(a) + 1;"
+    expected = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    actual = StreamingParser(Scanner(program, error_handler).iter_tokens()).parse()
+    assert [type(s) for s in actual] == [type(s) for s in expected]
+
+def test_streaming_executes_before_later_parse_error(monkeypatch, capsys):
+    monkeypatch.setattr(Lox, "stream", True)
+    monkeypatch.setattr(Lox, "had_error", False)
+    Lox().run("print 1;\nprint ;")
+    assert capsys.readouterr().out == "1\n[line 2] Error  at ';': Expect expression.\n"
+
+def test_token_buffer_materializes_same_tokens(error_handler):
+    program = 'var s = "two\nlines";\nprint s + 1.5; // done'
+    expected = FastScanner(program, error_handler).scan_tokens()
+    buffer = FastScanner(program, error_handler).scan_compact()
+    assert len(buffer) == len(expected)
+    for index, exp in enumerate(expected):
+        token = buffer[index]
+        assert (token.type, token.lexeme, token.literal, token.line) == \
+            (exp.type, exp.lexeme, exp.literal, exp.line)
+
+def test_compact_parser_builds_same_ast(error_handler):
+    program = 'var s = "two\nlines";\nfun f(n) { return n * 2.5; }\nwhile (s != nil) { print f(1) + -3 or !true; break; }'
+    expected = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    actual = CompactParser(FastScanner(program, error_handler).scan_compact()).parse()
+    assert ast_cache.dumps(actual, program) == ast_cache.dumps(expected, program)
+
+def test_compact_tokens_run(monkeypatch, capsys):
+    monkeypatch.setattr(Lox, "compact_tokens", True)
+    Lox().run("var a = 2; { var b = a * 3; print b - 1; }")
+    assert capsys.readouterr().out == "5\n"
+
+def test_incremental_edit_reuses_untouched_statements(error_handler):
+    program = "var a = 1;\nif (a) print a;\nprint 2;\nfun f() { return 3; }\n"
+    document = IncrementalParser(program, error_handler)
+    before = document.statements
+
+    position = program.index("print 2;")
+    document.edit(position, position, "else ")
+    after = document.statements
+    assert len(after) == 3
+    assert after[0] is before[0] and after[2] is before[3]
+    assert after[1].else_branch is not None
+
+    document.edit(0, 0, "\n\n")
+    assert document.statements[2] is before[3]
+    assert before[3].expression.name.line == 6
+
+def test_incremental_edit_matches_full_parse(error_handler):
+    program = "{ var x = 1; }\nprint 1;\nwhile (true) { break; }\n"
+    document = IncrementalParser(program, error_handler)
+    document.statements
+    position = program.index("print")
+    with pytest.raises(ParserException):
+        document.edit(position, position, "{ print 0;")
+    document.edit(len(document.source), len(document.source), "}")
+    expected = Parser(Scanner(document.source, error_handler).scan_tokens()).parse()
+    assert [type(s) for s in document.statements] == [type(s) for s in expected]
+    assert len(document.statements[1].statements) == 3
+
+def test_pratt_parser_builds_same_ast(error_handler):
+    program = \
+    """
+    var a = -1 + 2 * 3 - 4 / (5 - 6) >= 7 == !true or nil and "s" != a;
+    a = b = f(1, g(2)(3), fun (x) { return x; }) < 2;
+    fun h(n) { if (n <= 1 or n > 3) return n; return h(n - 1) + h(n - 2); }
+    print h(4) * -a;
+    """
+    expected = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    for parser in (PrattParser(Scanner(program, error_handler).scan_tokens()),
+                   CompactPrattParser(FastScanner(program, error_handler).scan_compact())):
+        assert ast_cache.dumps(parser.parse(), program) == ast_cache.dumps(expected, program)
+
+@pytest.mark.parametrize("program", ["print 1 +;", "a + b = 3;", "print f(1;", "print (1;"])
+def test_pratt_parser_reports_same_errors(program, error_handler):
+    results = []
+    for parser_class in (Parser, PrattParser):
+        with pytest.raises(ParserException) as info:
+            parser_class(Scanner(program, error_handler).scan_tokens()).parse()
+        results.append((info.value.token.lexeme, info.value.message))
+    assert results[0] == results[1]
+
+def test_ast_cache_round_trip(error_handler, capsys):
+    program = \
+    """
+    var s = "str" + 1.5;
+    fun f(a, b) { if (a > b and !false) return a; else return -b; }
+    var g = fun () { for (var i = 0; i < 2; i = i + 1) { while (true) break; } };
+    print f(2, 1) or nil;
+    g();
+    """
+    statements = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    data = ast_cache.dumps(statements, program)
+    statements = ast_cache.loads(data, program)
+    interpreter = Interpreter()
+    Resolver(error_handler, interpreter.globals.values).resolve(statements)
+    interpreter.interpret(statements)
+    assert capsys.readouterr().out == "2\n"
+    with pytest.raises(ast_cache.CacheError):
+        ast_cache.loads(data, program + " ")
+
+def test_run_file_uses_ast_cache(tmp_path, monkeypatch, capsys):
+    script = tmp_path / "script.lox"
+    script.write_text("print 1 + 2;")
+    monkeypatch.setattr(Lox, "ast_cache", True)
+    Lox.run_file(str(script))
+    assert len(list((tmp_path / "__loxcache__").iterdir())) == 1
+
+    monkeypatch.setattr(Parser, "parse", lambda self: pytest.fail("should load from the cache"))
+    Lox.run_file(str(script))
+    assert capsys.readouterr().out == "3\n3\n"
+
+def test_resolver_annotates_depth_and_slot(error_handler):
+    program = "var g = 1; { var a = 2; var b = 3; { print b + a + g; } }"
+    statements = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    Resolver(error_handler).resolve(statements)
+    expression = statements[1].statements[2].statements[0].expression
+    b, a, g = expression.left.left, expression.left.right, expression.right
+    assert (b.depth, b.slot) == (1, 1)
+    assert (a.depth, a.slot) == (1, 0)
+    assert g.depth is None
+
+def test_resolver_sizes_slot_environments(error_handler):
+    program = "fun f(a, b) { var c = a; { var d; var e; } } for (var i = 0; i < 1;) { var j; } var g;"
+    statements = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    Resolver(error_handler).resolve(statements)
+    function, loop, var = statements[0].expression, statements[1], statements[2]
+    assert function.slot_count == 2 and function.body.slot_count == 1
+    assert function.body.statements[1].slot_count == 2
+    assert function.body.statements[1].statements[1].slot == 1
+    assert loop.slot_count == 1 and loop.body.slot_count == 1
+    assert var.slot is None
+
+def test_resolver_reports_errors_before_running(monkeypatch, capsys):
+    monkeypatch.setattr(Lox, "had_error", False)
+    Lox().run("print 1;\n{ var a = 1; var a = 2; }\nprint b;\nfun f() { return c; }")
+    assert capsys.readouterr().out == \
+        "[line 2] Error  at 'a': Already a variable with this name in this scope.\n" \
+        "[line 3] Error  at 'b': Undefined variable b.\n"
+
+def test_resolver_marks_break_and_return(error_handler):
+    program = "break; while (true) { fun f() { break; return 1; } } return 2;"
+    statements = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    Resolver(error_handler).resolve(statements)
+    function = statements[1].loop_body.statements[0].expression
+    assert not statements[0].inside_loop
+    assert function.body.statements[0].inside_loop and function.body.statements[1].inside_function
+    assert function.body.statements[0].escapes and not statements[0].escapes
+    assert not statements[2].inside_function
+
+def test_break_and_return_unwind_to_their_loop_and_function(monkeypatch, capsys, backend):
+    program = \
+    """
+    fun find(limit) {
+        for (var i = 0; ; i = i + 1) { while (true) { if (i * i > limit) return i; break; } }
+    }
+    print find(50);
+    while (true) { fun stop() { break; } print "once"; stop(); print "never"; }
+    print "after";
+    break;
+    """
+    monkeypatch.setattr(Lox, "had_runtime_error", False)
+    Lox().run(program)
+    assert capsys.readouterr().out == "8\nonce\nafter\nBreak not inside loop.\n[line 8] \n"
+
+def test_break_out_of_a_function_called_outside_any_loop(monkeypatch, capsys, backend):
+    program = \
+    """
+    var f;
+    while (true) { fun g() { break; } f = g; break; }
+    print "before";
+    f();
+    print "never";
+    """
+    monkeypatch.setattr(Lox, "had_runtime_error", False)
+    Lox().run(program)
+    assert capsys.readouterr().out == "before\nBreak not inside loop.\n[line 3] \n"
+    assert Lox.had_runtime_error
+
+def test_arguments_are_evaluated_by_the_caller(monkeypatch, capsys, backend):
+    program = \
+    """
+    var a = "global";
+    fun pair(a, b) { var c = a + b; return c; }
+    { var a = "caller "; var b = 1; print pair(a, b); print pair(b, a); }
+    print pair(a, a) + pair(a, a);
+    print clock() == clock;
+    pair(1);
+    """
+    monkeypatch.setattr(Lox, "had_runtime_error", False)
+    Lox().run(program)
+    assert capsys.readouterr().out == \
+        "caller 1\n1caller \nglobalglobalglobalglobal\nFalse\nExpected 2 args, instead got 1\n[line 7] \n"
+
+def test_resolver_marks_captured_scopes(error_handler):
+    program = "while (true) { var a; fun f() { return a; } } while (true) { var b; fun g() { return 1; } print b; }"
+    statements = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    Resolver(error_handler).resolve(statements)
+    captured, uncaptured = statements
+    assert captured.loop_body.captured and not captured.captured
+    assert not uncaptured.loop_body.captured
+
+def test_loops_reuse_environments_unless_captured(monkeypatch, capsys, backend):
+    program = \
+    """
+    var n = 0;
+    while (n < 3) { n = n + 1; if (n == 1) fun f() {} print f; }
+    for (var i = 0; i < 2; i = i + 1) { var j; if (i == 0) j = "set"; print j; }
+    var saved;
+    while (n > 0) { var v = n; fun get() { return v; } if (n == 3) saved = get; n = n - 1; }
+    print saved();
+    """
+    created = []
+    init = SlotEnvironment.__init__
+    monkeypatch.setattr(SlotEnvironment, "__init__", lambda self, *args: created.append(1) or init(self, *args))
+    Lox().run(program)
+    assert capsys.readouterr().out == "<lox callable f>\nnil\nnil\nset\nnil\n3\n"
+    if backend == "tree":
+        # one for each of the first two loops and one for each of their
+        # bodies; the last loop needs a body per iteration, and saved() a block
+        assert len(created) == 2 + 2 + (1 + 3) + 1
+
+def test_resolver_marks_tail_calls(error_handler):
+    program = "fun f(n) { if (n) return f(n - 1); while (n) return f(n); return 1 + f(n); }"
+    statements = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    Resolver(error_handler).resolve(statements)
+    tail, in_loop, not_tail = statements[0].expression.body.statements
+    assert tail.then_branch.tail_call
+    assert not in_loop.loop_body.tail_call and not not_tail.tail_call
+
+def test_tail_calls_run_in_constant_stack(monkeypatch, capsys):
+    program = \
+    """
+    fun even(n) { if (n == 0) return true; return odd(n - 1); }
+    fun odd(n) { if (n == 0) return false; return even(n - 1); }
+    print even(20001);
+    fun depth(n) { if (n == 0) return 0; return 1 + depth(n - 1); }
+    print depth(999);
+    print depth(1000);
+    """
+    monkeypatch.setattr(Lox, "had_runtime_error", False)
+    Lox().run(program)
+    assert capsys.readouterr().out == "False\n999\nStack overflow.\n[line 5] \n"
+
+def test_deep_calls_overflow_the_stack(monkeypatch, capsys, backend):
+    program = \
+    """
+    fun depth(n) {
+        if (n == 0) return 0;
+        return 1 + depth(n - 1);
+    }
+    print depth(999);
+    print depth(5000);
+    print "never";
+    """
+    monkeypatch.setattr(Lox, "had_runtime_error", False)
+    Lox().run(program)
+    assert capsys.readouterr().out == "999\nStack overflow.\n[line 4] \n"
+    assert Lox.had_runtime_error
+
+def test_long_expressions_run_on_every_backend(capsys, backend):
+    chain = " + ".join(["f(1)"] * 200)
+    program = f"fun f(x) {{ return x; }}\nvar a = false;\nprint {chain};\nprint a or {chain};\n" \
+              f"while (a or {chain} < 0) {{}}\nprint -{chain} == {chain};\n"
+    Lox().run(program)
+    assert capsys.readouterr().out == "200\n200\nFalse\n"
+
+def test_deeply_nested_expressions_run_on_every_backend(capsys, backend):
+    Lox().run("print " + "(" * 3000 + "1" + ")" * 3000 + ";")
+    assert capsys.readouterr().out == "1\n"
+
+def test_deep_recursion_is_limited_to_running(monkeypatch, capsys):
+    limit = sys.getrecursionlimit()
+    Interpreter().interpret(Parser(Scanner("print 1;", print).scan_tokens()).parse())
+    assert sys.getrecursionlimit() == limit
+    monkeypatch.setattr(Lox, "had_error", False)
+    Lox().run("print " + "+".join(["1"] * 20000) + ";")
+    assert Lox.had_error
+    assert capsys.readouterr().out == "1\n[line 1] Error  at '+': Expression nested too deeply.\n"
+    assert sys.getrecursionlimit() == limit
+
+def test_closures_capture_defining_scope(capsys, backend):
+    program = \
+    """
+    fun counter() { var c = 0; fun inc() { c = c + 1; return c; } return inc; }
+    var first = counter();
+    var second = counter();
+    first(); first();
+    print first() + second();
+    var a = "global";
+    { fun show() { print a; } show(); var a = "block"; show(); }
+    """
+    Lox().run(program)
+    assert capsys.readouterr().out == "4\nglobal\nglobal\n"
+
+def test_closures_in_loops_capture_each_iteration(capsys, backend):
+    program = \
+    """
+    var first; var last;
+    for (var i = 0; i < 3; i = i + 1) {
+        var j = i;
+        fun get() { return j; }
+        fun bump() { j = j + 10; }
+        if (i == 0) { first = get; bump(); }
+        last = get;
+    }
+    print first(); print last();
+    var n = 0;
+    while (n < 10) { fun stop() { break; } n = n + 1; if (n == 3) stop(); }
+    print n;
+    """
+    Lox().run(program)
+    assert capsys.readouterr().out == "10\n2\n3\n"
+
+def test_emit_py_prints_cached_module(tmp_path, monkeypatch, capsys):
+    script = tmp_path / "script.lox"
+    script.write_text("fun f(a) { return a + 1; }\nprint f(2);\nprint f;")
+    monkeypatch.setattr(Lox, "emit_py", True)
+    Lox.run_file(str(script))
+    module = capsys.readouterr().out
+    assert module.startswith("# Generated by the Lox transpiler")
+    assert "def f_g(a_1):" in module
+    assert len(list((tmp_path / "__loxcache__").glob("*.py"))) == 1
+
+    monkeypatch.setattr(Lox, "emit_py", False)
+    monkeypatch.setattr(Lox, "backend", "python")
+    monkeypatch.setattr(Parser, "parse", lambda self: pytest.fail("should load from the cache"))
+    Lox.run_file(str(script))
+    assert capsys.readouterr().out == "3\n<lox callable f>\n"
+
+def test_edited_scripts_replace_their_cache_entries(tmp_path, monkeypatch, capsys):
+    script = tmp_path / "script.lox"
+    monkeypatch.setattr(Lox, "ast_cache", True)
+    for backend in ("tree", "python", "vm"):
+        monkeypatch.setattr(Lox, "backend", backend)
+        for n in range(3):
+            script.write_text(f"print {n};")
+            Lox.run_file(str(script))
+    assert capsys.readouterr().out == "0\n1\n2\n" * 3
+    assert sorted(path.name for path in (tmp_path / "__loxcache__").iterdir()) == \
+        ["script.loxast", "script.loxc", "script.py"]
+
+def test_bytecode_round_trip(error_handler, capsys):
+    program = \
+    """
+    fun outer(n) { var hits = 0; fun hit() { hits = hits + n; return hits; } return hit; }
+    var hit = outer(1.5);
+    hit();
+    print hit() + " " + "hits" + nil;
+    print -hit;
+    """
+    statements = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    vm = VM()
+    Resolver(error_handler, vm.globals.values).resolve(statements)
+    script = vm.compile(statements)
+    assert "GET_UPVALUE" in bytecode.disassemble(script)
+    data = bytecode.dumps(script, program)
+    with pytest.raises(RuntimeError) as error:
+        vm.execute(bytecode.loads(data, program))
+    assert capsys.readouterr().out == "3 hitsnil\n"
+    assert (error.value.message, error.value.token.line) == ("Operand must be a number.", 6)
+    with pytest.raises(ast_cache.CacheError):
+        bytecode.loads(data, program + " ")
+
+def test_run_file_caches_bytecode(tmp_path, monkeypatch, capsys):
+    script = tmp_path / "script.lox"
+    script.write_text("for (var i = 0; i < 3; i = i + 1) print i;")
+    monkeypatch.setattr(Lox, "backend", "vm")
+    Lox.run_file(str(script))
+    assert len(list((tmp_path / "__loxcache__").glob("*.loxc"))) == 1
+
+    monkeypatch.setattr(Parser, "parse", lambda self: pytest.fail("should load from the cache"))
+    Lox.run_file(str(script))
+    assert capsys.readouterr().out == "0\n1\n2\n" * 2
+
+def test_optimizer_folds_constants(error_handler):
+    program = 'print (1 + 2) * -3; print "n" + 1 + nil; print !nil and x; print -"a"; print 1 / 0;'
+    statements = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    folded, concatenated, logical, negated, divided = Optimizer(1).optimize(statements)
+    assert folded.expression.value == -9.0
+    assert concatenated.expression.value == "n1nil"
+    assert isinstance(logical.expression, Variable)
+    # these fail at run time, so they stay as they are
+    assert isinstance(negated.expression, Unary) and isinstance(divided.expression, Binary)
+
+def test_optimizer_drops_dead_branches(error_handler):
+    program = "if (false) print 1; else print 2; while (nil) print 3; { if (false) fun f() {} print f; }"
+    statements = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    Resolver(error_handler).resolve(statements)
+    taken, block = Optimizer(2).optimize(statements)
+    assert isinstance(taken, Print) and taken.expression.value == 2
+    # dropping the branch would take f out of the block's scope
+    assert isinstance(block.statements[0], If)
+
+def test_optimized_programs_print_the_same(monkeypatch, capsys, backend):
+    program = \
+    """
+    { if (false) fun f() {} print f; }
+    for (var i = 0; true and i < 2; i = i + 1) print "i" + (i + 0.5 * 2);
+    if (1 < 2 or nil) print "t"; else print -"not folded";
+    print 1 > "a";
+    """
+    Lox().run(program)
+    expected = capsys.readouterr().out
+    assert expected == "nil\ni1\ni2\nt\nOperand must be a number.\n[line 5] \n"
+    monkeypatch.setattr(Lox, "optimize", 2)
+    Lox().run(program)
+    assert capsys.readouterr().out == expected
+
+def test_scheduler_interleaves_scripts(capsys):
+    scripts = [
+        'for (var i = 0; i < 200; i = i + 1) print "a";',
+        'sleep(0.01); print "woke";',
+        'print "b";',
+        'print nil + 1;',
+        'print "unfinished',
+    ]
+    errors = asyncio.run(Scheduler(time_slice=0).run_all(scripts))
+    output = capsys.readouterr().out.split()
+    # the loop is stopped at a back-edge for the others to run, and the
+    # sleeping script is parked until the loop is done
+    assert 0 < output.index("b") < 200
+    assert output.count("a") == 200 and output[-1] == "woke"
+    assert errors[:3] == [None, None, None]
+    assert isinstance(errors[3], RuntimeError) and isinstance(errors[4], ParserException)
+
+def test_vm_resume_stops_at_deadline(error_handler, capsys):
+    vm = VM()
+    statements = Parser(Scanner("var n = 0; while (n < 1000) n = n + 1; print n;", error_handler).scan_tokens()).parse()
+    Resolver(error_handler, vm.globals.values).resolve(statements)
+    script = vm.compile(statements)
+    vm.load(script)
+    vm.start(Closure(script, []))
+    resumes = 1
+    while vm.resume(deadline=0) is not None:
+        resumes += 1
+    assert resumes == 1000 // CHECK_INTERVAL + 1
+    assert capsys.readouterr().out == "1000\n"
+
+def test_purity_marks_functions_without_effects(error_handler):
+    program = \
+    """
+    var k = 2; var changed = 1; changed = 3;
+    fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+    fun scale(x) { var y = x; for (var i = 0; i < k; i = i + 1) y = y * x; return y + fib(x); }
+    fun shout(x) { print x; }
+    fun time() { return clock(); }
+    fun late(x) { return x + changed; }
+    fun outer(x) { fun inner() { return x; } return inner; }
+    fun caller(x) { return shout(x); }
+    """
+    statements = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    Resolver(error_handler).resolve(statements)
+    Purity().analyze(statements)
+    pure = {stmt.expression.name.lexeme: stmt.expression.pure for stmt in statements[3:]}
+    assert pure == {"fib": True, "scale": True, "shout": False, "time": False,
+                    "late": False, "outer": False, "caller": False}
+
+def test_pure_functions_are_memoized(monkeypatch, capsys):
+    program = \
+    """
+    fun fib(n) { if (n < 2) return n; return fib(n - 1) + fib(n - 2); }
+    print fib(60);
+    fun same(x) { return x; }
+    print same(1); print same(true); print same(0); print same(false);
+    fun depth(n) { if (n == 0) return 0; return 1 + depth(n - 1); }
+    print depth(999);
+    print depth(1000);
+    """
+    interpreters = []
+    init = Interpreter.__init__
+    monkeypatch.setattr(Interpreter, "__init__", lambda self: interpreters.append(self) or init(self))
+    monkeypatch.setattr(Lox, "had_runtime_error", False)
+    Lox().run(program)
+    # a remembered result still counts the calls it took to the stack limit
+    assert capsys.readouterr().out == \
+        "1548008755920\n1\nTrue\n0\nFalse\n999\nStack overflow.\n[line 6] \n"
+    memo = interpreters[0].memo
+    assert (memo.hits, memo.misses) == (58 + 1, 61 + 4 + 1001)
+
+    monkeypatch.setattr(Lox, "memoize", False)
+    Lox().run("fun f(n) { return n; } print f(1) + f(1);")
+    assert interpreters[-1].memo.misses == 0 and capsys.readouterr().out == "2\n"
+
+def test_memo_evicts_least_recently_used():
+    statements = Parser(Scanner("fun f(x) {} fun g(x) {}", lambda *args: None).scan_tokens()).parse()
+    memo = Memo()
+    f, g = (memo.table(statement.expression) for statement in statements)
+    for x in range(3):
+        memo.store(f, memo.key([float(x)]), x, 1)
+    memo.store(g, memo.key(["a"]), "a", 1)
+    memo.cap = memo.size - 1
+    memo.store(g, memo.key(["b"]), "b", 1)
+    # f was added to least recently, so its oldest results go first
+    assert list(f.entries) == [memo.key([2.0])] and len(g.entries) == 2
+    assert memo.evictions == 2 and memo.size <= memo.cap
+
+def test_inline_caches_follow_reassignment(monkeypatch, capsys):
+    program = \
+    """
+    fun one(a) { return "one " + a; }
+    fun two(a, b) { return "two"; }
+    var f = one;
+    fun call() { return f(1); }
+    for (var i = 0; i < 3; i = i + 1) print call();
+    f = two;
+    print f(1, 2);
+    print call();
+    """
+    interpreters = []
+    init = Interpreter.__init__
+    monkeypatch.setattr(Interpreter, "__init__", lambda self: interpreters.append(self) or init(self))
+    monkeypatch.setattr(Lox, "had_runtime_error", False)
+    monkeypatch.setattr(Lox, "memoize", False)
+    Lox().run(program)
+    assert capsys.readouterr().out == "one 1\n" * 3 + "two\nExpected 2 args, instead got 1\n[line 5] \n"
+    interpreter = interpreters[0]
+    # only the second and third calls in the loop hit; after f = two,
+    # f(1) in call() finds both a new version and a new callee
+    assert (interpreter.global_hits, interpreter.global_misses) == (4, 7)
+    assert (interpreter.call_hits, interpreter.call_misses) == (4, 5)
+
+def test_global_cache_is_not_shared_between_interpreters(error_handler, capsys):
+    statements = Parser(Scanner("print x; nil();", error_handler).scan_tokens()).parse()
+    for value in (1.0, "two"):
+        interpreter = Interpreter()
+        interpreter.globals.define("x", value)
+        with pytest.raises(RuntimeError, match="Can only call functions."):
+            interpreter.interpret(statements)
+    assert capsys.readouterr().out == "1\ntwo\n"
+
+def test_binary_nodes_specialize_and_deoptimize(error_handler, capsys):
+    program = 'fun f(a, b) { return !(a + b < 10); } print f(1, 2); print f("a", "b");'
+    statements = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    Resolver(error_handler).resolve(statements)
+    interpreter = Interpreter()
+    interpreter.interpret(statements[:2])
+    negation = statements[0].expression.body.statements[0].return_expr
+    less = negation.right.expression
+    assert negation.__class__ is Not
+    assert less.__class__.__name__ == "NumberLess" and less.left.__class__.__name__ == "NumberAdd"
+    # the string operands fail the guards; < still reports the error
+    with pytest.raises(RuntimeError, match="Operand must be a number."):
+        interpreter.interpret(statements[2:])
+    assert less.left.__class__ is GenericBinary and less.__class__ is GenericBinary
+    assert isinstance(less, Binary) and capsys.readouterr().out == "False\n"
+
+def test_specialized_nodes_still_compile(error_handler, capsys):
+    program = 'var x = 2; print -x * 3 == -6; print "a" + "b" != "ab";'
+    statements = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    Resolver(error_handler).resolve(statements)
+    Interpreter().interpret(statements)
+    backend = BACKENDS["closures"]()
+    backend.interpret(statements)
+    assert capsys.readouterr().out == "True\nFalse\n" * 2
+
+def test_rope_flattens_once_and_compares_as_str():
+    half = "x" * ROPE_MIN
+    rope = concatenate(concatenate(half, "y"), concatenate(half, half))
+    assert isinstance(rope, Rope) and len(rope) == 3 * ROPE_MIN + 1
+    assert rope == half + "y" + half * 2 and half + "y" + half * 2 == rope
+    assert rope.left is None and hash(rope) == hash(str(rope))
+    assert rope != half and rope != 1.0 and concatenate("a", "b") == "ab"
+
+def test_concatenation_in_loops_keeps_string_semantics(capsys, backend):
+    program = \
+    """
+    var s = "";
+    for (var i = 0; i < 600; i = i + 1) s = s + "ab";
+    var copy = s;
+    s = s + 1 + nil + true;
+    print copy == s;
+    print s == copy + "1nilTrue";
+    var t = "";
+    for (var i = 0; i < 1200; i = i + 1) t = t + "a" + "b";
+    print copy == t;
+    print t + 0;
+    """
+    Lox().run(program)
+    assert capsys.readouterr().out == "False\nTrue\nFalse\n" + "ab" * 1200 + "0\n"
+
+def test_output_sink_writes_when_full():
+    stream = io.BytesIO()
+    sink = OutputSink(stream, threshold=8)
+    sink.write("abc\n")
+    assert stream.getvalue() == b""
+    sink.write("d\u00e9f\n")
+    assert stream.getvalue() == "abc\nd\u00e9f\n".encode()
+    text = io.StringIO()
+    OutputSink(text, threshold=0).write("now\n")
+    assert text.getvalue() == "now\n"
+
+def test_interpreter_output_is_flushed_before_errors(error_handler, capsys):
+    statements = Parser(Scanner('print "kept"; print 1 + 2; print nil + 1;', error_handler).scan_tokens()).parse()
+    stream = io.BytesIO()
+    interpreter = Interpreter(OutputSink(stream))
+    Resolver(error_handler, interpreter.globals.values).resolve(statements)
+    with pytest.raises(RuntimeError):
+        interpreter.interpret(statements)
+    assert stream.getvalue() == b"kept\n3\n" and capsys.readouterr().out == ""
+
+def test_profiler_counts_functions_and_lines(error_handler, capsys):
+    program = \
+    """fun fib(n) {
+        if (n < 2) return n;
+        return fib(n - 1) + fib(n - 2);
+    }
+    print fib(10);
+    print "done";
+    """
+    statements = Parser(Scanner(program, error_handler).scan_tokens()).parse()
+    profiler = Profiler()
+    interpreter = ProfilingInterpreter(profiler)
+    Resolver(error_handler, interpreter.globals.values).resolve(statements)
+    interpreter.interpret(statements)
+    assert capsys.readouterr().out == "55\ndone\n"
+    fib, script = profiler.functions["fib:1"], profiler.functions["<script>"]
+    assert fib.calls == 177 and script.calls == 1
+    assert script.inclusive >= fib.inclusive >= fib.exclusive > 0
+    # line 2 runs an if on every call and a return on 89 of them; the
+    # print of a literal is counted with the token before it, on line 5
+    assert profiler.lines[2].calls == 177 + 89 and profiler.lines[3].calls == 88
+    assert profiler.lines[5].calls == 2
+    assert set(profiler.stacks) == {"<script>"} | {"<script>" + ";fib:1" * depth for depth in range(1, 11)}
+
+def test_profile_option_writes_collapsed_stacks(tmp_path, monkeypatch, capsys):
+    script, folded = tmp_path / "script.lox", tmp_path / "out.folded"
+    script.write_text("fun f(n) { var s = 0; while (s < n) s = s + 1; return s; }\nprint f(3000);")
+    monkeypatch.setattr(Lox, "had_runtime_error", False)
+    # main() sets these for the rest of the session
+    monkeypatch.setattr(Lox, "profile", False)
+    monkeypatch.setattr(Lox, "flamegraph", None)
+    Lox.main(str(script), "--profile", "--flamegraph", str(folded))
+    captured = capsys.readouterr()
+    assert captured.out == "3000\n" and "f:1" in captured.err
+    for line in folded.read_text().splitlines():
+        stack, microseconds = line.rsplit(" ", 1)
+        assert stack in ("<script>", "<script>;f:1") and int(microseconds) > 0
+
+def test_benchmark_programs_are_valid_lox():
+    for name, benchmark in SUITE.items():
+        statements = Parser(Scanner(benchmark.source(1), Lox.error).scan_tokens()).parse()
+        resolver = Resolver(Lox.error)
+        resolver.resolve(statements)
+        assert not resolver.had_error, name
+    config = {"scale": 1, "scanner": "fast", "parser": "pratt", "backend": "vm", "memoize": False}
+    times = runner.time_phases('var a = "x"; print a + a;', config)
+    assert set(times) == set(runner.PHASES)
+
+
+def test_benchmark_comparison_flags_regressions():
+    def result(median, stdev=0.0):
+        return {"median": median, "stdev": stdev}
+
+    def document(**executes):
+        return {"results": {
+            name: {"scan": result(0.01), "parse": result(0.02), "execute": execute}
+            for name, execute in executes.items()
+        }}
+
+    old = document(fib=result(1.0), loops=result(1.0), closures=result(1.0, 0.3), strings=result(1.0))
+    new = document(fib=result(1.5), loops=result(0.5), closures=result(1.5, 0.3), strings=result(1.05))
+    changes = runner.compare(old, new, threshold=0.1)
+    assert len(changes) == 2
+    assert changes[0].startswith("fib") and changes[0].endswith("REGRESSION")
+    assert changes[1].startswith("loops") and changes[1].endswith("faster")
+
+
+def test_program_cache_keeps_recent_programs(monkeypatch, capsys):
+    monkeypatch.setattr(Lox, "had_error", False)
+    cache = ProgramCache(capacity=2)
+    first = cache.compile("print 1;")
+    assert cache.compile("print 1;") is first
+    cache.compile("print 2;")
+    cache.compile("print 3;")
+    assert cache.compile("print 1;") is not first
+    assert (cache.hits, cache.misses) == (1, 4)
+    assert cache.compile("print 1 +;") is None
+    assert "Expect expression." in capsys.readouterr().out
+    assert len(cache.programs) == 2
+
+
+def test_server_runs_requests_in_fresh_interpreters(monkeypatch, tmp_path):
+    monkeypatch.setattr(Lox, "had_error", False)
+    monkeypatch.setattr(Lox, "had_runtime_error", False)
+    server = Server(str(tmp_path / "lox.sock"))
+
+    def ask(message):
+        client, connection = socket.socketpair()
+        with client, connection:
+            server_send(client, message)
+            server.handle(connection)
+            out = io.StringIO()
+            return receive(client, out), out.getvalue()
+
+    script = tmp_path / "counter.lox"
+    script.write_text("var n = 0; n = n + 1; print n;")
+    assert ask({"path": str(script)}) == (0, "1\n")
+    assert ask({"source": script.read_text()}) == (0, "1\n")
+    assert server.programs.hits == 1
+    program = server.programs.compile("fun f() { return n; } var n = 1; print f();")
+    assert ask({"source": "fun f() { return n; } var n = 1; print f();"}) == (0, "1\n")
+    # nothing of a finished run is kept in the shared program
+    assert [call.callee_cache for call in program.calls] == [EMPTY]
+    assert [variable.cache_value for variable in program.variables] == [None, None]
+    status, output = ask({"source": 'print "before"; print nil + 1;'})
+    assert status == 70
+    assert output.startswith("before\nOperands must be")
+    assert ask({"source": "print ;"})[0] == 65
+    assert ask({"path": str(tmp_path / "missing.lox")})[0] == 66
+    # as deeply nested as lox.py runs
+    assert ask({"source": "print " + "(" * 3000 + "1" + ")" * 3000 + ";"}) == (0, "1\n")
+
+
+def test_backends_print_the_same(monkeypatch, capsys):
+    program = \
+    """
+    fun make(step) { var n = 0; return fun () { n = n + step; return n; }; }
+    var counter = make(2.5);
+    counter();
+    print counter() + " " + (1 == 1.0) + " " + !nil + " " + (nil == false);
+    for (var i = 0; i < 5; i = i + 1) { var j = i; while (j > 0) { if (j == 2) break; j = j - 1; } print j; }
+    print clock;
+    print "done" - 1;
+    """
+    outputs = []
+    for backend in BACKENDS:
+        monkeypatch.setattr(Lox, "backend", backend)
+        Lox().run(program)
+        outputs.append(capsys.readouterr().out)
+    assert outputs[0].startswith("5 True True False\n0\n0\n2\n2\n2\n")
+    assert outputs[0].endswith("<native fn>\nOperand must be a number.\n[line 8] \n")
+    assert all(output == outputs[0] for output in outputs)
+
+def test_execute_simple_program(backend):
     basic_program = '''
     print "one";
     print true;
@@ -104,7 +911,7 @@ def test_execute_simple_program():
     '''
     Lox().run(basic_program)
 
-def test_execute_simple_program_with_vars():
+def test_execute_simple_program_with_vars(backend):
     basic_program = '''
     var a = 1;
     var b = 2;
@@ -112,7 +919,7 @@ def test_execute_simple_program_with_vars():
     '''
     Lox().run(basic_program)
 
-def test_execute_program_with_scopes():
+def test_execute_program_with_scopes(backend):
     program = \
     """
     var a = "global a";
@@ -137,7 +944,7 @@ def test_execute_program_with_scopes():
     """
     Lox().run(program)
 
-def test_conditionals_shortcircuiting():
+def test_conditionals_shortcircuiting(backend):
     program = \
     """
     print "hi" or 2;
@@ -145,7 +952,7 @@ def test_conditionals_shortcircuiting():
     """
     Lox().run(program)
 
-def test_while_loop():
+def test_while_loop(backend):
     program = \
     """
     var i = 100;
@@ -159,7 +966,7 @@ def test_while_loop():
     """
     Lox().run(program)
 
-def test_for_loop():
+def test_for_loop(backend):
     program = \
     """
     for ( var i=0; i< 5; i = i + 1 )
@@ -172,7 +979,7 @@ def test_for_loop():
     """
     Lox().run(program)
 
-def test_nested_for_loop():
+def test_nested_for_loop(backend):
     program = \
     """
     for ( var i=0; i< 15; i = i + 1 )
@@ -190,7 +997,7 @@ def test_nested_for_loop():
     """
     Lox().run(program)
 
-def test_fibonacci():
+def test_fibonacci(backend):
     program = \
     """
     var n = 10;
@@ -210,14 +1017,14 @@ def test_fibonacci():
     """
     Lox().run(program)
 
-def test_builtin_clock():
+def test_builtin_clock(backend):
     program = \
     """
     print clock();
     """
     Lox().run(program)
 
-def test_fibonacci_function():
+def test_fibonacci_function(backend):
     program = \
     """
     fun fib(n) {
@@ -242,7 +1049,7 @@ def test_fibonacci_function():
     """
     Lox().run(program)
 
-def test_recursive_fibonacci_function():
+def test_recursive_fibonacci_function(backend):
     program = \
     """
     fun fib(n) {
@@ -262,7 +1069,7 @@ def test_recursive_fibonacci_function():
     """
     Lox().run(program)
 
-def test_function_expression():
+def test_function_expression(backend):
     program = \
     """
     var mongoose = fun () {
@@ -272,7 +1079,7 @@ def test_function_expression():
     """
     Lox().run(program)
 
-def test_function_closure():
+def test_function_closure(backend):
     program = \
     """
     fun outer_function(){
@@ -296,7 +1103,7 @@ def test_function_closure():
     Lox().run(program)
 
 
-def test_return():
+def test_return(backend):
     program = \
     """
     fun mongoose() {
@@ -309,17 +1116,4 @@ def test_return():
 
 
 if __name__ == "__main__":
-    # test_execute_simple_program_with_vars()
-    # test_conditionals_shortcircuiting()
-    # test_execute_program_with_scopes()
-    # test_execute_simple_program_with_vars()
-    # test_while_loop()
-    # test_for_loop()
-    # test_nested_for_loop()
-    # test_fibonacci()
-    # test_fibonacci_function()
-    # test_return()
-    # test_recursive_fibonacci_function()
-    # test_builtin_clock()
-    # test_function_expression()
-    test_function_closure()
+    sys.exit(pytest.main([__file__]))
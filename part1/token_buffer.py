@@ -0,0 +1,58 @@
+"""
+Struct-of-arrays token storage. Instead of one util.Token per token, keeps
+parallel `array` columns of type code, start offset, end offset and line, and
+materializes lexemes, literals and Token objects from the source on demand.
+"""
+
+from array import array
+from typing import Any, Final
+from util import Token, TokenType
+
+# TokenType members indexed by their value, for decoding the type column
+TOKEN_TYPES: Final = [None] + sorted(TokenType, key=lambda t: t.value)
+
+
+class TokenBuffer:
+    def __init__(self, source: str):
+        self.source: Final = source
+        self.types = array("B")
+        self.starts = array("I")
+        self.ends = array("I")
+        self.lines = array("I")
+
+    def __len__(self):
+        return len(self.types)
+
+    def append(self, ttype: TokenType, start: int, end: int, line: int):
+        self.types.append(ttype.value)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(line)
+
+    def type(self, index: int) -> TokenType:
+        return TOKEN_TYPES[self.types[index]]
+
+    def lexeme(self, index: int) -> str:
+        return self.source[self.starts[index] : self.ends[index]]
+
+    def literal(self, index: int) -> Any:
+        code = self.types[index]
+        if code == TokenType.NUMBER.value:
+            return float(self.lexeme(index))
+        if code == TokenType.STRING.value:
+            return self.source[self.starts[index] + 1 : self.ends[index] - 1]
+        return None
+
+    def token(self, index: int) -> Token:
+        return Token(self.type(index), self.lexeme(index), self.literal(index), self.lines[index])
+
+    def __getitem__(self, index: int) -> Token:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("token index out of range")
+        return self.token(index)
+
+    def nbytes(self) -> int:
+        return sum(column.itemsize * len(column)
+                   for column in (self.types, self.starts, self.ends, self.lines))
@@ -0,0 +1,580 @@
+"""
+Lox to Python transpiler. Turns a resolved program into the source of a
+Python module that is run with compile()/exec, so that CPython's own
+bytecode loop does the work instead of the Interpreter visitors.
+
+Top-level code runs inside a `main()` function. Lox globals become module
+globals named `<name>_g`. Every local declaration becomes a Python local
+named `<name>_<n>`, and Lox functions become nested Python functions. A
+local that is captured by a closure and declared inside a loop lives in a
+one element list ("box"), so that every iteration gets a fresh variable as
+it does in the tree-walker. The helpers at the top of this module keep the
+Lox rules for truthiness, `+`, calls and runtime errors. Every Lox call is a
+Python call, so stack overflows are found with the recursion limit instead
+of counting calls in generated code. Generated modules
+are cached next to the script like the AST cache, after a comment with the
+digest of the source they were made from.
+"""
+
+import os
+import re
+import sys
+from pathlib import Path
+from traceback import walk_tb
+from types import FunctionType
+from typing import Any, Dict, Iterable, List, Optional
+from Expr import Assign, Binary, Call, Expr, Grouping, Literal, Logical, Unary, Variable
+from Stmt import Block, Break, Expression, For, FunctionStatement, If, Print, Return, Stmt, Var, While
+from analyzer import Analyzer
+from ast_cache import source_digest
+from environment import Environment
+from interpreter import FRAMES_MAX, Clock, LoxCallable
+from parser import ParserException
+from resolver import first_token
+from runtime_error import BreakException, RuntimeError
+from util import Token, TokenType
+
+TRANSPILER_VERSION = 2
+SUFFIX = ".py"
+HEADER = f"# Generated by the Lox transpiler (format {TRANSPILER_VERSION}). Do not edit.\n"
+# frames the helpers below, and the natives and errors they reach, may add on
+# top of the deepest Lox call; up to as many more Lox calls fit in instead
+HELPER_FRAMES = 16
+# the fallback of every generated call, with the line of its parenthesis
+CALL_LINE = re.compile(r"\bcall\(_t\d+, (\d+), \d+\)")
+
+
+# runtime support for generated modules
+
+def stringify(value: Any) -> str:
+    if value is None: return "nil"
+    if value.__class__ is float:
+        if value.is_integer():
+            value = int(value)
+    elif value.__class__ is FunctionType:
+        name = value.__name__.rsplit("_", 1)[0]
+        return f"<lox callable {name}>" if name else "<anonymous lox callable>"
+    return str(value)
+
+
+def error(line: int, message: str) -> RuntimeError:
+    return RuntimeError(Token(TokenType.IDENTIFIER, "", None, line), message)
+
+
+def break_out(line: int) -> BreakException:
+    return BreakException(Token(TokenType.IDENTIFIER, "", None, line))
+
+
+def undefined(name: str, line: int):
+    raise error(line, f"Undefined variable {name}.")
+
+
+def assign_global(namespace: Dict[str, Any], name: str, line: int, value: Any) -> Any:
+    if name + "_g" not in namespace:
+        raise error(line, f"Undefined variable '{name}'.")
+    namespace[name + "_g"] = value
+    return value
+
+
+def not_numbers(line: int):
+    raise error(line, "Operand must be a number.")
+
+
+def add(a: Any, b: Any, line: int):
+    """`+` for everything but two numbers, which generated code handles inline."""
+    if a.__class__ is str and b.__class__ is str:
+        return a + b
+    if a.__class__ is str or b.__class__ is str:
+        return stringify(a) + stringify(b)
+    raise error(line, "Operands must be two numbers or two strings")
+
+
+def call(callee: Any, line: int, count: int):
+    """
+    For callees that are not a Lox function taking `count` arguments:
+    returns what to apply the arguments to. Errors are raised only then,
+    since the arguments are evaluated before the callee is checked.
+    """
+    if callee.__class__ is FunctionType:
+        arity = callee.__code__.co_argcount
+    elif isinstance(callee, LoxCallable):
+        arity = callee.arity()
+    else:
+        def not_callable(*arguments):
+            raise error(line, "Can only call functions.")
+        return not_callable
+    if count != arity:
+        def wrong_arity(*arguments):
+            raise error(line, f"Expected {arity} args, instead got {count}")
+        return wrong_arity
+    return lambda *arguments: callee.call(None, list(arguments))
+
+
+def assign_box(box: List[Any], value: Any) -> Any:
+    box[0] = value
+    return value
+
+
+RUNTIME = ("BreakException", "FunctionType", "add", "assign_box", "assign_global", "break_out", "call", "error",
+           "not_numbers", "stringify", "undefined")
+
+
+# code generation
+
+ARITHMETIC = {
+    TokenType.MINUS:         "-",
+    TokenType.SLASH:         "/",
+    TokenType.STAR:          "*",
+    TokenType.GREATER:       ">",
+    TokenType.GREATER_EQUAL: ">=",
+    TokenType.LESS:          "<",
+    TokenType.LESS_EQUAL:    "<=",
+}
+COMPARISONS = {TokenType.GREATER, TokenType.GREATER_EQUAL, TokenType.LESS, TokenType.LESS_EQUAL,
+               TokenType.EQUAL_EQUAL, TokenType.BANG_EQUAL}
+# expressions nested this deep are computed by a statement of their own:
+# Python can't compile them nested much deeper
+SPILL_HEIGHT = 32
+TEMPORARY = re.compile(r"_t\d+")
+
+
+def is_bool(expr: Expr) -> bool:
+    """True if `expr` always evaluates to a bool, so Python truthiness is Lox truthiness."""
+    if isinstance(expr, Grouping):
+        return is_bool(expr.expression)
+    if isinstance(expr, Literal):
+        return expr.value is True or expr.value is False
+    if isinstance(expr, Unary):
+        return expr.operator.type == TokenType.BANG
+    if isinstance(expr, Binary):
+        return expr.operator.type in COMPARISONS
+    if isinstance(expr, Logical):
+        return is_bool(expr.left) and is_bool(expr.right)
+    return False
+
+
+class Transpiler:
+    """Second pass: writes the module, one visit_* per node, with expressions returned as strings."""
+    def __init__(self, natives: Iterable[str] = ()):
+        self.analyzer = Analyzer()
+        self.lines: List[str] = []
+        self.indent = ""
+        self.count = 0
+        # how deeply nested the code of the expression being generated is
+        self.height = 0
+        self.functions: List[Optional[FunctionStatement]] = [None]
+        # loops around the current position, per function
+        self.loops = [0]
+        # globals that are certainly defined by the time the code being
+        # generated runs: natives and unconditional top-level declarations
+        self.defined = {name + "_g" for name in natives}
+        self.wrap_breaks = False
+
+    def transpile(self, statements: Iterable[Stmt]) -> str:
+        statements = list(statements)
+        self.analyzer.analyze(statements)
+        self.wrap_breaks = bool(self.analyzer.nonlocal_breaks)
+        main = self.analyzer.frames[0]
+
+        self.lines.append(HEADER)
+        self.lines.append(f"from transpiler import {', '.join(RUNTIME)}")
+        self.lines.append("G = globals()")
+        self.lines.append("")
+        self.lines.append("def main():")
+        self.indent = "    "
+        if main.globals:
+            self.emit(f"global {', '.join(main.globals)}")
+        for statement in statements:
+            try:
+                self.statement(statement)
+            except RecursionError:
+                # generating code takes more frames for each nested expression than resolving it
+                raise ParserException(first_token(statement), "Expression nested too deeply.") from None
+            if isinstance(statement, Var):
+                self.defined.add(statement.name.lexeme + "_g")
+            elif isinstance(statement, Expression) and isinstance(statement.expression, FunctionStatement) \
+                    and statement.expression.name is not None:
+                self.defined.add(statement.expression.name.lexeme + "_g")
+        self.emit("pass")
+        self.indent = ""
+        self.lines.append("")
+        self.lines.append("main()")
+        return "\n".join(self.lines) + "\n"
+
+    def emit(self, line: str):
+        self.lines.append(self.indent + line)
+
+    def temporary(self) -> str:
+        self.count += 1
+        return f"_t{self.count}"
+
+    def take(self, start: int) -> List[str]:
+        """Remove the lines emitted since `start` and return them."""
+        lines = self.lines[start:]
+        del self.lines[start:]
+        return lines
+
+    def statement(self, stmt: Optional[Stmt]):
+        if stmt is not None:
+            stmt.accept(self)
+
+    def suite(self, *statements: Optional[Stmt], scope: Optional[Stmt] = None):
+        """Emit an indented suite. Blocks need no Python scope since every local has its own name."""
+        self.indent += "    "
+        start = len(self.lines)
+        if scope is not None:
+            self.reset(scope)
+        for statement in statements:
+            self.statement(statement)
+        if len(self.lines) == start:
+            self.emit("pass")
+        self.indent = self.indent[:-4]
+
+    def loop(self, condition: str, prelude: List[str], *statements: Optional[Stmt], scope: Optional[Stmt] = None):
+        """Emit a while loop; `prelude` holds the statements `condition` needs, run before every test."""
+        if prelude:
+            self.emit("while True:")
+            self.lines.extend("    " + line for line in prelude)
+            self.emit(f"    if not ({condition}):")
+            self.emit("        break")
+        else:
+            self.emit(f"while {condition}:")
+        self.loops[-1] += 1
+        if not self.wrap_breaks:
+            self.suite(*statements, scope=scope)
+        else:
+            # a function called from this loop may break out of it
+            self.indent += "    "
+            self.emit("try:")
+            self.suite(*statements, scope=scope)
+            self.emit("except BreakException:")
+            self.emit("    break")
+            self.indent = self.indent[:-4]
+        self.loops[-1] -= 1
+
+    def reset(self, scope: Stmt):
+        for decl in self.analyzer.resets.get(id(scope), ()):
+            self.emit(f"{decl.py_name} = [None]" if decl.boxed else f"{decl.py_name} = None")
+
+    def condition(self, expr: Expr) -> str:
+        code = self.expression(expr)
+        if is_bool(expr):
+            return code
+        t = self.temporary()
+        return f"(({t} := {code}) is not None and {t} is not False)"
+
+    # statements
+
+    def visit_expression(self, stmt: Expression):
+        if isinstance(stmt.expression, FunctionStatement):
+            self.declaration(stmt.expression)
+        else:
+            self.emit(self.expression(stmt.expression))
+
+    def visit_print(self, stmt: Print):
+        self.emit(f"print(stringify({self.expression(stmt.expression)}))")
+
+    def visit_var(self, stmt: Var):
+        value = "None" if stmt.initializer is None else self.expression(stmt.initializer)
+        decl = self.analyzer.decls.get(id(stmt.name))
+        if decl is None:
+            self.emit(f"{stmt.name.lexeme}_g = {value}")
+        elif decl.boxed:
+            self.emit(f"{decl.py_name} = [{value}]")
+        else:
+            self.emit(f"{decl.py_name} = {value}")
+
+    def visit_block(self, stmt: Block):
+        self.reset(stmt)
+        for statement in stmt.statements:
+            self.statement(statement)
+
+    def visit_if(self, stmt: If):
+        self.emit(f"if {self.condition(stmt.condition)}:")
+        self.suite(stmt.then_branch)
+        if stmt.else_branch is not None:
+            self.emit("else:")
+            self.suite(stmt.else_branch)
+
+    def visit_while(self, stmt: While):
+        start = len(self.lines)
+        condition = self.condition(stmt.condition)
+        self.loop(condition, self.take(start), stmt.loop_body, scope=stmt)
+
+    def visit_for(self, stmt: For):
+        self.reset(stmt)
+        self.statement(stmt.initialization)
+        start = len(self.lines)
+        condition = "True" if stmt.condition is None else self.condition(stmt.condition)
+        update = None if stmt.update is None else Expression(stmt.update)
+        self.loop(condition, self.take(start), stmt.body, update)
+
+    def visit_break(self, stmt: Break):
+        if id(stmt) in self.analyzer.nonlocal_breaks:
+            self.emit(f"raise break_out({stmt.token.line})")
+        elif self.loops[-1]:
+            self.emit("break")
+        else:
+            self.emit(f"raise error({stmt.token.line}, 'Break not inside loop.')")
+
+    def visit_return(self, stmt: Return):
+        if self.functions[-1] is None:
+            self.emit(f"raise error({stmt.token.line}, 'Return not inside function.')")
+        else:
+            self.emit(f"return {self.expression(stmt.return_expr)}")
+
+    def declaration(self, stmt: FunctionStatement):
+        """A function in statement position: the def statement itself binds the name."""
+        decl = None if stmt.name is None else self.analyzer.decls.get(id(stmt.name))
+        if stmt.name is None:
+            self.count += 1
+            self.function(stmt, f"_{self.count}")
+        elif decl is None:
+            self.function(stmt, f"{stmt.name.lexeme}_g")
+        elif decl.boxed:
+            # the box must exist before the def captures it
+            self.emit(f"{decl.py_name} = [None]")
+            self.function(stmt, f"{decl.py_name}f")
+            self.emit(f"{decl.py_name}[0] = {decl.py_name}f")
+        else:
+            self.function(stmt, decl.py_name)
+
+    def function(self, stmt: FunctionStatement, name: str):
+        frame = self.analyzer.function_frames[id(stmt)]
+        parameters = [self.analyzer.decls[id(parameter)].py_name for parameter in stmt.parameters]
+        # boxes are bound when the def runs, so every closure keeps its own
+        boxes = [f"{free.py_name}={free.py_name}" for free in frame.free if free.boxed]
+        if boxes:
+            parameters += ["*"] + boxes
+        self.emit(f"def {name}({', '.join(parameters)}):")
+        # the body can only run once a global function's name is bound
+        own_name = None
+        if stmt.name is not None and id(stmt.name) not in self.analyzer.decls \
+                and stmt.name.lexeme + "_g" not in self.defined:
+            own_name = stmt.name.lexeme + "_g"
+            self.defined.add(own_name)
+        self.functions.append(stmt)
+        self.loops.append(0)
+        height, self.height = self.height, 0
+        self.indent += "    "
+        if frame.globals:
+            self.emit(f"global {', '.join(frame.globals)}")
+        nonlocals = [assigned.py_name for assigned in frame.assigned if not assigned.boxed]
+        if nonlocals:
+            self.emit(f"nonlocal {', '.join(nonlocals)}")
+        self.indent = self.indent[:-4]
+        self.suite(stmt.body, scope=stmt)
+        self.height = height
+        self.loops.pop()
+        self.functions.pop()
+        self.defined.discard(own_name)
+
+    # expressions
+
+    def expression(self, expr: Expr) -> str:
+        outer, self.height = self.height, 0
+        code = expr.accept(self)
+        height = self.height + 1
+        if height >= SPILL_HEIGHT:
+            t = self.temporary()
+            self.emit(f"{t} = {code}")
+            code, height = t, 1
+        self.height = max(outer, height)
+        return code
+
+    def operands(self, *exprs: Expr) -> List[str]:
+        """The code of each of `exprs`, evaluated in order even when a later one emits statements."""
+        codes: List[str] = []
+        for expr in exprs:
+            start = len(self.lines)
+            code = self.expression(expr)
+            if len(self.lines) > start:
+                # the statements run before the whole expression, so the
+                # operands before `expr` are computed ahead of them
+                for index, earlier in enumerate(codes):
+                    if not isinstance(exprs[index], Literal) and not TEMPORARY.fullmatch(earlier):
+                        t = self.temporary()
+                        self.lines.insert(start, f"{self.indent}{t} = {earlier}")
+                        start += 1
+                        codes[index] = t
+            codes.append(code)
+        return codes
+
+    def visit_function_statement(self, expr: FunctionStatement):
+        # a function in expression position: the def goes before the
+        # statement, and the expression binds its name, if any, and gives nil
+        self.count += 1
+        if expr.name is None:
+            name = f"_{self.count}"
+            self.function(expr, name)
+            return name
+        name = f"{expr.name.lexeme}_{self.count}e"
+        self.function(expr, name)
+        decl = self.analyzer.decls.get(id(expr.name))
+        if decl is None:
+            return f"(({expr.name.lexeme}_g := {name}) and None)"
+        if decl.boxed:
+            return f"(assign_box({decl.py_name}, {name}) and None)"
+        return f"(({decl.py_name} := {name}) and None)"
+
+    def visit_literal(self, expr: Literal):
+        if expr.value.__class__ is float and not expr.value - expr.value == 0:
+            return f"float({str(expr.value)!r})"
+        return repr(expr.value)
+
+    def visit_grouping(self, expr: Grouping):
+        return f"({self.expression(expr.expression)})"
+
+    def visit_variable(self, expr: Variable):
+        decl = self.analyzer.references.get(id(expr))
+        if decl is not None:
+            return f"{decl.py_name}[0]" if decl.boxed else decl.py_name
+        name = expr.name.lexeme + "_g"
+        if name in self.defined:
+            return name
+        return f"({name} if {name!r} in G else undefined({expr.name.lexeme!r}, {expr.name.line}))"
+
+    def visit_assign(self, expr: Assign):
+        value = self.expression(expr.value)
+        decl = self.analyzer.references.get(id(expr))
+        if decl is not None:
+            if decl.boxed:
+                return f"assign_box({decl.py_name}, {value})"
+            return f"({decl.py_name} := {value})"
+        name = expr.name.lexeme + "_g"
+        if name in self.defined:
+            return f"({name} := {value})"
+        return f"assign_global(G, {expr.name.lexeme!r}, {expr.name.line}, {value})"
+
+    def visit_logical(self, expr: Logical):
+        left = self.expression(expr.left)
+        start = len(self.lines)
+        right = self.expression(expr.right)
+        if len(self.lines) > start:
+            # the statements the right operand needs may only run when it is evaluated
+            prelude, t = self.take(start), self.temporary()
+            self.emit(f"{t} = {left}")
+            truthy = f"{t} is not None and {t} is not False"
+            self.emit(f"if not ({truthy}):" if expr.operator.type == TokenType.OR else f"if {truthy}:")
+            self.lines.extend("    " + line for line in prelude)
+            self.emit(f"    {t} = {right}")
+            return t
+        if is_bool(expr.left):
+            return f"({left} {'or' if expr.operator.type == TokenType.OR else 'and'} {right})"
+        t = self.temporary()
+        if expr.operator.type == TokenType.OR:
+            return f"({t} if ({t} := {left}) is not None and {t} is not False else {right})"
+        return f"({right} if ({t} := {left}) is not None and {t} is not False else {t})"
+
+    def visit_unary(self, expr: Unary):
+        right = self.expression(expr.right)
+        if expr.operator.type == TokenType.BANG:
+            if is_bool(expr.right):
+                return f"(not {right})"
+            t = self.temporary()
+            return f"(({t} := {right}) is None or {t} is False)"
+        t = self.temporary()
+        return f"(-{t} if ({t} := {right}).__class__ is float else not_numbers({expr.operator.line}))"
+
+    def visit_binary(self, expr: Binary):
+        left, right = self.operands(expr.left, expr.right)
+        operator = expr.operator
+        if operator.type == TokenType.EQUAL_EQUAL:
+            # Python's == already treats nil like Lox does
+            return f"({left} == {right})"
+        if operator.type == TokenType.BANG_EQUAL:
+            return f"({left} != {right})"
+        a, b = self.temporary(), self.temporary()
+        test = f"({a} := {left}).__class__ is ({b} := {right}).__class__ is float"
+        if operator.type == TokenType.PLUS:
+            return f"({a} + {b} if {test} else add({a}, {b}, {operator.line}))"
+        return f"({a} {ARITHMETIC[operator.type]} {b} if {test} else not_numbers({operator.line}))"
+
+    def visit_call(self, expr: Call):
+        callee, *arguments = self.operands(expr.callee, *expr.arguments)
+        arguments = ", ".join(arguments)
+        count, t = len(expr.arguments), self.temporary()
+        return (f"({t} if ({t} := {callee}).__class__ is FunctionType and {t}.__code__.co_argcount == {count} "
+                f"else call({t}, {expr.paren.line}, {count}))({arguments})")
+
+
+class PythonBackend:
+    """Backend for Lox.run: transpiles the program and executes the module."""
+    def __init__(self):
+        self.globals = Environment()
+        self.globals.define("clock", Clock())
+
+    def compile(self, statements: Iterable[Stmt]) -> str:
+        return Transpiler(self.globals.values).transpile(statements)
+
+    def execute(self, module: str, filename: str = "<lox>"):
+        namespace = {"__name__": "__lox__"}
+        namespace.update((name + "_g", value) for name, value in self.globals.values.items())
+        code = compile(module, filename, "exec")
+        # every Lox call is one Python frame, so the recursion limit stands
+        # in for a count of them: the frames below, the module's and main()'s
+        # come first
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(stack_depth() + 2 + FRAMES_MAX + HELPER_FRAMES)
+        try:
+            exec(code, namespace)
+        except BreakException as escaped:
+            # no loop was running when the function with the break was called
+            raise RuntimeError(escaped.token, "Break not inside loop.") from None
+        except RecursionError as overflow:
+            raise error(overflow_line(overflow, module, filename), "Stack overflow.") from None
+        finally:
+            sys.setrecursionlimit(limit)
+
+    def interpret(self, statements: Iterable[Stmt]):
+        self.execute(self.compile(statements))
+
+
+def stack_depth() -> int:
+    depth, frame = 0, sys._getframe()
+    while frame is not None:
+        depth, frame = depth + 1, frame.f_back
+    return depth
+
+
+def overflow_line(overflow: RecursionError, module: str, filename: str) -> int:
+    """The line of the Lox call that went past the limit: the last call on the innermost generated line with one."""
+    lines = module.splitlines()
+    for frame, line in reversed(list(walk_tb(overflow.__traceback__))):
+        if frame.f_code.co_filename == filename:
+            calls = CALL_LINE.findall(lines[line - 1])
+            if calls:
+                return int(calls[-1])
+    return 0
+
+
+def cache_path(cache: Path) -> Path:
+    return cache.with_name(cache.name + SUFFIX)
+
+
+def source_stamp(source: str) -> str:
+    return f"# Source digest {source_digest(source).hex()}\n"
+
+
+def load(cache: Path, source: str) -> Optional[str]:
+    """Return the cached module for `source`, or None if there is no valid entry."""
+    try:
+        text = cache_path(cache).read_text(encoding="utf-8")
+    except (OSError, UnicodeDecodeError):
+        return None
+    stamp = source_stamp(source)
+    if not text.startswith(stamp):
+        return None
+    module = text[len(stamp):]
+    return module if module.startswith(HEADER) else None
+
+
+def store(cache: Path, source: str, module: str):
+    path = cache_path(cache)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        temporary.write_text(source_stamp(source) + module, encoding="utf-8")
+        os.replace(temporary, path)
+    except OSError:
+        pass
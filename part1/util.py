@@ -1,6 +1,8 @@
 from typing import Any
 from enum import Enum, auto
 
+INTERPRETER_VERSION = "0.1.0"
+
 
 class TokenType(Enum):
     # Single character tokens
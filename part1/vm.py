@@ -0,0 +1,350 @@
+"""
+Stack VM for bytecode.Function code, after clox's vm.c. One dispatch loop
+runs the whole program: calls push the caller's registers onto a list of
+frames instead of recursing in Python. Produces the same output and runtime
+errors as interpreter.Interpreter.
+
+Since the whole state of a running program is in the VM, it can stop at a
+loop's back-edge or a call and carry on later: resume() runs until a
+deadline or a call to sleep(), which is what scheduler.Scheduler builds on.
+"""
+
+import time
+from math import inf
+from typing import Any, Iterable, List, Optional
+from Stmt import Stmt
+from bytecode_compiler import BytecodeCompiler
+from bytecode import (
+    ADD, BOX_LOCAL, BREAK_OUT, CALL, CLOSURE, CONSTANT, DEFINE_GLOBAL, DIVIDE, EQUAL, ERROR, FALSE,
+    GET_CELL, GET_GLOBAL, GET_LOCAL, GET_UPVALUE, GREATER, GREATER_EQUAL, JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE,
+    LESS, LESS_EQUAL, LOOP, LOOP_POP, LOOP_SETUP, MAKE_CELL, MULTIPLY, NEGATE, NIL, NOT, NOT_EQUAL, POP,
+    POP_JUMP_IF_FALSE, PRINT, RETURN, SET_CELL, SET_GLOBAL, SET_LOCAL, SET_UPVALUE, STORE_CELL, STORE_LOCAL,
+    SUBTRACT, TRUE, Function,
+)
+from environment import Environment
+from interpreter import Clock, LoxCallable
+from runtime_error import RuntimeError
+from util import Token, TokenType
+
+FRAMES_MAX = 1000
+# back-edges and calls between looks at the clock
+CHECK_INTERVAL = 64
+
+
+def stringify(value: Any) -> str:
+    if value is None: return "nil"
+    if value.__class__ is float and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+class Closure:
+    __slots__ = ("function", "cells")
+
+    def __init__(self, function: Function, cells: List[List[Any]]):
+        self.function = function
+        self.cells = cells
+
+    def __repr__(self):
+        return repr(self.function)
+
+
+class Sleep(LoxCallable):
+    """sleep(seconds): stops the script for a while, letting others run."""
+    def arity(self):
+        return 1
+
+    def call(self, vm, arguments):
+        seconds = arguments[0]
+        if seconds.__class__ is not float:
+            raise VMError("Operand must be a number.")
+        vm.wake_at = time.monotonic() + seconds
+        return None
+
+    def __repr__(self):
+        return "<native fn>"
+
+
+class VMError(Exception):
+    """A runtime error raised by the dispatch loop, which adds the line."""
+    def __init__(self, message: str):
+        self.message = message
+
+
+class VM:
+    def __init__(self):
+        self.globals = Environment()
+        self.globals.define("clock", Clock())
+        self.globals.define("sleep", Sleep())
+        # registers of a started program, saved while it is not running
+        self.state: Optional[tuple] = None
+        # set by sleep() to when the script wants to run again
+        self.wake_at: Optional[float] = None
+
+    def compile(self, statements: Iterable[Stmt]) -> Function:
+        return BytecodeCompiler().compile(statements)
+
+    def interpret(self, statements: Iterable[Stmt]):
+        self.execute(self.compile(statements))
+
+    def execute(self, script: Function):
+        self.load(script)
+        self.start(Closure(script, []))
+        while (wake := self.resume()) is not None:
+            time.sleep(max(0.0, wake - time.monotonic()))
+
+    def load(self, function: Function):
+        function.ops = function.code.tolist()
+        for constant in function.constants:
+            if constant.__class__ is Function:
+                self.load(constant)
+
+    def start(self, closure: Closure):
+        """Get ready to run `closure`, a loaded script, from its first instruction."""
+        # the stack, the caller's registers for every call in progress, and
+        # the registers: function, cells, slots, break handlers and ip
+        self.state = ([], [], closure.function, closure.cells, list(closure.function.padding), None, 0)
+
+    def resume(self, deadline: float = inf) -> Optional[float]:
+        """
+        Run the started script until it ends, returning None, or until it
+        stops at a back-edge or call after `deadline` or calls sleep(); then
+        return the time.monotonic() time to resume it at.
+        """
+        globals = self.globals.values
+        stack, frames, function, cells, slots, handlers, ip = self.state
+        push, pop = stack.append, stack.pop
+        code, constants = function.ops, function.constants
+        budget = CHECK_INTERVAL
+        try:
+            while True:
+                op = code[ip]
+                ip += 1
+                if op == GET_LOCAL:
+                    push(slots[code[ip]])
+                    ip += 1
+                elif op == CONSTANT:
+                    push(constants[code[ip] << 8 | code[ip + 1]])
+                    ip += 2
+                elif op == ADD:
+                    b = pop()
+                    a = stack[-1]
+                    if a.__class__ is float and b.__class__ is float:
+                        stack[-1] = a + b
+                    elif a.__class__ is str and b.__class__ is str:
+                        stack[-1] = a + b
+                    elif a.__class__ is str or b.__class__ is str:
+                        stack[-1] = stringify(a) + stringify(b)
+                    else:
+                        raise VMError("Operands must be two numbers or two strings")
+                elif op == POP_JUMP_IF_FALSE:
+                    value = pop()
+                    if value is None or value is False:
+                        ip += code[ip] << 8 | code[ip + 1]
+                    ip += 2
+                elif op == LESS:
+                    b = pop()
+                    a = stack[-1]
+                    if a.__class__ is not float or b.__class__ is not float:
+                        raise VMError("Operand must be a number.")
+                    stack[-1] = a < b
+                elif op == SUBTRACT:
+                    b = pop()
+                    a = stack[-1]
+                    if a.__class__ is not float or b.__class__ is not float:
+                        raise VMError("Operand must be a number.")
+                    stack[-1] = a - b
+                elif op == STORE_LOCAL:
+                    slots[code[ip]] = pop()
+                    ip += 1
+                elif op == GET_GLOBAL:
+                    name = constants[code[ip] << 8 | code[ip + 1]]
+                    ip += 2
+                    try:
+                        push(globals[name])
+                    except KeyError:
+                        raise VMError(f"Undefined variable {name}.") from None
+                elif op == CALL:
+                    count = code[ip]
+                    ip += 1
+                    callee = stack[-1 - count]
+                    if callee.__class__ is Closure:
+                        target = callee.function
+                        if count != target.arity:
+                            raise VMError(f"Expected {target.arity} args, instead got {count}")
+                        if len(frames) == FRAMES_MAX:
+                            raise VMError("Stack overflow.")
+                        frames.append((function, code, constants, cells, slots, handlers, ip))
+                        base = len(stack) - count
+                        slots = stack[base:]
+                        del stack[base - 1:]
+                        slots += target.padding
+                        function, code, constants, cells = target, target.ops, target.constants, callee.cells
+                        handlers = None
+                        ip = 0
+                        budget -= 1
+                        if not budget:
+                            budget = CHECK_INTERVAL
+                            if (now := time.monotonic()) >= deadline:
+                                self.state = (stack, frames, function, cells, slots, handlers, ip)
+                                return now
+                    elif isinstance(callee, LoxCallable):
+                        if count != (arity := callee.arity()):
+                            raise VMError(f"Expected {arity} args, instead got {count}")
+                        base = len(stack) - count
+                        arguments = stack[base:]
+                        del stack[base - 1:]
+                        push(callee.call(self, arguments))
+                        if self.wake_at is not None:
+                            wake, self.wake_at = self.wake_at, None
+                            self.state = (stack, frames, function, cells, slots, handlers, ip)
+                            return wake
+                    else:
+                        raise VMError("Can only call functions.")
+                elif op == RETURN:
+                    if not frames:
+                        self.state = None
+                        return None
+                    function, code, constants, cells, slots, handlers, ip = frames.pop()
+                elif op == LOOP:
+                    ip -= (code[ip] << 8 | code[ip + 1]) - 2
+                    budget -= 1
+                    if not budget:
+                        budget = CHECK_INTERVAL
+                        if (now := time.monotonic()) >= deadline:
+                            self.state = (stack, frames, function, cells, slots, handlers, ip)
+                            return now
+                elif op == POP:
+                    pop()
+                elif op == SET_LOCAL:
+                    slots[code[ip]] = stack[-1]
+                    ip += 1
+                elif op == MULTIPLY:
+                    b = pop()
+                    a = stack[-1]
+                    if a.__class__ is not float or b.__class__ is not float:
+                        raise VMError("Operand must be a number.")
+                    stack[-1] = a * b
+                elif op == GREATER:
+                    b = pop()
+                    a = stack[-1]
+                    if a.__class__ is not float or b.__class__ is not float:
+                        raise VMError("Operand must be a number.")
+                    stack[-1] = a > b
+                elif op == SET_GLOBAL:
+                    name = constants[code[ip] << 8 | code[ip + 1]]
+                    ip += 2
+                    if name not in globals:
+                        raise VMError(f"Undefined variable '{name}'.")
+                    globals[name] = stack[-1]
+                elif op == JUMP:
+                    ip += (code[ip] << 8 | code[ip + 1]) + 2
+                elif op == GET_CELL:
+                    push(slots[code[ip]][0])
+                    ip += 1
+                elif op == GET_UPVALUE:
+                    push(cells[code[ip]][0])
+                    ip += 1
+                elif op == LESS_EQUAL:
+                    b = pop()
+                    a = stack[-1]
+                    if a.__class__ is not float or b.__class__ is not float:
+                        raise VMError("Operand must be a number.")
+                    stack[-1] = a <= b
+                elif op == GREATER_EQUAL:
+                    b = pop()
+                    a = stack[-1]
+                    if a.__class__ is not float or b.__class__ is not float:
+                        raise VMError("Operand must be a number.")
+                    stack[-1] = a >= b
+                elif op == DIVIDE:
+                    b = pop()
+                    a = stack[-1]
+                    if a.__class__ is not float or b.__class__ is not float:
+                        raise VMError("Operand must be a number.")
+                    stack[-1] = a / b
+                elif op == EQUAL:
+                    b = pop()
+                    stack[-1] = stack[-1] == b
+                elif op == NOT_EQUAL:
+                    b = pop()
+                    stack[-1] = stack[-1] != b
+                elif op == NOT:
+                    value = stack[-1]
+                    stack[-1] = value is None or value is False
+                elif op == NEGATE:
+                    value = stack[-1]
+                    if value.__class__ is not float:
+                        raise VMError("Operand must be a number.")
+                    stack[-1] = -value
+                elif op == JUMP_IF_FALSE:
+                    value = stack[-1]
+                    if value is None or value is False:
+                        ip += code[ip] << 8 | code[ip + 1]
+                    ip += 2
+                elif op == JUMP_IF_TRUE:
+                    value = stack[-1]
+                    if value is not None and value is not False:
+                        ip += code[ip] << 8 | code[ip + 1]
+                    ip += 2
+                elif op == NIL:
+                    push(None)
+                elif op == TRUE:
+                    push(True)
+                elif op == FALSE:
+                    push(False)
+                elif op == PRINT:
+                    print(stringify(pop()))
+                elif op == SET_CELL:
+                    slots[code[ip]][0] = stack[-1]
+                    ip += 1
+                elif op == STORE_CELL:
+                    slots[code[ip]][0] = pop()
+                    ip += 1
+                elif op == SET_UPVALUE:
+                    cells[code[ip]][0] = stack[-1]
+                    ip += 1
+                elif op == MAKE_CELL:
+                    slots[code[ip]] = [None]
+                    ip += 1
+                elif op == BOX_LOCAL:
+                    slot = code[ip]
+                    slots[slot] = [slots[slot]]
+                    ip += 1
+                elif op == DEFINE_GLOBAL:
+                    globals[constants[code[ip] << 8 | code[ip + 1]]] = pop()
+                    ip += 2
+                elif op == CLOSURE:
+                    target = constants[code[ip] << 8 | code[ip + 1]]
+                    ip += 2
+                    captured = []
+                    for _ in range(target.capture_count):
+                        index = code[ip + 1]
+                        captured.append(slots[index] if code[ip] else cells[index])
+                        ip += 2
+                    push(Closure(target, captured))
+                elif op == LOOP_SETUP:
+                    if handlers is None:
+                        handlers = []
+                    ip += 2
+                    handlers.append((ip + (code[ip - 2] << 8 | code[ip - 1]), len(stack)))
+                elif op == LOOP_POP:
+                    handlers.pop()
+                elif op == BREAK_OUT:
+                    # unwind to the loop that made the innermost call still running
+                    if not handlers and not any(frame[5] for frame in frames):
+                        # no loop was running when the function with the break was called
+                        raise VMError("Break not inside loop.")
+                    while not handlers:
+                        function, code, constants, cells, slots, handlers, ip = frames.pop()
+                    ip, height = handlers.pop()
+                    del stack[height:]
+                elif op == ERROR:
+                    ip += 2
+                    raise VMError(constants[code[ip - 2] << 8 | code[ip - 1]])
+                else:
+                    raise VMError(f"Unknown opcode {op}.")
+        except VMError as error:
+            self.state = None
+            token = Token(TokenType.IDENTIFIER, "", None, function.line_at(ip - 1))
+            raise RuntimeError(token, error.message) from None